@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# cinema_batch.py - unpack many BGS pass files, in parallel
+#    - pass files are fanned out over a pool of worker processes
+#    - each pass is written to a deterministic output directory:
+#        <output_directory>/<sc>_<contact_id>/<sc>_<contact_id>_slow_v0_0.txt
+#        <output_directory>/<sc>_<contact_id>/<sc>_<contact_id>_fast_v0_0.txt
+#    - failures are collected (and summarized) rather than halting the batch
+#    - optionally, the packets of each pass are recorded in a packet index
+#        (see cinema_index) as they are unpacked
+#
+#    usage:
+#        python cinema_batch_v0_1_0.py [-j PROCESSES] [-o OUTPUT_DIR] [--overwrite]
+#                [--sc SC] [--index INDEX.db] [--year YEAR] SOURCE [SOURCE ...]
+#        (a SOURCE directory is searched for "BGS.CINEMA.TLM_VC0" pass files)
+#
+#    Version Information:
+#        (beta)
+#        v0.1.0 initial code (adapted from example_script.py)
+#
+
+import argparse
+import multiprocessing
+import os
+import sys
+import traceback
+import cinema_unpack_v0_8_1 as unpack
+import cinema_index_v0_1_0 as packet_index
+import hsk_unpack_v0_8_0 as hsk
+
+pass_prefix = "BGS.CINEMA.TLM_VC0"      # BGS pass files, "BGS.CINEMA.TLM_VC0.<contact_id>[.bin|.gz]"
+
+
+def is_pass_file(filename):
+    """Return True where 'filename' is named as a BGS pass file (not, e.g., a .gzidx index)."""
+    name = os.path.basename(filename)
+    if not name.startswith(pass_prefix + "."):
+        return False
+    suffix = name[len(pass_prefix) + 1:].split('.')[1:]
+    return suffix in ([], ['bin'], ['gz'])
+
+
+def find_pass_files(sources):
+    """Return the (sorted) BGS pass files among 'sources'.
+
+    Arguments:
+    sources -- iterable of pass files, and/or directories to be searched
+               for "BGS.CINEMA.TLM_VC0" pass files
+    """
+    pass_files = []
+    for source in sources:
+        if os.path.isdir(source):
+            pass_files.extend(os.path.join(source, candidate) for candidate in os.listdir(source)
+                    if is_pass_file(candidate))
+        else:
+            pass_files.append(source)
+    return sorted(set(pass_files))
+
+
+def output_paths(filename, output_directory, sc="CIN1"):
+    """Return the output directory and files for the BGS pass file 'filename'.
+
+    Return value:
+    (pass directory, {'SLOW':slow HSK filename, 'FAST':fast HSK filename})
+    """
+    # BGS.CINEMA.TLM_VC0.<contact_id>...
+    contact_id = os.path.basename(filename).split('.')[3]
+    out_path = sc + '_' + contact_id
+    pass_directory = os.path.normpath(os.path.join(output_directory, out_path))
+    return (pass_directory,
+            {'SLOW':os.path.join(pass_directory, out_path + '_slow_v0_0.txt'),
+             'FAST':os.path.join(pass_directory, out_path + '_fast_v0_0.txt')})
+
+
+def unpack_pass(filename, output_directory, sc="CIN1", overwrite=False, index=None, year=None):
+    """Unpack one BGS pass file, writing its HSK SLOW/FAST text files.
+
+    Arguments:
+    filename -- path to a BGS pass file (optionally GZIP compressed)
+    output_directory -- directory, in which a directory for the pass is made
+
+    Keyword arguments:
+    sc -- spacecraft label, used in output names (default "CIN1")
+    overwrite -- Boolean argument; if False (default), a pass whose
+                 output directory exists is skipped
+    index -- path of a packet index database (see cinema_index), in which
+             to record the packets of the pass (default None)
+    year -- year of the pass's packet timestamps (default None, the first
+            year after launch; see cinema_timeops.reconstruct_packettimes)
+
+    Return value:
+    a dictionary describing the outcome: 'filename', 'status' ("processed",
+    "empty", "skipped" or "failed"), 'outputs' (files written), 'packets'
+    (counts per packet list), 'stats' (frame/miss counts) and 'error'
+    """
+    result = {'filename':filename, 'status':None, 'outputs':[], 'packets':None,
+            'stats':None, 'error':None}
+    try:
+        pass_directory, outputs = output_paths(filename, output_directory, sc=sc)
+        if os.path.isdir(pass_directory) and not overwrite:
+            # directory already exists (presume populated)
+            result['status'] = "skipped"
+            return result
+
+        stats = {}
+        if index is None:
+            packet_tuple = unpack.read_raw_hexbytes(filename, verbose=False, stats=stats)
+        else:
+            with packet_index.PacketIndex(index) as packets:
+                packet_tuple = packets.ingest(filename, year=year, stats=stats)
+        result['packets'] = dict(zip(unpack.packet_categories, map(len, packet_tuple)))
+        result['stats'] = {'frames':stats['frames'], 'asm_misses':stats['asm_misses'],
+                'apid_misses':stats['apid_misses'], 'extra_bytes':stats.get('extra_bytes', 0),
+                'skipped_bytes':stats.get('skipped_bytes', 0), 'rs_failed':stats.get('rs_failed', 0)}
+        if (sum(map(len, packet_tuple[0:3])) == 0):
+            result['status'] = "empty"
+            return result
+
+        if not os.path.isdir(pass_directory):
+            os.makedirs(pass_directory)
+        # populate with desired ASCII files
+        if len(packet_tuple[1]) > 0:        # recorded HSK
+            data = packet_tuple[1]
+            for hsk_type in ("SLOW", "FAST"):
+                hsk.save_data_as(data, type=hsk_type, filename=outputs[hsk_type], overwrite=True,
+                        year=year)
+                result['outputs'].append(outputs[hsk_type])
+        result['status'] = "processed"
+    except Exception:
+        # keep going: record the failure for the summary
+        result['status'] = "failed"
+        result['error'] = traceback.format_exc()
+    return result
+
+
+def _unpack_pass_star(args):
+    # (Pool.imap passes a single argument)
+    return unpack_pass(*args)
+
+
+def unpack_passes(filenames, output_directory, processes=None, sc="CIN1", overwrite=False,
+        callback=None, index=None, year=None):
+    """Unpack many BGS pass files over a pool of worker processes.
+
+    Arguments:
+    filenames -- iterable of BGS pass files
+    output_directory -- directory, in which a directory per pass is made
+
+    Keyword arguments:
+    processes -- number of worker processes (default None, one per CPU);
+                 1 unpacks every pass in this process
+    sc -- spacecraft label, used in output names (default "CIN1")
+    overwrite -- Boolean argument, as for unpack_pass() (default False)
+    callback -- function called with each result as it completes (default None)
+    index -- path of a packet index database, as for unpack_pass() (default None)
+    year -- year of the passes' packet timestamps, as for unpack_pass()
+            (default None)
+
+    Return value:
+    list of unpack_pass() results, in 'filenames' order
+    """
+    jobs = [(filename, output_directory, sc, overwrite, index, year) for filename in filenames]
+    results = []
+    if (processes == 1) or (len(jobs) <= 1):
+        for job in jobs:
+            results.append(_unpack_pass_star(job))
+            if callback is not None:
+                callback(results[-1])
+        return results
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # (imap returns results in job order, whatever order they finish in)
+        for result in pool.imap(_unpack_pass_star, jobs, chunksize=1):
+            results.append(result)
+            if callback is not None:
+                callback(result)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def summarize(results):
+    """Return a text summary of unpack_passes() results, listing any failures."""
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    lines = ["{0} pass files: {1}".format(len(results), ", ".join(
+        "{0} {1}".format(counts[status], status) for status in sorted(counts)))]
+    for result in results:
+        if result['status'] == "failed":
+            lines.append("FAILED: " + result['filename'])
+            lines.append("    " + result['error'].strip().split("\n")[-1])
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Unpack CINEMA BGS pass files, in parallel.")
+    parser.add_argument('sources', nargs='+',
+            help="pass files, or directories of \"" + pass_prefix + "\" pass files")
+    parser.add_argument('-o', '--output-directory', default="cinema_unpacked_data/",
+            help="output directory (default: %(default)s)")
+    parser.add_argument('-j', '--processes', type=int, default=None,
+            help="number of worker processes (default: one per CPU)")
+    parser.add_argument('--sc', default="CIN1", help="spacecraft label (default: %(default)s)")
+    parser.add_argument('--overwrite', action='store_true',
+            help="re-process passes whose output directory already exists")
+    parser.add_argument('--index', default=None,
+            help="packet index database, in which to record the packets of each pass")
+    parser.add_argument('--year', type=int, default=None,
+            help="year of the passes' packet timestamps (default: the first year after launch)")
+    args = parser.parse_args(argv)
+
+    def report(result):
+        print(result['filename'] + " (" + result['status'] + ")")
+        sys.stdout.flush()
+
+    results = unpack_passes(find_pass_files(args.sources), args.output_directory,
+            processes=args.processes, sc=args.sc, overwrite=args.overwrite, callback=report,
+            index=args.index, year=args.year)
+    print(summarize(results))
+    if any(result['status'] == "failed" for result in results):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
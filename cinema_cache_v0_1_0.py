@@ -0,0 +1,390 @@
+# cinema_cache.py - on-disk cache of decoded BGS pass files
+#    - the packets (and frame/miss stats) of a decoded pass are stored
+#        under a content-addressed key: the SHA1 hash of the pass file,
+#        the decoder version and the decoding options
+#    - the decoder version is the SHA1 hash of the source of the decoding
+#        modules, so entries are invalidated whenever a decoder changes
+#    - packets are stored column-wise, one .npy file per field of each
+#        packet type; on a hit the arrays are memory-mapped, and each
+#        packet's array fields are views of a row of the mapped file
+#    - list views of array fields (e.g. 'stein_data') are not stored,
+#        but rebuilt on first access (see cinema_packet)
+#    - the cache is bounded in size; the least recently used entries are
+#        evicted once it grows beyond 'max_bytes'
+#    - pass file hashes are remembered by (path, size, mtime), so a repeat
+#        load does not re-read the pass file
+#
+#    Version Information:
+#        (beta)
+#        v0.1.0 initial code
+#
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import cinema_unpack_v0_8_1 as unpack
+import cinema_gzindex_v0_1_0 as gzindex
+import cinema_rscode_v0_1_0 as rscode
+import cinema_packet_v0_1_0 as packet_record
+import cinema_provenance_v0_1_0 as provenance
+import stein_unpack_v0_8_0 as stein
+import magic_unpack_v0_8_0 as magic
+import hsk_unpack_v0_8_0 as hsk
+
+cache_format = 1                    # layout of a cache entry
+default_max_bytes = 4 << 30         # 4 GiB
+manifest_name = "manifest.json"
+hashes_name = "hashes.json"
+
+# modules whose source determines the decoded packets (and this layout)
+decoder_modules = (unpack, gzindex, rscode, packet_record, provenance, stein, magic, hsk)
+record_classes = dict((cls.__name__, cls) for cls in
+        (hsk.HskPacket, stein.SteinPacket, magic.MagicPacket))
+raw_fields = ('tf_header', 'packet')    # of (tf_header, packet) tuples: overflow, other
+
+_decoder_version = None
+
+
+class Uncacheable(ValueError):
+    """Raised where a packet field cannot be stored column-wise."""
+    pass
+
+
+def decoder_version():
+    """Return the SHA1 hex digest of the source of the decoder modules (and of this module)."""
+    global _decoder_version
+    if _decoder_version is None:
+        hasher = hashlib.sha1()
+        for module_file in [module.__file__ for module in decoder_modules] + [__file__]:
+            source = os.path.splitext(module_file)[0] + '.py'
+            with open(source,'rb') as f:
+                hasher.update(f.read())
+        _decoder_version = hasher.hexdigest()
+    return _decoder_version
+
+
+def _encode_field(values, name, view=False):
+    # (encoding, array or None, JSON value or None) of one field of a group
+    if all(value is None for value in values):
+        return ('none', None, None)
+    if view:
+        # rebuilt from its source field on first access
+        return ('view', None, None)
+    first = values[0]
+    if all(isinstance(value, provenance.Provenance) for value in values):
+        if any(value is not first for value in values) or not first.sealed:
+            raise Uncacheable(name)
+        date = first.extraction_date
+        return ('provenance', None, [first.source_file_hash, list(date.timetuple()[:6]) + [date.microsecond]])
+    if all(isinstance(value, (np.ndarray, np.void)) for value in values):
+        dtype, shape = first.dtype, np.shape(first)
+        if dtype.hasobject or any((value.dtype != dtype) or (np.shape(value) != shape) for value in values):
+            raise Uncacheable(name)
+        column = np.empty((len(values),) + shape, dtype=dtype)
+        for i, value in enumerate(values):
+            column[i] = value
+        return ('array', column, None)
+    if all((type(value) is tuple) and all(type(x) in (int, long) for x in value) for value in values):
+        if any(len(value) != len(first) for value in values):
+            raise Uncacheable(name)
+        return ('tuple', np.array(values, dtype=np.int64).reshape(len(values), len(first)), None)
+    if (type(first) in (int, long, float, str, bool)) and all(
+            (type(value) is type(first)) and (value == first) for value in values):
+        return ('constant', None, first)
+    if (type(first) in (int, long, float)) and all(type(value) is type(first) for value in values):
+        return ('scalars', np.array(values), None)
+    if all(type(value) is str for value in values):
+        # (e.g. the HSK packet type, of each packet's APID)
+        return ('strings', np.array(values), None)
+    raise Uncacheable(name)
+
+
+def _decode_field(encoding, column, value, n, filename):
+    # the list of 'n' values of one field of a group
+    if encoding in ('none', 'view'):
+        return [None]*n
+    if encoding == 'provenance':
+        source_file_hash, date = value
+        record = provenance.Provenance(filename, str(source_file_hash), datetime.datetime(*date))
+        return [record]*n
+    if encoding == 'array':
+        return list(column)
+    if encoding == 'tuple':
+        return [tuple(row) for row in column.tolist()]
+    if encoding == 'constant':
+        if isinstance(value, unicode):
+            value = str(value)      # (JSON strings are read back as unicode)
+        return [value]*n
+    if encoding in ('scalars', 'strings'):
+        return column.tolist()
+    raise ValueError("unknown field encoding '{0}'".format(encoding))
+
+
+def _group_name(packet):
+    # records are grouped by class, raw (tf_header, packet) tuples by packet length
+    if isinstance(packet, packet_record.PacketRecord):
+        if type(packet).__name__ not in record_classes:
+            raise Uncacheable(type(packet).__name__)
+        return type(packet).__name__
+    if (type(packet) is tuple) and (len(packet) == len(raw_fields)):
+        return "raw{0}".format(len(packet[1]))
+    raise Uncacheable(type(packet).__name__)
+
+
+def _json_value(value):
+    # (numpy scalars, e.g. in the stats lists, as JSON numbers)
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(repr(value))
+
+
+def _tuple_lists(value):
+    # (JSON turns tuples into lists: restore them, e.g. in the 'slips' list)
+    if isinstance(value, list):
+        return tuple(_tuple_lists(x) for x in value)
+    return value
+
+
+class DecodeCache(object):
+    """Size-bounded (LRU) on-disk cache of decoded BGS pass files.
+
+    Entries are directories below 'directory', named by their key; an
+    entry holds a manifest (fields, encodings and stats) and a .npy file
+    per stored column.  Entries are written to a temporary directory and
+    renamed into place, so concurrent readers never see a partial entry.
+    A load marks an entry as recently used (the manifest's mtime).
+    """
+
+    def __init__(self, directory=None, max_bytes=default_max_bytes):
+        """Open (or create) a decode cache.
+
+        Keyword arguments:
+        directory -- cache directory (default None: the CINEMA_CACHE
+                     environment variable, or ~/.cinema_cache)
+        max_bytes -- bound on the total size of the cache entries (default
+                     4 GiB); an entry larger than this is not kept
+        """
+        if directory is None:
+            directory = os.environ.get('CINEMA_CACHE', os.path.join(os.path.expanduser("~"), ".cinema_cache"))
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+    def file_sha1(self, filename):
+        """Return the SHA1 hash of 'filename', remembered by (path, size, mtime)."""
+        info = os.stat(filename)
+        path = os.path.abspath(filename)
+        signature = [info.st_size, info.st_mtime]
+        hashes_path = os.path.join(self.directory, hashes_name)
+        try:
+            with open(hashes_path,'r') as f:
+                hashes = json.load(f)
+        except (IOError, ValueError):
+            hashes = {}
+        if (path in hashes) and (hashes[path][0:2] == signature):
+            return hashes[path][2]
+        sha1 = provenance.file_sha1(filename)
+        hashes[path] = signature + [sha1]
+        self._write_atomic(hashes_path, json.dumps(hashes))
+        return sha1
+
+    def key(self, filename, rs_correct=False):
+        """Return the cache key of the decoded 'filename' (as read_raw_hexbytes() options)."""
+        return hashlib.sha1("{0} {1} {2} {3}".format(cache_format, self.file_sha1(filename),
+                decoder_version(), int(bool(rs_correct)))).hexdigest()
+
+    def _write_atomic(self, path, text):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd,'w') as f:
+            f.write(text)
+        os.rename(temp_path, path)
+
+    def load(self, filename, stats=None, rs_correct=False):
+        """Return the cached packet tuple of 'filename', or None where not cached.
+
+        Arguments:
+        filename -- path to a BGS pass file (optionally GZIP compressed)
+
+        Keyword arguments:
+        stats -- dictionary in which to accumulate the stats of the cached
+                 decode, as for read_raw_hexbytes() (default None)
+        rs_correct -- Boolean argument, as for read_raw_hexbytes() (default False)
+
+        Return value:
+        (recentHSK_packet, recordHSK_packet, overflow_packet, science_packets,
+        other_packets), as for read_raw_hexbytes(); array fields are views
+        of (copy-on-write) memory-mapped columns
+        """
+        entry = os.path.join(self.directory, self.key(filename, rs_correct=rs_correct))
+        manifest_path = os.path.join(entry, manifest_name)
+        try:
+            with open(manifest_path,'r') as f:
+                manifest = json.load(f)
+            os.utime(manifest_path, None)       # (most recently used)
+
+            def column(name):
+                return np.load(os.path.join(entry, name + '.npy'), mmap_mode='c').view(np.ndarray)
+
+            groups = {}
+            for group_name, group in manifest['groups'].items():
+                n = group['n']
+                values = [_decode_field(encoding, column(group_name + '.' + field) if stored else None,
+                        value, n, filename)
+                        for (field, encoding, stored, value) in group['fields']]
+                if group_name in record_classes:
+                    cls = record_classes[group_name]
+                    records = []
+                    for state in zip(*values):
+                        record = cls.__new__(cls)
+                        record.__setstate__(state)
+                        records.append(record)
+                    groups[group_name] = records
+                else:
+                    groups[group_name] = zip(*values)
+            packet_lists = []
+            for category in unpack.packet_categories:
+                kinds = column(category + '.kind').tolist()
+                rows = column(category + '.row').tolist()
+                names = manifest['categories'][category]
+                packet_lists.append([groups[names[kind]][row] for kind, row in zip(kinds, rows)])
+        except (IOError, OSError, ValueError, KeyError):
+            # not cached (or evicted while being read)
+            return None
+        if stats is not None:
+            unpack.merge_stats(stats, dict((key, _tuple_lists(value))
+                for key, value in manifest['stats'].items()))
+        return tuple(packet_lists)
+
+    def store(self, filename, packet_tuple, stats, rs_correct=False):
+        """Store the decoded packets of 'filename', evicting old entries as needed.
+
+        Arguments:
+        filename -- path to the decoded BGS pass file
+        packet_tuple -- the read_raw_hexbytes() packet tuple of 'filename'
+        stats -- the stats of that decode (of 'filename' alone)
+
+        Keyword arguments:
+        rs_correct -- Boolean argument, as for read_raw_hexbytes() (default False)
+
+        Return value:
+        True where stored; False where a packet holds values that cannot
+        be stored column-wise (e.g. fields set by the caller)
+        """
+        key = self.key(filename, rs_correct=rs_correct)
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry):
+            return True
+        temp_entry = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        try:
+            # group the packets (by class, or raw packet length), noting
+            #   the group and row of each packet of each category
+            groups = {}
+            categories = {}
+            orders = {}
+            for category, packet_list in zip(unpack.packet_categories, packet_tuple):
+                names = []
+                kinds = np.empty(len(packet_list), dtype=np.int16)
+                rows = np.empty(len(packet_list), dtype=np.int64)
+                for i, packet in enumerate(packet_list):
+                    group_name = _group_name(packet)
+                    if group_name not in names:
+                        names.append(group_name)
+                    group = groups.setdefault(group_name, [])
+                    kinds[i] = names.index(group_name)
+                    rows[i] = len(group)
+                    group.append(packet)
+                categories[category] = names
+                orders[category + '.kind'] = kinds
+                orders[category + '.row'] = rows
+
+            manifest_groups = {}
+            for group_name, group in groups.items():
+                if group_name in record_classes:
+                    cls = record_classes[group_name]
+                    fields = cls._fields()
+                    columns = [[getattr(packet, field) for packet in group] for field in fields]
+                    views = [(field in cls._views) and all(getattr(packet, cls._views[field][0]) is not None
+                        for packet in group) for field in fields]
+                else:
+                    fields = raw_fields
+                    columns = zip(*group)
+                    views = [False]*len(fields)
+                manifest_fields = []
+                for field, values, view in zip(fields, columns, views):
+                    encoding, column, value = _encode_field(list(values), field, view=view)
+                    if column is not None:
+                        np.save(os.path.join(temp_entry, group_name + '.' + field + '.npy'), column)
+                    manifest_fields.append((field, encoding, column is not None, value))
+                manifest_groups[group_name] = {'n':len(group), 'fields':manifest_fields}
+            for name, column in orders.items():
+                np.save(os.path.join(temp_entry, name + '.npy'), column)
+
+            n_bytes = sum(os.path.getsize(os.path.join(temp_entry, name)) for name in os.listdir(temp_entry))
+            manifest = {'format':cache_format, 'source_file':os.path.abspath(filename),
+                    'decoder_version':decoder_version(), 'rs_correct':bool(rs_correct),
+                    'n_bytes':n_bytes, 'categories':categories, 'groups':manifest_groups,
+                    'stats':stats}
+            with open(os.path.join(temp_entry, manifest_name),'w') as f:
+                json.dump(manifest, f, default=_json_value)
+            try:
+                os.rename(temp_entry, entry)
+            except OSError:
+                # (stored meanwhile, by another process)
+                if not os.path.isdir(entry):
+                    raise
+        except Uncacheable:
+            return False
+        finally:
+            if os.path.isdir(temp_entry):
+                shutil.rmtree(temp_entry, ignore_errors=True)
+        self.evict()
+        return True
+
+    def entries(self):
+        """Return (last used, n_bytes, key) of each cache entry, least recently used first."""
+        entries = []
+        for key in os.listdir(self.directory):
+            manifest_path = os.path.join(self.directory, key, manifest_name)
+            try:
+                last_used = os.path.getmtime(manifest_path)
+                with open(manifest_path,'r') as f:
+                    n_bytes = json.load(f)['n_bytes']
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, n_bytes, key))
+        return sorted(entries)
+
+    def evict(self, max_bytes=None):
+        """Remove the least recently used entries, until the cache is within 'max_bytes'.
+
+        Keyword arguments:
+        max_bytes -- size bound (default None, the bound of the cache)
+
+        Return value:
+        list of the keys of the evicted entries
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(n_bytes for (last_used, n_bytes, key) in entries)
+        evicted = []
+        for (last_used, n_bytes, key) in entries:
+            if (total <= max_bytes):
+                break
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            total -= n_bytes
+            evicted.append(key)
+        return evicted
+
+    def clear(self):
+        """Remove every cache entry."""
+        return self.evict(max_bytes=0)
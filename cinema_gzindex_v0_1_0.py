@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# cinema_gzindex.py - random access into GZIP compressed pass archives
+#    - a checkpoint index, built once (a full decompression) and stored
+#        beside the archive as "<archive>.gzidx", records decompressor
+#        restart points: deflate block boundaries, roughly every 'spacing'
+#        uncompressed bytes, with the 32 KiB of history needed to resume
+#    - GzipIndexedFile seeks to any uncompressed offset (e.g. master frame
+#        N at N*1289) by restarting from the nearest preceding checkpoint,
+#        rather than inflating the archive from its start
+#    - after the method of zran.c (Mark Adler, zlib examples); zlib's
+#        inflatePrime() and Z_BLOCK are not exposed by the Python zlib
+#        module, so libz is called directly through ctypes
+#
+#    usage:
+#        python cinema_gzindex_v0_1_0.py ARCHIVE.gz [ARCHIVE.gz ...]
+#        (builds/refreshes the index of each archive)
+#
+#    Version Information:
+#        (beta)
+#        v0.1.0 initial code
+#
+
+import collections
+import ctypes
+import ctypes.util
+import os
+import sys
+import numpy as np
+
+# zlib constants
+Z_NO_FLUSH = 0
+Z_BLOCK = 5
+Z_OK = 0
+Z_STREAM_END = 1
+Z_NEED_DICT = 2
+Z_BUF_ERROR = -5
+
+window_size = 32768             # size (BYTES) of the deflate history window
+chunk_size = 16384              # size (BYTES) of compressed reads
+default_spacing = 1 << 20       # uncompressed bytes between checkpoints (approx.)
+index_version = 1
+
+
+class z_stream(ctypes.Structure):
+    _fields_ = [('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint),
+            ('total_in', ctypes.c_ulong),
+            ('next_out', ctypes.c_void_p), ('avail_out', ctypes.c_uint),
+            ('total_out', ctypes.c_ulong),
+            ('msg', ctypes.c_char_p), ('state', ctypes.c_void_p),
+            ('zalloc', ctypes.c_void_p), ('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p),
+            ('data_type', ctypes.c_int), ('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong)]
+
+
+def _load_libz():
+    name = ctypes.util.find_library('z')
+    if name is None:
+        return None
+    libz = ctypes.CDLL(name)
+    libz.zlibVersion.restype = ctypes.c_char_p
+    libz.inflateInit2_.argtypes = [ctypes.POINTER(z_stream), ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+    libz.inflate.argtypes = [ctypes.POINTER(z_stream), ctypes.c_int]
+    libz.inflateEnd.argtypes = [ctypes.POINTER(z_stream)]
+    libz.inflateReset.argtypes = [ctypes.POINTER(z_stream)]
+    libz.inflatePrime.argtypes = [ctypes.POINTER(z_stream), ctypes.c_int, ctypes.c_int]
+    libz.inflateSetDictionary.argtypes = [ctypes.POINTER(z_stream), ctypes.c_char_p, ctypes.c_uint]
+    return libz
+
+libz = _load_libz()
+
+# checkpoint index of one archive (arrays are indexed by checkpoint):
+#   size, mtime -- of the archive, when indexed (to detect a stale index)
+#   length -- total uncompressed size (BYTES)
+#   out_offset -- uncompressed offset of each checkpoint
+#   in_offset -- compressed (file) offset of each checkpoint's first full byte
+#   bits -- number of bits of the byte before 'in_offset' belonging to the block (0-7)
+#   windows -- (n, 32768) uint8 array, the uncompressed history at each checkpoint
+GzipIndex = collections.namedtuple('GzipIndex',
+        ['size', 'mtime', 'length', 'out_offset', 'in_offset', 'bits', 'windows'])
+
+
+def _require_libz():
+    if libz is None:
+        raise ImportError("cinema_gzindex: libz could not be located (ctypes.util.find_library('z'))")
+
+
+def _inflate_init(strm, window_bits):
+    ret = libz.inflateInit2_(ctypes.byref(strm), window_bits, libz.zlibVersion(),
+            ctypes.sizeof(z_stream))
+    if (ret != Z_OK):
+        raise IOError("inflateInit2 failed ({0})".format(ret))
+
+
+def _inflate_error(strm, ret):
+    return IOError("GZIP data error ({0}): {1}".format(ret, strm.msg))
+
+
+def index_filename(filename):
+    """Return the name of the checkpoint index stored beside the archive 'filename'."""
+    return filename + '.gzidx'
+
+
+def build_index(filename, spacing=default_spacing, save=True):
+    """Build the checkpoint index of a GZIP archive, with one full decompression.
+
+    Arguments:
+    filename -- path to a GZIP archive
+
+    Keyword arguments:
+    spacing -- approximate uncompressed distance (BYTES) between checkpoints
+               (default 1 MiB)
+    save -- Boolean argument; if True (default), store the index beside
+            the archive (see index_filename())
+
+    Return value:
+    a GzipIndex
+    """
+    _require_libz()
+    out_offsets, in_offsets, bits, windows = [], [], [], []
+    strm = z_stream()
+    window = ctypes.create_string_buffer(window_size)
+    inbuf = ctypes.create_string_buffer(chunk_size)
+    stat = os.stat(filename)
+    # automatic GZIP/zlib header detection (32 + 15)
+    _inflate_init(strm, 47)
+    try:
+        with open(filename,'rb') as f:
+            totin = totout = last = 0
+            strm.avail_out = 0
+            ret = Z_OK
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                ctypes.memmove(inbuf, data, len(data))
+                strm.avail_in = len(data)
+                strm.next_in = ctypes.addressof(inbuf)
+                while strm.avail_in > 0:
+                    # (the window is a circular output buffer)
+                    if (strm.avail_out == 0):
+                        strm.avail_out = window_size
+                        strm.next_out = ctypes.addressof(window)
+                    totin += strm.avail_in
+                    totout += strm.avail_out
+                    # stop at the end of each deflate block
+                    ret = libz.inflate(ctypes.byref(strm), Z_BLOCK)
+                    totin -= strm.avail_in
+                    totout -= strm.avail_out
+                    if (ret == Z_STREAM_END):
+                        # further GZIP members may follow
+                        libz.inflateReset(ctypes.byref(strm))
+                        continue
+                    if (ret not in (Z_OK, Z_BUF_ERROR)):
+                        raise _inflate_error(strm, ret)
+                    # at a block boundary (not the last block), add a checkpoint
+                    if ((strm.data_type & 128) and not (strm.data_type & 64) and
+                            (totout == 0 or totout - last > spacing)):
+                        left = strm.avail_out
+                        history = window.raw
+                        out_offsets.append(totout)
+                        in_offsets.append(totin)
+                        bits.append(strm.data_type & 7)
+                        windows.append(history[window_size-left:] + history[:window_size-left])
+                        last = totout
+    finally:
+        libz.inflateEnd(ctypes.byref(strm))
+
+    index = GzipIndex(size=stat.st_size, mtime=stat.st_mtime, length=totout,
+            out_offset=np.array(out_offsets, dtype=np.int64),
+            in_offset=np.array(in_offsets, dtype=np.int64),
+            bits=np.array(bits, dtype=np.uint8),
+            windows=np.frombuffer(b"".join(windows), dtype=np.uint8).reshape(-1, window_size))
+    if save:
+        save_index(index, index_filename(filename))
+    return index
+
+
+def save_index(index, idx_filename):
+    """Store a GzipIndex (compressed) in 'idx_filename'."""
+    with open(idx_filename,'wb') as f:
+        np.savez_compressed(f, version=index_version, size=index.size, mtime=index.mtime,
+                length=index.length, out_offset=index.out_offset, in_offset=index.in_offset,
+                bits=index.bits, windows=index.windows)
+
+
+def load_index(filename):
+    """Return the stored checkpoint index of the GZIP archive 'filename'.
+
+    Return value:
+    a GzipIndex, or None if there is no index, or it is stale (the
+    archive's size or modification time has since changed)
+    """
+    idx_filename = index_filename(filename)
+    if not os.path.isfile(idx_filename):
+        return None
+    stat = os.stat(filename)
+    with open(idx_filename,'rb') as f:
+        stored = np.load(f)
+        if ((int(stored['version']) != index_version) or (int(stored['size']) != stat.st_size) or
+                (float(stored['mtime']) != stat.st_mtime)):
+            return None
+        return GzipIndex(size=int(stored['size']), mtime=float(stored['mtime']),
+                length=int(stored['length']), out_offset=stored['out_offset'],
+                in_offset=stored['in_offset'], bits=stored['bits'], windows=stored['windows'])
+
+
+def ensure_index(filename, spacing=default_spacing):
+    """Return the checkpoint index of 'filename', building (and storing) it if need be."""
+    index = load_index(filename)
+    if index is None:
+        index = build_index(filename, spacing=spacing)
+    return index
+
+
+class GzipIndexedFile(object):
+    """Read-only file object for a GZIP archive, seekable through a checkpoint index.
+
+    Reads are sequential from the current position; seek() restarts the
+    decompressor at the nearest checkpoint preceding the target, and
+    inflates (and discards) only the remainder.  Without an index, this
+    is equivalent to a sequential gzip.open().
+    """
+
+    def __init__(self, filename, index=None):
+        _require_libz()
+        self.filename = filename
+        self.index = index
+        self.raw = open(filename,'rb')
+        self.strm = z_stream()
+        self.inbuf = ctypes.create_string_buffer(chunk_size)
+        self.active = False
+        self._restart(None)
+
+    def _restart(self, point):
+        # (re)initialize the decompressor at the start of the archive
+        #   (point None), or at checkpoint 'point' of the index
+        if self.active:
+            libz.inflateEnd(ctypes.byref(self.strm))
+        self.strm = z_stream()
+        self.strm.avail_in = 0
+        self.eof = False
+        if point is None:
+            _inflate_init(self.strm, 47)    # GZIP header
+            self.raw_deflate = False
+            self.raw.seek(0)
+            self.pos = 0
+        else:
+            _inflate_init(self.strm, -15)   # raw deflate, within a GZIP member
+            self.raw_deflate = True
+            in_offset = int(self.index.in_offset[point])
+            bits = int(self.index.bits[point])
+            if bits:
+                # the checkpoint begins part way through the preceding byte
+                self.raw.seek(in_offset - 1)
+                value = ord(self.raw.read(1))
+                libz.inflatePrime(ctypes.byref(self.strm), bits, value >> (8 - bits))
+            else:
+                self.raw.seek(in_offset)
+            window = self.index.windows[point].tostring()
+            libz.inflateSetDictionary(ctypes.byref(self.strm), window, window_size)
+            self.pos = int(self.index.out_offset[point])
+        self.active = True
+
+    def _next_member(self):
+        # at the end of a GZIP member: continue with any following member
+        member_end = self.raw.tell() - self.strm.avail_in
+        if self.raw_deflate:
+            member_end += 8                 # CRC32 and ISIZE trailer
+        libz.inflateEnd(ctypes.byref(self.strm))
+        self.raw.seek(member_end)
+        if (self.raw.read(2) != b"\x1f\x8b"):
+            self.active = False
+            self.eof = True
+            return
+        self.raw.seek(member_end)
+        self.strm = z_stream()
+        self.strm.avail_in = 0
+        _inflate_init(self.strm, 47)
+        self.raw_deflate = False
+
+    def _inflate(self, size):
+        # inflate up to 'size' bytes from the current position
+        outbuf = ctypes.create_string_buffer(size)
+        self.strm.next_out = ctypes.addressof(outbuf)
+        self.strm.avail_out = size
+        while (self.strm.avail_out > 0) and not self.eof:
+            if (self.strm.avail_in == 0):
+                data = self.raw.read(chunk_size)
+                if not data:
+                    break
+                ctypes.memmove(self.inbuf, data, len(data))
+                self.strm.next_in = ctypes.addressof(self.inbuf)
+                self.strm.avail_in = len(data)
+            ret = libz.inflate(ctypes.byref(self.strm), Z_NO_FLUSH)
+            if (ret == Z_STREAM_END):
+                next_out, avail_out = self.strm.next_out, self.strm.avail_out
+                self._next_member()
+                self.strm.next_out, self.strm.avail_out = next_out, avail_out
+            elif (ret == Z_NEED_DICT) or (ret < 0 and ret != Z_BUF_ERROR):
+                raise _inflate_error(self.strm, ret)
+        n = size - self.strm.avail_out
+        self.pos += n
+        return outbuf.raw[:n]
+
+    def read(self, size=-1):
+        if (size is None) or (size < 0):
+            chunks = []
+            chunk = self._inflate(1 << 20)
+            while chunk:
+                chunks.append(chunk)
+                chunk = self._inflate(1 << 20)
+            return b"".join(chunks)
+        return self._inflate(size)
+
+    def seek(self, offset, whence=0):
+        if (whence == 1):
+            offset += self.pos
+        elif (whence != 0):
+            raise IOError("GzipIndexedFile: only absolute/relative seeks are supported")
+        # restart from the nearest checkpoint, if it lies beyond the current
+        #   position (or the target lies behind it)
+        point = None
+        if (self.index is not None) and (len(self.index.out_offset) > 0):
+            point = int(np.searchsorted(self.index.out_offset, offset, side='right')) - 1
+            if (point < 0):
+                point = None
+        point_offset = 0 if (point is None) else int(self.index.out_offset[point])
+        if (offset < self.pos) or (point_offset > self.pos):
+            self._restart(point)
+        # inflate, and discard, up to the target
+        while (self.pos < offset):
+            if not self._inflate(min(offset - self.pos, 1 << 20)):
+                break
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        if self.active:
+            libz.inflateEnd(ctypes.byref(self.strm))
+            self.active = False
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == '__main__':
+    for archive in sys.argv[1:]:
+        index = build_index(archive)
+        print("{0}: {1} checkpoints, {2} bytes".format(
+            index_filename(archive), len(index.out_offset), index.length))
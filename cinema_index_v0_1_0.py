@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# cinema_index.py - persistent (SQLite) index of the packets of BGS pass files
+#    - every packet of a pass is recorded as it is ingested (decoded):
+#        source file, frame_id, packet slot, APID, CCSDS sequence count,
+#        raw packet_timestamp, and a derived UTC time
+#    - queries by APID and UTC range return the matching packets by
+#        decoding only their frames (iter_packets with a 'frame_range';
+#        GZIP archives are given a checkpoint index for this at ingest)
+#    - derived UTC times are nominal: full timestamps (MM,DD,HH,mm,ss,ff)
+#        are reconstructed by cinema_timeops, in the year given at ingest
+#        (or, without one, the first year after launch); MAGIC half
+#        timestamps (HH,mm,ss,ff) take the date of the nearest
+#        fully-timestamped packet of the pass
+#
+#    usage:
+#        python cinema_index_v0_1_0.py [--year YEAR] INDEX.db SOURCE [SOURCE ...]
+#        (ingests each pass file, or the pass files of each SOURCE directory)
+#
+#    Version Information:
+#        (beta)
+#        v0.1.0 initial code
+#
+
+import argparse
+import calendar
+import collections
+import datetime
+import os
+import sqlite3
+import sys
+import numpy as np
+import cinema_unpack_v0_8_1 as unpack
+import cinema_gzindex_v0_1_0 as gzindex
+import cinema_provenance_v0_1_0 as provenance
+import cinema_timeops_v0_1_0 as timeops
+
+schema_version = 1
+schema = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,          -- absolute path of the pass file
+    size INTEGER, mtime REAL,           -- of the pass file, when ingested
+    sha1 TEXT,                          -- SHA1 hash of the pass file
+    year INTEGER,                       -- year given for packet timestamps (NULL: inferred)
+    n_packets INTEGER
+);
+CREATE TABLE IF NOT EXISTS packets (
+    file_id INTEGER NOT NULL REFERENCES files(file_id),
+    frame_id INTEGER NOT NULL,          -- master frame (see iter_frame_blocks)
+    slot INTEGER NOT NULL,              -- packet slot of the frame (0-2)
+    apid INTEGER,                       -- first two CCSDS bytes (e.g. 0x0a41, APID 241)
+    category TEXT,                      -- one of cinema_unpack.packet_categories
+    seq_count INTEGER,                  -- CCSDS packet sequence count
+    packet_timestamp TEXT,              -- raw packet timestamp (space-separated fields)
+    utc REAL                            -- derived UTC time (POSIX seconds), or NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS packets_frame ON packets (file_id, frame_id, slot);
+CREATE INDEX IF NOT EXISTS packets_apid_utc ON packets (apid, utc);
+CREATE INDEX IF NOT EXISTS packets_utc ON packets (utc);
+"""
+
+# frames between matching packets, below which a single frame range is decoded
+fetch_gap = 16
+
+# a packet of the index
+PacketEntry = collections.namedtuple('PacketEntry', ('path', 'frame_id', 'slot', 'apid',
+        'category', 'seq_count', 'packet_timestamp', 'utc'))
+
+
+def posix_seconds(value):
+    """Return a datetime.datetime (naive datetimes are taken as UTC), or POSIX seconds, as POSIX seconds."""
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple()) + value.microsecond/1e6
+    return value
+
+
+def packet_fields(packet):
+    """Return the (apid, seq_count, packet_timestamp) of a packet, as yielded by iter_packets().
+
+    Parsed packets give their CCSDS header and packet timestamp; for
+    passed-along (transfer frame header, packet bytes) tuples, the CCSDS
+    header is read from the packet bytes, and there is no timestamp.
+    """
+    if isinstance(packet, tuple):
+        ccsds = packet[1][0:4]
+        timestamp = None
+    else:
+        ccsds = packet['packet_ccsds']
+        timestamp = packet['packet_timestamp']
+    if len(ccsds) < 4:
+        return (None, None, timestamp)
+    return ((int(ccsds[0]) << 8) | int(ccsds[1]), ((int(ccsds[2]) & 0x3f) << 8) | int(ccsds[3]),
+            timestamp)
+
+
+def derive_utc(timestamps, year=None, reference=None):
+    """Derive UTC times (POSIX seconds, or None) for the packet timestamps of a pass.
+
+    Arguments:
+    timestamps -- list of packet timestamps (or None), in frame order
+
+    Keyword arguments:
+    year, reference -- the year of the pass's full (MM,DD,HH,mm,ss,ff)
+                       timestamps, or a date within the year before the
+                       pass, as for cinema_timeops.reconstruct_packettimes()
+                       (default None, the first year after launch)
+
+    Full timestamps are reconstructed together (across year ends) by
+    cinema_timeops.reconstruct_packettimes(), unrepaired and without an
+    outlier test (recorded HSK packets may be days old); invalid ones give
+    None.  Half (HH,mm,ss,ff) timestamps take the date of the nearest valid
+    full timestamp, moved a day on (or back) where their times of day are
+    more than 12 hours apart.
+    """
+    utc = [None]*len(timestamps)
+    full_timestamps = [() if (timestamp is None) else timestamp for timestamp in timestamps]
+    times, quality = timeops.reconstruct_packettimes(timeops.timestamp_columns(full_timestamps),
+            year=year, reference=reference, outlier_tolerance=None, repair=False)
+    for i in np.flatnonzero(times != timeops.nat_ns).tolist():
+        seconds, fraction = divmod(int(times[i]), 10**9)
+        utc[i] = seconds + fraction/1e9
+    half = [i for i, timestamp in enumerate(timestamps) if (timestamp is not None)
+            and (len(timestamp) == 4) and timeops.validate_packettime(timestamp)]
+    full = np.flatnonzero([value is not None for value in utc])
+    if (len(half) == 0) or (len(full) == 0):
+        return utc
+
+    # nearest full timestamp (in frame order) of each half timestamp
+    half = np.array(half)
+    after = np.clip(np.searchsorted(full, half), 0, len(full) - 1)
+    before = np.clip(after - 1, 0, len(full) - 1)
+    nearest = np.where(np.abs(full[before] - half) <= np.abs(full[after] - half),
+            full[before], full[after])
+    for i, j in zip(half.tolist(), nearest.tolist()):
+        HH, mm, ss, ff = timestamps[i]
+        anchor = utc[j]
+        midnight = anchor - (anchor % 86400)
+        value = midnight + 3600*HH + 60*mm + ss + ff/100.
+        if (value - anchor > 43200):
+            value -= 86400
+        elif (anchor - value > 43200):
+            value += 86400
+        utc[i] = value
+    return utc
+
+
+class PacketIndex(object):
+    """SQLite index of the packets of BGS pass files.
+
+    Arguments:
+    path -- path of the SQLite database (created, where it does not exist)
+
+    Keyword arguments:
+    timeout -- seconds to wait for a database lock, e.g. while another
+               process ingests a pass (default 60)
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.executescript(schema)
+        self.connection.execute("PRAGMA user_version = {0}".format(schema_version))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_current(self, filename):
+        """Return True where 'filename' is indexed, and unchanged since."""
+        info = os.stat(filename)
+        row = self.connection.execute("SELECT size, mtime FROM files WHERE path = ?",
+                (os.path.abspath(filename),)).fetchone()
+        return (row is not None) and (row[0] == info.st_size) and (row[1] == info.st_mtime)
+
+    def ingest(self, filename, year=None, reference=None, stats=None, rs_correct=False, gz_index=True):
+        """Decode a BGS pass file, indexing every packet; return the packet lists.
+
+        Arguments:
+        filename -- path to a BGS pass file (optionally GZIP compressed)
+
+        Keyword arguments:
+        year, reference -- the year of the pass's packet timestamps, or a
+                           date within the year before it, as for
+                           derive_utc() (default None, the first year
+                           after launch)
+        stats -- dictionary in which to accumulate frame and miss counts, as
+                 for cinema_unpack.iter_packets() (default None)
+        rs_correct -- Boolean argument, as for iter_packets() (default False)
+        gz_index -- Boolean argument; if True (default), a GZIP archive is
+                    given a checkpoint index (see cinema_gzindex), so that
+                    fetch() can seek within it
+
+        Return value:
+        tuple of packet lists, in 'packet_categories' order (as from
+        cinema_unpack.read_raw_hexbytes()); any earlier index entries of
+        the file are replaced
+        """
+        path = os.path.abspath(filename)
+        info = os.stat(filename)
+        source = provenance.Provenance(filename)
+        packet_lists = tuple([] for category in unpack.packet_categories)
+        rows = []
+        timestamps = []
+        last_frame, slot = None, 0
+        for frame_id, category, packet in unpack.iter_packets(filename, stats=stats, source=source,
+                rs_correct=rs_correct):
+            packet_lists[unpack.packet_categories.index(category)].append(packet)
+            slot = (slot + 1) if (frame_id == last_frame) else 0
+            last_frame = frame_id
+            if packet is None:
+                continue
+            apid, seq_count, timestamp = packet_fields(packet)
+            rows.append([frame_id, slot, apid, category, seq_count,
+                    None if (timestamp is None) else " ".join(map(str, timestamp))])
+            timestamps.append(timestamp)
+        for row, utc in zip(rows, derive_utc(timestamps, year=year, reference=reference)):
+            row.append(utc)
+
+        if gz_index and (filename.split('.')[-1] == 'gz') and (gzindex.libz is not None):
+            gzindex.ensure_index(filename)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM packets WHERE file_id IN "
+                    "(SELECT file_id FROM files WHERE path = ?)", (path,))
+            self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            file_id = self.connection.execute("INSERT INTO files "
+                    "(path, size, mtime, sha1, year, n_packets) VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, info.st_size, info.st_mtime, source.source_file_hash, year,
+                    len(rows))).lastrowid
+            self.connection.executemany("INSERT INTO packets (file_id, frame_id, slot, apid, "
+                    "category, seq_count, packet_timestamp, utc) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    ([file_id] + row for row in rows))
+        return packet_lists
+
+    def query(self, apids=None, start=None, stop=None, filenames=None):
+        """Return the index entries of matching packets, as PacketEntry tuples in UTC order.
+
+        Keyword arguments:
+        apids -- APID (e.g. cinema_unpack.apid241), or iterable of APIDs
+                 (default None, any APID)
+        start, stop -- UTC range, start <= utc < stop, as datetime.datetime
+                       (naive datetimes are taken as UTC) or POSIX seconds
+                       (default None, unbounded); with either, packets
+                       without a UTC time are excluded
+        filenames -- iterable of pass files to search (default None, all)
+        """
+        where, parameters = [], []
+        if apids is not None:
+            if isinstance(apids, (int, long)):
+                apids = (apids,)
+            apids = list(apids)
+            where.append("packets.apid IN ({0})".format(", ".join("?"*len(apids))))
+            parameters.extend(apids)
+        if start is not None:
+            where.append("packets.utc >= ?")
+            parameters.append(posix_seconds(start))
+        if stop is not None:
+            where.append("packets.utc < ?")
+            parameters.append(posix_seconds(stop))
+        if filenames is not None:
+            filenames = [os.path.abspath(filename) for filename in filenames]
+            where.append("files.path IN ({0})".format(", ".join("?"*len(filenames))))
+            parameters.extend(filenames)
+        sql = ("SELECT files.path, frame_id, slot, apid, category, seq_count, packet_timestamp, utc "
+                "FROM packets JOIN files USING (file_id)")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY utc, files.path, frame_id, slot"
+        return [PacketEntry(*row) for row in self.connection.execute(sql, parameters)]
+
+    def fetch(self, apids=None, start=None, stop=None, filenames=None):
+        """Decode and return the matching packets, as (PacketEntry, packet) tuples in UTC order.
+
+        Keyword arguments are as for query().  Only the frames of matching
+        packets (in ranges, where they are within 'fetch_gap' frames of one
+        another) are read and decoded.
+        """
+        entries = self.query(apids=apids, start=start, stop=stop, filenames=filenames)
+        by_path = collections.defaultdict(list)
+        for entry in entries:
+            by_path[entry.path].append(entry)
+
+        packets = {}
+        for path, path_entries in by_path.items():
+            wanted = set((entry.frame_id, entry.slot) for entry in path_entries)
+            frame_ids = sorted(set(entry.frame_id for entry in path_entries))
+            # runs of nearby frames
+            ranges = [[frame_ids[0], frame_ids[0] + 1]]
+            for frame_id in frame_ids[1:]:
+                if (frame_id - ranges[-1][1] < fetch_gap):
+                    ranges[-1][1] = frame_id + 1
+                else:
+                    ranges.append([frame_id, frame_id + 1])
+            source = provenance.Provenance(path)
+            for frame_range in ranges:
+                last_frame, slot = None, 0
+                for frame_id, category, packet in unpack.iter_packets(path,
+                        frame_range=tuple(frame_range), source=source):
+                    slot = (slot + 1) if (frame_id == last_frame) else 0
+                    last_frame = frame_id
+                    if (frame_id, slot) in wanted:
+                        packets[(path, frame_id, slot)] = packet
+        return [(entry, packets.get((entry.path, entry.frame_id, entry.slot)))
+                for entry in entries]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index the packets of CINEMA BGS pass files.")
+    parser.add_argument('index', help="packet index database (created, where it does not exist)")
+    parser.add_argument('sources', nargs='+',
+            help="pass files, or directories of BGS pass files")
+    parser.add_argument('--year', type=int, default=None,
+            help="year of the passes' packet timestamps (default: the first year after launch)")
+    args = parser.parse_args(argv)
+    import cinema_batch_v0_1_0 as batch
+    with PacketIndex(args.index) as index:
+        for filename in batch.find_pass_files(args.sources):
+            if index.is_current(filename):
+                print(filename + " (current)")
+                continue
+            packet_lists = index.ingest(filename, year=args.year)
+            print(filename + " ({0} packets)".format(sum(map(len, packet_lists))))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# cinema_packet.py - compact records for unpacked CINEMA packets
+#    - per-packet values are held in __slots__, rather than a fresh dictionary
+#    - constant format descriptors (e.g. 'stein_data_format') are held
+#        once, on the class
+#    - dictionary-style access (packet['clock_time'], .keys(), .get(), ...)
+#        is kept for existing callers
+#    - list views of array fields (e.g. 'stein_data' of 'stein_events') may
+#        be left unset, and are then built on first access
+#
+#    Version Information:
+#        (beta)
+#        v0.1.0 initial code
+#
+
+class PacketRecord(object):
+    """Base class of unpacked packet records, with dictionary-style access.
+
+    Subclasses list their per-packet fields in '__slots__', and the names
+    of their class-level (constant) format descriptors in '_constants'.
+    Both are available as keys; format descriptors may not be assigned.
+    Fields listed in '_views', as {field: (source field, function)}, are
+    built from their source field when first accessed (by key) unset.
+    """
+    # per-packet fields, common to every packet type
+    __slots__ = ('tframe_header', 'packet_ccsds', 'packet_header', 'packet_timestamp',
+            'clock_time', 'clock_time_quality', 'provenance')
+    _constants = ('clock_time_format',)
+    _views = {}
+
+    clock_time_format = "YYYY MM DD HH mm ss ffffff"
+
+    def __init__(self, **fields):
+        for key in self._fields():
+            object.__setattr__(self, key, None)
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def _fields(cls):
+        # per-packet field names, collected (once) along the class hierarchy
+        if '_field_names' not in cls.__dict__:
+            names = []
+            for klass in reversed(cls.__mro__):
+                names.extend(klass.__dict__.get('__slots__', ()))
+            cls._field_names = tuple(names)
+        return cls._field_names
+
+    @classmethod
+    def _keys(cls):
+        # all key names (per-packet fields, then format descriptors)
+        if '_key_names' not in cls.__dict__:
+            constants = []
+            for klass in reversed(cls.__mro__):
+                constants.extend(klass.__dict__.get('_constants', ()))
+            cls._key_names = cls._fields() + tuple(constants)
+            cls._key_set = frozenset(cls._key_names)
+        return cls._key_names
+
+    @classmethod
+    def _keyset(cls):
+        cls._keys()
+        return cls._key_set
+
+    # mapping adapter
+    def __getitem__(self, key):
+        if key not in self._keyset():
+            raise KeyError(key)
+        value = getattr(self, key)
+        if (value is None) and (key in self._views):
+            source, view = self._views[key]
+            if getattr(self, source) is not None:
+                value = view(getattr(self, source))
+                object.__setattr__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self._fields():
+            if key in self._keyset():
+                raise TypeError("'{0}' is a constant format descriptor of {1}".format(
+                    key, type(self).__name__))
+            raise KeyError(key)
+        object.__setattr__(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._keyset()
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def keys(self):
+        return list(self._keys())
+
+    def values(self):
+        return [self[key] for key in self._keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys()]
+
+    def get(self, key, default=None):
+        if key in self._keyset():
+            return self[key]
+        return default
+
+    def to_dict(self):
+        """Return the packet as a (new) dictionary, as in earlier versions."""
+        return dict(self.items())
+
+    # pickling (e.g. for multiprocessing): per-packet fields only
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in self._fields())
+
+    def __setstate__(self, state):
+        for key, value in zip(self._fields(), state):
+            object.__setattr__(self, key, value)
+
+    def __repr__(self):
+        return "<{0} {1}>".format(type(self).__name__, getattr(self, 'packet_timestamp', None))
@@ -0,0 +1,124 @@
+# cinema_provenance.py - source-file provenance for unpacked CINEMA packets
+#    - one shared, immutable record per source file:
+#        source file (filename/path)
+#        source file hash (SHA1)
+#        extraction date
+#    - the hash is accumulated while the file is read, rather than
+#        re-reading the whole file for every packet
+#
+#    Version Information:
+#        (beta)
+#        v0.1.0 initial code
+#
+
+import datetime
+import hashlib
+
+
+class Provenance(object):
+    """Source-file provenance, shared by all packets unpacked from one file.
+
+    The SHA1 hash is accumulated while the file is read (see HashingFile);
+    once it is known, the record is sealed and may no longer be changed.
+    Until then, 'source_file_hash' is None.
+    """
+    __slots__ = ('source_file', 'source_file_hash', 'source_file_hash_format',
+            'extraction_date', '_sealed')
+
+    def __init__(self, source_file=None, source_file_hash=None, extraction_date=None):
+        object.__setattr__(self, '_sealed', False)
+        self.source_file = source_file
+        self.source_file_hash = None
+        self.source_file_hash_format = "SHA1"       # hashing algorithm is SHA1
+        if extraction_date is None:
+            extraction_date = datetime.datetime.now()
+        self.extraction_date = extraction_date
+        if source_file_hash is not None:
+            self.seal(source_file_hash)
+
+    def __setattr__(self, name, value):
+        if self._sealed:
+            raise AttributeError("Provenance record is sealed; '{0}' cannot be changed".format(name))
+        object.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        return (Provenance, (self.source_file, self.source_file_hash, self.extraction_date))
+
+    def __repr__(self):
+        return "Provenance({0!r}, {1!r}, {2!r})".format(
+                self.source_file, self.source_file_hash, self.extraction_date)
+
+    def seal(self, source_file_hash):
+        """Store the hash of the (completely read) source file, and seal the record."""
+        self.source_file_hash = source_file_hash
+        object.__setattr__(self, '_sealed', True)
+
+    @property
+    def sealed(self):
+        return self._sealed
+
+
+class HashingFile(object):
+    """File wrapper, hashing the bytes of the underlying file as they are read.
+
+    Seeks are passed through, and bytes re-read after a backward seek
+    (as GzipFile does when checking the trailer) are only hashed once.
+    Call finish() to hash any unread remainder, and obtain the hex digest.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha1()
+        self.hashed = 0         # number of leading bytes hashed so far
+
+    def read(self, size=-1):
+        pos = self.fileobj.tell()
+        data = self.fileobj.read(size)
+        if (pos <= self.hashed < pos + len(data)):
+            self.hasher.update(data[self.hashed - pos:])
+            self.hashed = pos + len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def close(self):
+        return self.fileobj.close()
+
+    def finish(self):
+        """Hash the remainder of the file, returning the SHA1 hex digest."""
+        self.fileobj.seek(self.hashed)
+        chunk = self.read(1 << 20)
+        while chunk:
+            chunk = self.read(1 << 20)
+        return self.hasher.hexdigest()
+
+
+def file_sha1(filename):
+    """Return the SHA1 hex digest of the (raw, undecompressed) bytes of 'filename'."""
+    with open(filename,'rb') as f:
+        hasher = HashingFile(f)
+        return hasher.finish()
+
+
+def source_info(packet_list):
+    """Return the "% SOURCE:" header text describing the sources of 'packet_list'.
+
+    One entry is written per distinct provenance record, in order of appearance.
+    """
+    seen = set()
+    source_info = []
+    for packet in packet_list:
+        record = packet['provenance']
+        if id(record) in seen:
+            continue
+        seen.add(id(record))
+        if (record is None) or (record.source_file is None):
+            source_info.append("%   Not available\r\n")
+        else:
+            source_info.append("%   " + record.source_file + "\r\n%     " +
+                    record.source_file_hash_format + " hash:" + str(record.source_file_hash) + "\r\n")
+    return "".join(source_info)
@@ -0,0 +1,268 @@
+# cinema_rscode.py - Reed-Solomon check (and correction) of CINEMA master frames
+#    - the 1275 bytes after the ASM (transfer frame, to the end of the RS
+#        CODE sequence) are a CCSDS RS(255,223) codeblock, interleaved to
+#        depth 5: byte k belongs to codeword k % 5, and the last 160 bytes
+#        are the 5 x 32 check symbols
+#    - CCSDS code (CCSDS 131.0-B): field polynomial x^8+x^7+x^2+x+1 (0x187),
+#        generator roots alpha^(11*j), j = 112..143; symbols are sent in the
+#        Berlekamp dual basis
+#    - syndromes of every codeword of a block of frames are found together:
+#        each syndrome is linear in the received bytes, so a lookup table of
+#        the (32-byte) syndrome contribution of each byte value at each
+#        codeword position reduces the check to a gather and an XOR per
+#        position, over a block of codewords at once (dual basis conversion
+#        is folded into the table)
+#    - only codewords with non-zero syndromes (rare, in a good pass) are
+#        corrected, one at a time (Berlekamp-Massey, Chien search, Forney)
+#
+#    Version Information:
+#        (beta)
+#        v0.1.0 initial code
+#
+
+import numpy as np
+
+# RS code constants
+rs_n = 255                  # codeword length (symbols)
+rs_k = 223                  # data symbols per codeword
+rs_parity = rs_n - rs_k     # check symbols per codeword (corrects up to 16 symbol errors)
+rs_interleave = 5           # interleaving depth
+rs_fcr = 112                # first consecutive root (as a power of alpha^rs_prim)
+rs_prim = 11                # primitive element of the generator roots, as a power of alpha
+rs_gfpoly = 0x187           # field generator polynomial
+rs_codeblock_size = rs_n*rs_interleave      # 1275
+rs_codeblock_offset = 14    # offset (BYTES) of the codeblock in a master frame (after SMEX/ASM)
+rs_block_codewords = 4096   # codewords checked at once (bounds temporary memory)
+rs_chunk_frames = rs_block_codewords // rs_interleave   # frames whose codewords are built at once
+
+# integrity flag of a master frame
+rs_clean = 0                # every codeword valid
+rs_corrected = 1            # errors found, and corrected
+rs_errors = 2               # errors found (uncorrectable, or not corrected)
+
+
+def _build_gf_tables():
+    # exponent/logarithm tables of GF(2^8), conventional (alpha) basis
+    gf_exp = np.zeros(2*rs_n, dtype=np.int64)
+    gf_log = np.zeros(256, dtype=np.int64)
+    x = 1
+    for i in range(rs_n):
+        gf_exp[i] = x
+        gf_log[x] = i
+        x <<= 1
+        if (x & 0x100):
+            x ^= rs_gfpoly
+    gf_exp[rs_n:] = gf_exp[:rs_n]
+    return (gf_exp, gf_log)
+
+gf_exp, gf_log = _build_gf_tables()
+
+
+def _build_dual_basis_tables():
+    # conversion between the conventional and (Berlekamp) dual bases
+    tal = (0x8d, 0xef, 0xec, 0x86, 0xfa, 0x99, 0xaf, 0x7b)
+    to_dual = np.zeros(256, dtype=np.uint8)
+    from_dual = np.zeros(256, dtype=np.uint8)
+    for value in range(256):
+        dual = 0
+        for j in range(8):
+            for k in range(8):
+                if (value & (1 << k)):
+                    dual ^= tal[7-k] & (1 << j)
+        to_dual[value] = dual
+        from_dual[dual] = value
+    return (to_dual, from_dual)
+
+to_dual, from_dual = _build_dual_basis_tables()
+
+
+def _build_syndrome_table():
+    # (rs_n, 256, 4) uint64 table: the 32 syndrome bytes contributed by each
+    #   (dual basis) byte value at each codeword position, packed in 4 words
+    #   S_i = sum_j r_j * beta_i^(254-j),  beta_i = alpha^(rs_prim*(rs_fcr+i))
+    position = np.arange(rs_n)[:,np.newaxis,np.newaxis]
+    symbol = from_dual.astype(np.int64)[np.newaxis,:,np.newaxis]
+    root = (rs_prim*(rs_fcr + np.arange(rs_parity)))[np.newaxis,np.newaxis,:]
+    log_term = gf_log[symbol] + (root*(rs_n - 1 - position)) % rs_n
+    table = np.where(symbol != 0, gf_exp[log_term % rs_n], 0).astype(np.uint8)
+    return np.ascontiguousarray(table).view(np.uint64)
+
+syndrome_table = _build_syndrome_table()
+
+
+def frame_codewords(frames):
+    """Return the (n_frames*5, 255) RS codewords of a block of master frames.
+
+    Arguments:
+    frames -- (n_frames,) record array of master frames (see cinema_unpack)
+    """
+    raw = frames.view(np.uint8).reshape(len(frames), -1)
+    block = raw[:,rs_codeblock_offset:rs_codeblock_offset + rs_codeblock_size]
+    # byte k of a codeblock belongs to codeword k % 5
+    return block.reshape(len(frames), rs_n, rs_interleave).transpose(0, 2, 1).reshape(-1, rs_n)
+
+
+def syndromes(codewords):
+    """Return the syndromes of RS codewords, as a (n, 4) uint64 array of packed bytes.
+
+    Arguments:
+    codewords -- (n, 255) uint8 array of (dual basis) codewords
+
+    A codeword is valid where every syndrome is zero.
+    """
+    result = np.zeros((len(codewords), rs_parity // 8), dtype=np.uint64)
+    for i in range(0, len(codewords), rs_block_codewords):
+        # (a position at a time, over a block of codewords: the 8 KiB table
+        #   row of one position stays in cache)
+        block = np.ascontiguousarray(codewords[i:i+rs_block_codewords].T)
+        total = result[i:i+block.shape[1]]
+        for position in range(rs_n):
+            total ^= syndrome_table[position].take(block[position], axis=0)
+    return result
+
+
+# (list copies of the tables, for the scalar arithmetic of correction)
+_exp, _log = gf_exp.tolist(), gf_log.tolist()
+
+
+def _gf_mul(a, b):
+    if (a == 0) or (b == 0):
+        return 0
+    return _exp[_log[a] + _log[b]]
+
+
+def _gf_inv(a):
+    return _exp[rs_n - _log[a]]
+
+
+def _poly_eval(poly, x):
+    # poly[i] is the coefficient of x^i
+    result = 0
+    for coefficient in reversed(poly):
+        result = _gf_mul(result, x) ^ coefficient
+    return result
+
+
+def correct_codeword(codeword, syndrome):
+    """Correct one RS codeword in place, returning the number of symbols corrected.
+
+    Arguments:
+    codeword -- (255,) uint8 array of (dual basis) symbols; corrected in place
+    syndrome -- its syndromes, as returned by syndromes()
+
+    Return value:
+    number of symbols corrected, or None (codeword left unchanged) where
+    the errors are beyond the correcting power of the code
+    """
+    S = [int(s) for s in np.asarray(syndrome, dtype=np.uint64).view(np.uint8)]
+
+    # Berlekamp-Massey: error locator polynomial, lambda(x) = prod(1 - X_e x)
+    locator, previous = [1], [1]
+    n_errors, shift, last = 0, 1, 1
+    for i in range(rs_parity):
+        delta = S[i]
+        for j in range(1, n_errors + 1):
+            if j < len(locator):
+                delta ^= _gf_mul(locator[j], S[i-j])
+        if (delta == 0):
+            shift += 1
+            continue
+        scale = _gf_mul(delta, _gf_inv(last))
+        update = [0]*shift + [_gf_mul(scale, c) for c in previous]
+        length = max(len(locator), len(update))
+        revised = [a ^ b for a, b in zip(locator + [0]*(length - len(locator)),
+                update + [0]*(length - len(update)))]
+        if (2*n_errors <= i):
+            previous, last = locator, delta
+            n_errors = i + 1 - n_errors
+            shift = 1
+        else:
+            shift += 1
+        locator = revised
+    while (len(locator) > 1) and (locator[-1] == 0):
+        locator.pop()
+    degree = len(locator) - 1
+    if (degree != n_errors) or (degree > rs_parity // 2):
+        return None
+
+    # Chien search: lambda(X_e^-1) = 0, X_e = beta^p for an error at degree p
+    #   (lambda is evaluated at every beta^-p at once)
+    p = np.arange(rs_n)
+    value = np.zeros(rs_n, dtype=np.int64)
+    for j, coefficient in enumerate(locator):
+        if coefficient:
+            value ^= gf_exp[(_log[coefficient] - rs_prim*j*p) % rs_n]
+    roots = np.flatnonzero(value == 0).tolist()
+    if (len(roots) != degree):
+        return None
+
+    # Forney: Y_e = X_e^(1-fcr) omega(X_e^-1) / lambda'(X_e^-1)
+    omega = [0]*rs_parity
+    for i in range(rs_parity):
+        for j in range(min(i, degree) + 1):
+            omega[i] ^= _gf_mul(S[i-j], locator[j])
+    derivative = [locator[j] if (j % 2) else 0 for j in range(1, degree + 1)]
+    corrections = []
+    for p in roots:
+        x_inverse = _exp[(-rs_prim*p) % rs_n]
+        denominator = _poly_eval(derivative, x_inverse)
+        if (denominator == 0):
+            return None
+        x_power = _exp[(rs_prim*p*(1 - rs_fcr)) % rs_n]
+        magnitude = _gf_mul(_gf_mul(x_power, _poly_eval(omega, x_inverse)), _gf_inv(denominator))
+        corrections.append((rs_n - 1 - p, magnitude))
+
+    # (the dual basis conversion is linear: correct the received symbols directly)
+    corrected = codeword.copy()
+    for position, magnitude in corrections:
+        corrected[position] ^= to_dual[magnitude]
+    if syndromes(corrected[np.newaxis,:]).any():
+        return None
+    codeword[:] = corrected
+    return len(corrections)
+
+
+def check_frames(frames, correct=False):
+    """RS check (and optionally correct) a block of master frames.
+
+    Arguments:
+    frames -- (n_frames,) record array of master frames (see cinema_unpack)
+
+    Keyword arguments:
+    correct -- Boolean argument; if True, correctable codewords are
+               corrected (default False, check only)
+
+    Return value:
+    (frames, status) -- the frames (a corrected copy, where any frame was
+    corrected), and an (n_frames,) int8 array of integrity flags:
+    rs_clean, rs_corrected or rs_errors
+    """
+    status = np.empty(len(frames), dtype=np.int8)
+    corrected_frames = None
+    # (codewords are built, and checked, a chunk of frames at a time: the
+    #   interleaved symbols are copied per chunk, whatever the block size)
+    for start in range(0, len(frames), rs_chunk_frames):
+        chunk = frames[start:start+rs_chunk_frames]
+        codewords = frame_codewords(chunk)
+        failed = syndromes(codewords).any(axis=1).reshape(len(chunk), rs_interleave)
+        status[start:start+len(chunk)] = np.where(failed.any(axis=1), rs_errors, rs_clean)
+        if not (correct and failed.any()):
+            continue
+
+        # (codewords are a copy of the interleaved symbols; corrections are
+        #   written back into a copy of the frames)
+        if corrected_frames is None:
+            corrected_frames = frames.copy()
+        for i in np.flatnonzero(failed.any(axis=1)):
+            correctable = True
+            for k in np.flatnonzero(failed[i]):
+                codeword = codewords[i*rs_interleave + k]
+                if (correct_codeword(codeword, syndromes(codeword[np.newaxis,:])[0]) is None):
+                    correctable = False
+                    continue
+                raw = corrected_frames[start+i:start+i+1].view(np.uint8)
+                raw[rs_codeblock_offset + k:rs_codeblock_offset + rs_codeblock_size:rs_interleave] = codeword
+            status[start+i] = rs_corrected if correctable else rs_errors
+    if corrected_frames is not None:
+        frames = corrected_frames
+    return (frames, status)
@@ -10,6 +10,7 @@
 #       (based on cinema_eventtime, etc)
 
 import datetime
+import numpy as np
 
 # -----------------------------
 # Quality of Data (QoD) definitions
@@ -28,6 +29,14 @@ import datetime
 # -----------------------------
 # -----------------------------
 
+# the earliest possible packet time (CINEMA launch), from which the year of
+# (MM,DD,HH,mm,ss,ff) packet timestamps is inferred
+mission_start = np.datetime64('2012-09-13T00:00:00', 'ns')
+# the int64 value of numpy.datetime64('NaT')
+nat_ns = np.iinfo(np.int64).min
+# epoch nanoseconds of the start of a leap year (for timestamps without a year)
+leap_year_ns = np.datetime64('2000-01-01T00:00:00', 'ns').view(np.int64)
+
 
 
 
@@ -50,50 +59,96 @@ def identify_outliers(datetime_iterable, tolerance=3*86400):
     """Identify and return outliers in a datetime iterable, relative to given tolerance (in seconds).
 
     Keyword arguments:
-    datetime_iterable -- iterable of datetime objects
+    datetime_iterable -- iterable of datetime objects (or () where missing)
     tolerance -- maximum acceptable distance from median, in seconds
 
     Return value:
     outliers - the subset of datetime objects which fail a Median Absolute Deviation test
 
-    # Easy to access other quantities given this results:
-    #   inliers = [dt for dt in datetime_iterable if ((dt != ()) and (dt not in outliers))]
-    #   where_inliers = [i for i,dt in enumerate(datetime_iterable) if ((dt != ()) and (dt not in outliers))]
-    """
-
-    done = False
-    iterations = 0
-    max_iterations = 5
-
-    # alias datetime_iterable, and generate indices
-    dt_set = datetime_iterable
-    ss_indices = [i for i,dt in enumerate(dt_set) if (dt != ())]
-    dt_subset = [dt for i,dt in enumerate(dt_set) if (i in ss_indices)]
-    n_subset = len(dt_subset)
-
-    # begin reducing set 
-    while (done != True) and (iterations < max_iterations):
-
-        # reduce set    
-        dt_subset = [dt for i,dt in enumerate(dt_set) if ((dt != ()) and (i in ss_indices))]
-        # estimate = nanmedian(dt_subset)
-        # deviation = MAD(dt_subset)
-        (estimate, deviation) = calc_dt_median_mad(dt_subset)
-        if (deviation.total_seconds() > tolerance):
-            new_ss_indices = [j for j,dt in enumerate(dt_set) if ((dt != ()) and (abs(dt - estimate) < deviation))]
-            n_subset = len(new_ss_indices)
-            if (n_subset > 0):
-                ss_indices = new_ss_indices
-            else:
-                done = True
-        else:
-            done = True
-        print(iterations, estimate.total_seconds(), deviation.total_seconds(), n_subset)
-        iterations += 1
+    The test itself is mad_outliers(), on the epoch microseconds of the
+    datetime objects; use mad_outliers() directly on arrays of epoch times.
+    """
+    dt_set = list(datetime_iterable)
+    valid = np.array([dt != () for dt in dt_set], dtype=bool)
+    times = np.zeros(len(dt_set), dtype=np.int64)
+    if valid.any():
+        times[valid] = np.array([dt.replace(tzinfo=None) for dt, ok in zip(dt_set, valid) if ok],
+                dtype='datetime64[us]').view(np.int64)
+    inliers, outliers, estimate, deviation = mad_outliers(times, tolerance=tolerance, valid=valid,
+            units_per_second=10**6)
+    return [dt for dt, outlier in zip(dt_set, outliers) if outlier]
 
-    # generate outlier list
-    outliers = [dt for i,dt in enumerate(dt_set) if ((dt != ()) and (i not in ss_indices))]
-    return outliers
+
+def mad_outliers(times, tolerance=3*86400, valid=None, units_per_second=10**9, max_iterations=5):
+    """Identify outliers in an array of epoch times, by iterated Median Absolute Deviation tests.
+
+    Arguments:
+    times -- int64 array of epoch times (in units of 1/units_per_second
+             seconds), or a numpy.datetime64 array (NaT is missing)
+
+    Keyword arguments:
+    tolerance -- maximum acceptable deviation, in seconds (default 3 days)
+    valid -- Boolean mask of the times to consider (default None, all but NaT)
+    units_per_second -- units of 'times' (default 10**9, epoch nanoseconds)
+    max_iterations -- bound on the number of tests (default 5)
+
+    Return value:
+    (inliers, outliers, estimate, deviation) -- Boolean masks of the
+    inliers and outliers among the valid times, the median of the
+    inliers (an int64 epoch time, or None where there are none), and
+    their MAD (in units of 'times')
+
+    While the MAD of the current inliers exceeds 'tolerance', the inliers
+    become every valid time within one MAD of their median (the set is
+    kept, where that would be empty).
+    """
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        times = times.astype('datetime64[ns]')
+        units_per_second = 10**9
+        missing = np.isnat(times)
+        times = times.view(np.int64)
+    else:
+        times = times.astype(np.int64)
+        missing = np.zeros(len(times), dtype=bool)
+    if valid is None:
+        valid = ~missing
+    else:
+        valid = np.asarray(valid, dtype=bool) & ~missing
+    if not valid.any():
+        return (valid.copy(), valid.copy(), None, 0.)
+
+    # (relative to the earliest valid time, so that float medians keep full precision)
+    origin = times[valid].min()
+    relative = (times - origin).astype(np.float64)
+    limit = tolerance*float(units_per_second)
+
+    inliers = valid.copy()
+    changed = True
+    for iteration in range(max_iterations):
+        estimate, deviation = median_mad(relative[inliers])
+        changed = False
+        if (deviation <= limit):
+            break
+        candidates = valid & (np.fabs(relative - estimate) < deviation)
+        if not candidates.any():
+            break
+        inliers = candidates
+        changed = True
+    if changed:
+        estimate, deviation = median_mad(relative[inliers])
+    return (inliers, valid & ~inliers, origin + int(round(estimate)), deviation)
+
+
+def median_mad(values, c=0.6745):
+    """Return the median, and the Median Absolute Deviation (scaled by 1/c), of a 1-D array.
+
+    NaN values are ignored.
+    """
+    values = np.asarray(values, np.float64)
+    values = values[values == values]
+    estimate = np.median(values)
+    return (estimate, np.median(np.fabs(values - estimate)) / c)
 
 
 def shift_packettime(packet_timestamp):
@@ -132,6 +187,192 @@ def shift_packettime(packet_timestamp):
         return False
 
 
+def shift_packettimes(timestamps, shift=1):
+    """Shift the fields of an array of packet_timestamps, as shift_packettime().
+
+    Arguments:
+    timestamps -- an (n,6) or (n,4) integer array of packet_timestamps
+
+    Keyword arguments:
+    shift -- number of leading fields dropped (default 1); the trailing
+             fields are filled with 0 (or 1, for MM and DD)
+
+    Return value:
+    (n,6) or (n,4) int64 array of shifted timestamps
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    lower = np.array((1, 1, 0, 0, 0, 0)[-timestamps.shape[1]:])
+    shifted = np.empty(timestamps.shape, dtype=np.int64)
+    shifted[:] = lower
+    shifted[:,:timestamps.shape[1] - shift] = timestamps[:,shift:]
+    return shifted
+
+
+def cyclic_packettimes(timestamps):
+    """Return packet_timestamps as centiseconds of their day (or year), and the cycle length.
+
+    Arguments:
+    timestamps -- an (n,4) array of (HH,mm,ss,ff) timestamps, in
+                  centiseconds of the day, or an (n,6) array of
+                  (MM,DD,HH,mm,ss,ff) timestamps, in centiseconds of a
+                  (leap) year
+
+    Return value:
+    (times, valid, period) -- int64 array of times, the Boolean array of
+    valid timestamps (as validate_packettimes(); times are 0 elsewhere),
+    and the length of the cycle, in centiseconds
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    valid = validate_packettimes(timestamps)
+    times = np.zeros(len(timestamps), dtype=np.int64)
+    if timestamps.shape[1] == 4:
+        ts = timestamps[valid]
+        times[valid] = ((ts[:,0]*60 + ts[:,1])*60 + ts[:,2])*100 + ts[:,3]
+        return (times, valid, 86400*100)
+    ns, exists = civil_epoch_ns(2000, timestamps[valid])
+    valid[valid] = exists
+    times[valid] = (ns[exists] - leap_year_ns)//10**7
+    return (times, valid, 366*86400*100)
+
+
+def repair_packettimes(timestamps, max_shift=1, tolerance=10., min_run=32):
+    """Repair byte-shifted packet_timestamps, by the cadence of neighbouring packets.
+
+    Arguments:
+    timestamps -- an (n,6) or (n,4) integer array of packet_timestamps,
+                  in packet order
+
+    Keyword arguments:
+    max_shift -- the largest shift (number of leading fields dropped, as
+                 shift_packettime()) to consider (default 1; at most 3)
+    tolerance -- the largest deviation, in seconds, from neighbouring
+                 packets (default 10.)
+    min_run -- the length of a run of packets (each following the last by
+               0 to 'tolerance' seconds more than the median cadence) that
+               anchors the trend of the pass (default 32; where no run is
+               as long, the longest run anchors it)
+
+    Return value:
+    (repaired_timestamps, repaired) -- int64 array of timestamps, and the
+    Boolean array of those replaced (to be given QoD 3)
+
+    A timestamp is suspect if it is invalid, or if it departs from the
+    trend of the anchored packets around it: it must fall between the
+    nearest anchored packets before and after it, and follow the one, or
+    precede the other, at the cadence.  (So a run of shifted timestamps,
+    which follow one another at the cadence, is suspect as a whole.)
+    Each shift of a suspect timestamp leaves its trailing
+    fields unknown, i.e. a range of times; the shift whose range comes
+    closest to the times of the nearest good packets (between them, or
+    else at the median cadence from one) is taken, where it is within
+    'tolerance', and the unknown fields filled in as the nearest time to
+    the cadence.  No shift (the timestamp as it is) is preferred.
+    """
+    if not (0 < max_shift <= 3):
+        raise ValueError("repair_packettimes: max_shift must be 1, 2 or 3")
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    repaired_timestamps = timestamps.copy()
+    repaired = np.zeros(len(timestamps), dtype=bool)
+    times, valid, period = cyclic_packettimes(timestamps)
+    half = period//2
+    limit = int(round(tolerance*100))
+
+    def cyclic(delta):
+        return (delta + half) % period - half
+
+    positions = np.arange(len(timestamps))
+
+    def nearest(mask, selected):
+        # the nearest 'mask' packets before and after each 'selected' packet
+        #   (and whether there is one; clipped to the packets)
+        before = np.maximum.accumulate(np.where(mask, positions, -1))[selected]
+        after = np.minimum.accumulate(np.where(mask, positions, len(timestamps))[::-1])[::-1][selected]
+        has_before, has_after = (before >= 0), (after < len(timestamps))
+        return (np.maximum(before, 0), np.minimum(after, len(timestamps) - 1), has_before, has_after)
+
+    # runs of valid packets, each following the last at the cadence
+    index = np.flatnonzero(valid)
+    if len(index) < 2:
+        return (repaired_timestamps, repaired)
+    steps = cyclic(np.diff(times[index]))
+    gaps = np.diff(index)
+    forward = steps >= 0
+    if not forward.any():
+        return (repaired_timestamps, repaired)
+    cadence = int(round(np.median(steps[forward]/gaps[forward].astype(np.float64))))
+    agrees = forward & (steps <= gaps*cadence + limit)
+    if not agrees.any():
+        return (repaired_timestamps, repaired)
+    run_lengths = np.diff(np.concatenate(([0], np.flatnonzero(~agrees) + 1, [len(index)])))
+    anchored = np.zeros(len(timestamps), dtype=bool)
+    anchored[index[np.repeat(run_lengths, run_lengths) >= min(min_run, run_lengths.max())]] = True
+    # (the mean cadence over the anchored runs, unrounded: a packet's time
+    #   may be extrapolated over many packets)
+    anchored_steps = agrees & anchored[index[1:]]
+    cadence = steps[anchored_steps].sum()/float(gaps[anchored_steps].sum())
+
+    # good packets: anchored, or else on the trend of the anchored packets around them
+    judged = np.flatnonzero(valid & ~anchored)
+    before, after, has_before, has_after = nearest(anchored, judged)
+    since = cyclic(times[judged] - times[before])
+    until = cyclic(times[after] - times[judged])
+    on_trend = (~has_before | (since >= 0)) & (~has_after | (until >= 0)) & (
+            (has_before & (since <= (judged - before)*cadence + limit))
+            | (has_after & (until <= (after - judged)*cadence + limit)))
+    good = anchored.copy()
+    good[judged[on_trend]] = True
+    suspect = np.flatnonzero(~good)
+    if len(suspect) == 0:
+        return (repaired_timestamps, repaired)
+
+    # the nearest good packets, before and after each suspect
+    before, after, has_before, has_after = nearest(good, suspect)
+    # target interval [low, low + span], and the cadence time (low + middle) within it
+    span = np.where(has_before & has_after, np.maximum(cyclic(times[after] - times[before]), 0), 0)
+    low = np.where(has_before, times[before] + np.where(has_after, 0, np.round((suspect - before)*cadence)),
+            times[after] - np.round((after - suspect)*cadence)).astype(np.int64)
+    middle = np.where(has_before & has_after, span*(suspect - before)//np.maximum(after - before, 1), 0)
+
+    # candidate shifts: each a range [start, start + width] of times
+    n_fields = timestamps.shape[1]
+    weights = np.array((0, 0, 360000, 6000, 100, 1)[-n_fields:])
+    maxima = np.array((12, 31, 23, 59, 59, 99)[-n_fields:])
+    best_distance = np.empty(len(suspect), dtype=np.int64)
+    best_distance.fill(limit + 1)
+    best_time = np.zeros(len(suspect), dtype=np.int64)
+    best_shift = np.zeros(len(suspect), dtype=np.int64)
+    for shift in range(max_shift + 1):
+        if shift == 0:
+            start, ok, width = times[suspect], valid[suspect], 0
+        else:
+            start, ok = cyclic_packettimes(shift_packettimes(timestamps[suspect], shift))[:2]
+            width = int((weights[-shift:]*maxima[-shift:]).sum())
+        first = cyclic(start - low)
+        distance = np.maximum(np.maximum(first - span, -(first + width)), 0)
+        better = ok & (distance < best_distance)
+        best_distance[better] = distance[better]
+        best_time[better] = (low + np.clip(middle, first, first + width))[better]
+        best_shift[better] = shift
+
+    # apply the shifts found
+    fixed = (best_shift > 0) & (best_distance <= limit)
+    repaired[suspect[fixed]] = True
+    fixed_times = best_time[fixed] % period
+    if n_fields == 4:
+        repaired_timestamps[suspect[fixed]] = np.column_stack((fixed_times//360000,
+                fixed_times//6000 % 60, fixed_times//100 % 60, fixed_times % 100))
+    else:
+        dates = (leap_year_ns + fixed_times*10**7).astype('datetime64[ns]')
+        months = dates.astype('datetime64[M]')
+        days = dates.astype('datetime64[D]')
+        seconds = fixed_times//100 % 86400
+        repaired_timestamps[suspect[fixed]] = np.column_stack((
+                months.astype(np.int64) % 12 + 1,
+                (days - months.astype('datetime64[D]')).astype(np.int64) + 1,
+                seconds//3600, seconds//60 % 60, seconds % 60, fixed_times % 100))
+    return (repaired_timestamps, repaired)
+
+
 def validate_packettime(packet_timestamp):
     """Check fields of packet_timestamp, return Boolean.
         
@@ -174,27 +415,207 @@ def validate_packettime(packet_timestamp):
         # raise an exception: packet_timestamp of unexpected size/length
         return False
 
+
+def validate_packettimes(timestamps):
+    """Check fields of an array of packet_timestamps, return a Boolean array.
+
+    Arguments:
+    timestamps -- an (n,6) array of (MM,DD,HH,mm,ss,ff) timestamps, or an
+                  (n,4) array of (HH,mm,ss,ff) timestamps
+
+    Return value:
+    Boolean array - True (fields valid) or False (out-of-bounds values), per
+    timestamp; the vectorized equivalent of validate_packettime()
+    """
+    timestamps = np.asarray(timestamps)
+    if (timestamps.ndim != 2) or (timestamps.shape[1] not in (4, 6)):
+        raise ValueError("validate_packettimes: expected an (n,4) or (n,6) array of timestamps")
+    timestamps = timestamps.astype(np.int64)
+    upper = np.array((12, 31, 23, 59, 59, 99)[-timestamps.shape[1]:])
+    lower = np.array((1, 1, 0, 0, 0, 0)[-timestamps.shape[1]:])
+    return ((timestamps >= lower) & (timestamps <= upper)).all(axis=1)
+
+
+def timestamp_columns(packet_timestamps):
+    """Return the (n,6) int64 array of a sequence of (MM,DD,HH,mm,ss,ff) timestamps.
+
+    Rows of timestamps which are not of length 6 are filled with -1
+    (and so fail validate_packettimes()).
+    """
+    packet_timestamps = list(packet_timestamps)
+    try:
+        columns = np.array(packet_timestamps, dtype=np.int64)
+    except (ValueError, TypeError):
+        columns = None
+    if (columns is None) or (columns.ndim != 2) or (columns.shape[1] != 6):
+        # (ragged, or otherwise not full timestamps: take row by row)
+        columns = np.empty((len(packet_timestamps), 6), dtype=np.int64)
+        columns.fill(-1)
+        for i, packet_timestamp in enumerate(packet_timestamps):
+            if len(packet_timestamp) == 6:
+                columns[i] = packet_timestamp
+    return columns
+
+
+def civil_epoch_ns(years, timestamps):
+    """Return the epoch nanoseconds of (MM,DD,HH,mm,ss,ff) timestamps, in the given years.
+
+    Arguments:
+    years -- int array of years (or a single year)
+    timestamps -- (n,6) int array of (MM,DD,HH,mm,ss,ff) timestamps, with
+                  fields in range (see validate_packettimes())
+
+    Return value:
+    (times, exists) -- int64 array of epoch nanoseconds, and a Boolean array,
+    False where DD is past the end of the month (e.g. Feb 30th)
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    months = (np.asarray(years, dtype=np.int64) - 1970)*12 + (timestamps[:,0] - 1)
+    month_start = months.astype('datetime64[M]').astype('datetime64[D]').view(np.int64)
+    month_end = (months + 1).astype('datetime64[M]').astype('datetime64[D]').view(np.int64)
+    days = month_start + (timestamps[:,1] - 1)
+    seconds = ((days*24 + timestamps[:,2])*60 + timestamps[:,3])*60 + timestamps[:,4]
+    return (seconds*10**9 + timestamps[:,5]*10**7, days < month_end)
+
+
+def reconstruct_packettimes(timestamps, year=None, reference=None, outlier_tolerance=3*86400,
+        repair=True):
+    """Reconstruct full epoch times for a pass of (MM,DD,HH,mm,ss,ff) packet timestamps.
+
+    Arguments:
+    timestamps -- (n,6) int array of (MM,DD,HH,mm,ss,ff) timestamps, in
+                  packet order (or a sequence of packet_timestamp tuples)
+
+    Keyword arguments:
+    year -- the year of the median valid timestamp (default None, inferred
+            from 'reference')
+    reference -- numpy.datetime64 (or datetime.datetime) before which no
+                 timestamp of the pass can fall, e.g. a date known to be
+                 within the year before the pass: the year is inferred as
+                 the first in which the median valid timestamp falls on or
+                 after it (default None: mission_start, with valid times
+                 given at least QoD 1, since a pass more than a year after
+                 launch is then put in the wrong year)
+    outlier_tolerance -- timestamps further than this from the median, in
+                         seconds, are given QoD 19 (default 3 days; None
+                         for no test)
+    repair -- Boolean argument; if True (default), byte-shifted timestamps
+              are first repaired by repair_packettimes()
+
+    Return value:
+    (times, quality) -- int64 array of epoch nanoseconds (NaT, where the
+    timestamp is invalid: times.view('datetime64[ns]')), and a uint8 array
+    of QoD codes (0; 1 where neither 'year' nor 'reference' is given; 3 for
+    a repaired timestamp; or 19 for an invalid or outlying timestamp)
+
+    Timestamps carry no year: between consecutive valid timestamps, a
+    step back of more than six months (e.g. December to January) is taken
+    as a new year, and a step forward of more than six months as a return
+    to the previous year.
+    """
+    timestamps = np.asarray(timestamps)
+    if (timestamps.dtype == object) or (timestamps.ndim != 2):
+        timestamps = timestamp_columns(timestamps)
+    timestamps = timestamps.astype(np.int64)
+    times = np.empty(len(timestamps), dtype=np.int64)
+    times.fill(nat_ns)
+    quality = np.zeros(len(timestamps), dtype=np.uint8)
+    if repair:
+        timestamps, repaired = repair_packettimes(timestamps)
+        quality[repaired] = 3
+
+    valid = validate_packettimes(timestamps)
+    # (dates past the end of the month, in any year: e.g. Feb 30th; Feb 29th is checked below)
+    valid[valid] = civil_epoch_ns(2000, timestamps[valid])[1]
+    valid_index = np.flatnonzero(valid)
+    if len(valid_index) == 0:
+        quality.fill(19)
+        return (times, quality)
+
+    # year rollover, between consecutive valid timestamps
+    months = timestamps[valid_index,0]
+    steps = np.diff(months)
+    rollover = np.concatenate(([0], np.cumsum((steps < -6).astype(np.int64) - (steps > 6))))
+
+    # the year of the median valid timestamp
+    median = len(valid_index)//2
+    # (a year inferred from launch alone is only plausible)
+    year_inferred = (year is None) and (reference is None)
+    if year is None:
+        reference = np.datetime64(mission_start if (reference is None) else reference, 'ns')
+        year = reference.astype('datetime64[Y]').astype(np.int64) + 1970
+        anchor = timestamps[valid_index[median:median + 1]]
+        for candidate in range(year, year + 8):
+            anchor_time, exists = civil_epoch_ns(candidate, anchor)
+            if exists[0] and (anchor_time[0] >= reference.view(np.int64)):
+                year = candidate
+                break
+    years = year + rollover - rollover[median]
+
+    valid_times, exists = civil_epoch_ns(years, timestamps[valid_index])
+    valid[valid_index[~exists]] = False
+    times[valid_index[exists]] = valid_times[exists]
+    if year_inferred:
+        quality[valid] = np.maximum(quality[valid], 1)
+    quality[~valid] = 19
+
+    if outlier_tolerance is not None:
+        inliers, outliers, estimate, deviation = mad_outliers(times, tolerance=outlier_tolerance,
+                valid=valid)
+        if estimate is not None:
+            outlying = valid & (np.abs(times - estimate) > outlier_tolerance*10**9)
+            quality[outlying] = 19
+    return (times, quality)
+
+
+def assign_packettimes(packet_list, **kwargs):
+    """Reconstruct the times of a pass of full-timestamped packets (e.g. HSK, STEIN).
+
+    Arguments:
+    packet_list -- list of packets, each with a (MM,DD,HH,mm,ss,ff) 'packet_timestamp'
+
+    Keyword arguments are those of reconstruct_packettimes().
+
+    Return value:
+    (times, quality), as for reconstruct_packettimes(); each packet's
+    'refined_timestamp' is set to its numpy.datetime64 time (NaT where
+    invalid), and 'clock_time_quality' to its QoD
+    """
+    times, quality = reconstruct_packettimes(
+            timestamp_columns(packet['packet_timestamp'] for packet in packet_list), **kwargs)
+    for packet, time, qod in zip(packet_list, times.view('datetime64[ns]'), quality.tolist()):
+        packet['refined_timestamp'] = time
+        packet['clock_time_quality'] = qod
+    return (times, quality)
+
+
+def packettimes(packet_list, **kwargs):
+    """Return the (times, quality) of a pass of full-timestamped packets.
+
+    Times already assigned by assign_packettimes() are shared; otherwise,
+    they are reconstructed (and assigned) with the given keyword arguments.
+    """
+    if (len(packet_list) > 0) and all((packet['refined_timestamp'] is not None)
+            and (packet['clock_time_quality'] is not None) for packet in packet_list):
+        times = np.array([packet['refined_timestamp'] for packet in packet_list],
+                dtype='datetime64[ns]').view(np.int64)
+        quality = np.array([packet['clock_time_quality'] for packet in packet_list], dtype=np.uint8)
+        return (times, quality)
+    return assign_packettimes(packet_list, **kwargs)
+
+
 def MAD(a, c=0.6745, axis=0):
     """Median Absolute Deviation along given axis of an array:
 
     median(abs(a - median(a))) / c
-    """
 
-    good = (a==a)
+    NaN values are ignored.
+    """
     a = np.asarray(a, np.float64)
     if a.ndim == 1:
-        d = np.median(a[good])
-        m = np.median(np.fabs(a[good] - d) / c)
-    else:
-        d = np.median(a[good], axis=axis)
-        # I don't want the array to change so I have to copy it?
-        if axis > 0:
-            aswp = swapaxes(a[good],0,axis)
-        else:            
-            aswp = a[good]
-            m = np.median(np.fabs(aswp - d) / c, axis=0)
-
-    return m
+        return median_mad(a, c=c)[1]
+    d = np.nanmedian(a, axis=axis)
+    return np.nanmedian(np.fabs(a - np.expand_dims(d, axis)) / c, axis=axis)
 
 
 def nanmedian(arr):
@@ -206,19 +627,13 @@ def nanmedian(arr):
 def calc_dt_median_mad(dt_subset, epoch=datetime.datetime(1970,1,1, tzinfo=UTC())):
     # calculate median and MAD (median-adjusted-deviation) for list of datetime objects 
 
-    # generate list of "seconds elapsed" relative to specified epoch
-    deltas = [(dt-epoch).total_seconds() for dt in dt_subset]
-    print(len(dt_subset), deltas)
+    # generate array of "seconds elapsed" relative to specified epoch
+    deltas = np.array([(dt-epoch).total_seconds() for dt in dt_subset])
 
     # calculate median and MAD
-    estimate = nanmedian(np.array(deltas))        # (in seconds elapsed since EPOCH)
-    print("estimate", estimate)
-    deviation = MAD(np.array(deltas))             # (in seconds)
-    #print("deltas", deltas)
-    #print("deviation2", deviation)
+    (estimate, deviation) = median_mad(deltas)  # (in seconds elapsed since EPOCH; in seconds)
     # make them standard datetime objects again 
     ret_estimate = datetime.timedelta(seconds=estimate)
     ret_deviation = datetime.timedelta(seconds=deviation)
 
     return (ret_estimate+epoch, ret_deviation)
-
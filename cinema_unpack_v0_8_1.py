@@ -26,12 +26,19 @@
 #
 
 import array
+import collections
 import csv
-import hashlib
-import datetime
 import gzip
+import hashlib
+import mmap
+import multiprocessing
 import os
+import struct
+import numpy as np
 import progressbar
+import cinema_provenance_v0_1_0 as provenance
+import cinema_gzindex_v0_1_0 as gzindex
+import cinema_rscode_v0_1_0 as rscode
 import stein_unpack_v0_8_0 as stein
 import magic_unpack_v0_8_0 as magic
 import hsk_unpack_v0_8_0 as hsk
@@ -53,7 +60,7 @@ apid241 = 0x0a41    # APID 241 (MAGIC Packet)
 
 # parse frame of hex packet_bytes
 def parse_frame(packet_bytes, ccsds_size=None):
-    """Parse a packet of CINEMA data, returning a dictionary structure.
+    """Parse a packet of CINEMA data, returning a (dictionary-like) packet record.
 
     Arguments:
     packet_bytes -- iterable of bytes comprising a CINEMA data packet
@@ -153,253 +160,984 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False)
         return 0
 
 
+# GSE hex dumps are parsed 'gse_chunk_size' bytes of text (whole lines) at a time
+gse_chunk_size = 1 << 23
+
+def _build_hexdump_tables():
+    # characters of a GSE hex dump (e.g. "0xAFL 0x5L ..."), by class:
+    #   value of each hex digit; hex digits; every character of the fast form
+    hex_values = np.zeros(256, dtype=np.uint8)
+    is_hexdigit = np.zeros(256, dtype=bool)
+    for char in "0123456789abcdefABCDEF":
+        hex_values[ord(char)] = int(char, 16)
+        is_hexdigit[ord(char)] = True
+    is_hexdump = is_hexdigit.copy()
+    is_hexdump[[ord(char) for char in "xXL \t\n"]] = True
+    return (hex_values, is_hexdigit, is_hexdump)
+
+_hex_values, _is_hexdigit, _is_hexdump = _build_hexdump_tables()
+
+
+def _hexdump_rows_csv(lines, dialect="whitespace"):
+    # rows of bytes, one per (non-empty) record, read as by the CSV reader
+    rows = []
+    for row in csv.reader(lines, dialect=dialect):
+        # FSW-generated logs consist of hexbytes printed with 
+        #   ASCII characters (e.g. 0xAFL)
+        if len(row) > 0:    # actual data; begin parsing
+            del row[-1]         # delete a spurious final entry
+            # convert ASCII hexbytes to real hexbytes
+            rows.append(np.array([int(hexbyte.rstrip('L'),16) for hexbyte in row], dtype=np.uint8))
+        # else: an empty row; do nothing
+    return rows
+
+
+def hexdump_rows(text, dialect="whitespace"):
+    """Convert lines of a GSE hex dump into rows of bytes, one per non-empty line.
+
+    Arguments:
+    text -- string of complete lines of hex bytes (e.g. "0xAFL 0x5L ... \\n"),
+            with universal newlines
+
+    Keyword arguments:
+    dialect -- CSV dialect of the lines (default "whitespace")
+
+    Return value:
+    list of numpy.uint8 arrays
+
+    Rows are read just as by the CSV reader: the final entry of each record
+    is deleted (an empty entry, where a line ends with a delimiter).  For the
+    "whitespace" dialect, the whole text is converted at once with numpy:
+    "0x" and "L" decorations are blanked, and the one or two hex digits of
+    each byte located and combined.  Other dialects, and text that does not
+    take this simple form, are read with the CSV reader.
+    """
+    if (dialect != "whitespace"):
+        return _hexdump_rows_csv(text.splitlines(), dialect=dialect)
+    if not text.endswith('\n'):
+        text += '\n'
+    chars = np.frombuffer(text, dtype=np.uint8)
+    if not _is_hexdump[chars].all():
+        return _hexdump_rows_csv(text.splitlines(), dialect=dialect)
+
+    # blank decorations: "0x" prefixes and "L" suffixes
+    is_digit = _is_hexdigit[chars]
+    prefix = np.flatnonzero((chars == ord('x')) | (chars == ord('X')))
+    is_digit[prefix] = False
+    is_digit[prefix[(prefix > 0)] - 1] = False
+
+    # bytes: runs of one or two hex digits
+    edges = np.diff(np.concatenate(([0], is_digit.view(np.int8), [0])))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    widths = stops - starts
+    if (len(widths) > 0) and (widths.max() > 2):
+        return _hexdump_rows_csv(text.splitlines(), dialect=dialect)
+    digits = _hex_values[chars]
+    values = digits[stops - 1]
+    values[widths == 2] |= digits[starts[widths == 2]] << 4
+
+    # records: each non-empty line, without its final entry (the last byte,
+    #   unless the line ends with a delimiter)
+    newlines = np.flatnonzero(chars == ord('\n'))
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    is_record = (newlines > line_starts)
+    line_of = np.searchsorted(newlines, starts)
+    counts = np.bincount(line_of, minlength=len(newlines))
+    is_final = is_record & (chars[newlines - 1] != ord(' '))
+    if (counts[is_final] == 0).any():
+        return _hexdump_rows_csv(text.splitlines(), dialect=dialect)
+    if not is_record.any():
+        return []
+    keep = np.ones(len(values), dtype=bool)
+    keep[(np.cumsum(counts) - 1)[is_final]] = False
+    counts[is_final] -= 1
+    return np.split(values[keep], np.cumsum(counts[is_record])[:-1])
+
+
+def parse_packet_rows(rows):
+    """Parse rows of packet bytes (as from GSE hex dumps), returning a list of packets.
+
+    Arguments:
+    rows -- list of numpy.uint8 arrays, each of the bytes of one packet
+
+    Return value:
+    list of parsed packets (or None), as from parse_frame() for each row
+
+    Rows of 518 bytes (with CCSDS header) are grouped by APID, and rows of
+    512 bytes (CCSDS header stripped by GSEOS) by packet header, and each
+    group parsed as a single batch, by the decoders of 'batch_parsers'.
+    """
+    packets = [None]*len(rows)
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    for i in np.flatnonzero((lengths != 518) & (lengths != 512)):
+        # (not of a packet size: raises ValueError, as parse_frame())
+        packets[i] = parse_frame(array.array('B', rows[i].tostring()))
+    for packet_size in (518, 512):
+        index = np.flatnonzero(lengths == packet_size)
+        if (len(index) == 0):
+            continue
+        group = np.vstack([rows[i] for i in index])
+        if (packet_size == 518):
+            # FSW hexbytes: examine APID (and where applicable, packet_header)
+            apid = (group[:,0].astype(np.uint16) << 8) | group[:,1]
+            for packet_apid, (packet_header, parse_frames) in batch_parsers.items():
+                is_match = (apid == packet_apid)
+                if packet_header is not None:
+                    is_match &= (group[:,6] == packet_header)
+                if is_match.any():
+                    parsed = parse_frames(group[is_match], includes_ccsds=True)
+                    for i, packet in zip(index[is_match], parsed):
+                        packets[i] = packet
+        else:
+            # GSE hexbytes: examine the packet_header
+            for packet_header, parse_frames in ((0xAF, stein.parse_stein_frames),
+                    (0xBE, magic.parse_magic_frames)):
+                is_match = (group[:,0] == packet_header)
+                if is_match.any():
+                    parsed = parse_frames(group[is_match], includes_ccsds=False)
+                    for i, packet in zip(index[is_match], parsed):
+                        packets[i] = packet
+            for i in index[(group[:,0] != 0xAF) & (group[:,0] != 0xBE)]:
+                # complain loudly
+                print("\nInvalid packet header: {}".format(hex(int(rows[i][0]))))
+    return packets
+
+
+def _read_gse_range(args):
+    # parse the packets of a byte range (whole lines) of a GSE hex dump,
+    #   'gse_chunk_size' bytes at a time (module-level, for multiprocessing.Pool)
+    filename, start, stop, dialect = args
+    packets = []
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        carry = ""
+        while True:
+            size = gse_chunk_size if (stop is None) else min(gse_chunk_size, stop - f.tell())
+            chunk = f.read(size) if (size > 0) else ""
+            # (universal newlines, as 'rU' mode)
+            text = (carry + chunk).replace('\r\n', '\n').replace('\r', '\n')
+            if chunk:
+                cut = text.rfind('\n') + 1
+                text, carry = text[:cut], text[cut:]
+            if text:
+                packets.extend(parse_packet_rows(hexdump_rows(text, dialect=dialect)))
+            if not chunk:
+                break
+    return packets
+
+
+def gse_ranges(filename, n_ranges):
+    """Split a GSE hex dump into (at most) 'n_ranges' byte ranges of whole lines.
+
+    Return value:
+    list of (start, stop) tuples; the final range has a 'stop' of None (EOF)
+    """
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, n_ranges):
+            f.seek(max((size*i) // n_ranges, bounds[-1]))
+            if (f.tell() > 0):
+                f.seek(-1, os.SEEK_CUR)
+                f.readline()        # (to the start of the next line)
+            if (f.tell() < size) and (f.tell() > bounds[-1]):
+                bounds.append(f.tell())
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
 # procedure to read in and parse ASCII text dumps of CINEMA
 #  flight software output bytes
-def read_gse_hexbytes(filename=None, dialect="whitespace"):
-    
+def read_gse_hexbytes(filename=None, dialect="whitespace", processes=None):
+    """Read and parse a GSE (ASCII) hex dump of CINEMA packets, one packet per line.
+
+    Arguments:
+    filename -- path to the hex dump (e.g. lines of "0xAFL 0x5L ...")
+
+    Keyword arguments:
+    dialect -- CSV dialect of the lines (default "whitespace")
+    processes -- if more than 1, the dump is split into byte ranges of
+                 whole lines, parsed in parallel by this many worker
+                 processes (default None, parse serially)
+
+    Return value:
+    list of parsed packets (or None), in file order, as from parse_frame()
+
+    The dump is converted a chunk of lines at a time (see hexdump_rows),
+    and its packets parsed in batches (see parse_packet_rows).
+    """
     # do we have a valid filename?
     try:
-        f = open(filename, 'rU')
+        f = open(filename, 'rb')
     except IOError as errno:
         print("read_fsw_hexbytes: Invalid filename or path")
         print("I/O error({0}):".format(errno))
     else:
-        # use the CSV reader to simplify the process
-        reader = csv.reader(f,dialect=dialect)
-       
-        packets = []
-        # examine and parse each record
-        for row in reader:
-            # FSW-generated logs consist of hexbytes printed with 
-            #   ASCII characters (e.g. 0xAFL)
-            hexbyte_list = array.array('B')
-            if len(row) > 0:    # actual data; begin parsing
-                del row[-1]         # delete a spurious final entry
-                for hexbyte in row:
-                    # convert ASCII hexbytes to real hexbytes
-                    hexbyte_list.append(int(hexbyte.rstrip('L'),16))
-                # parse the frame in its entirety
-                packets.append(parse_frame(hexbyte_list)) 
-            # else: an empty row; do nothing
-    finally:
         f.close()
-    return packets
+        if (processes is None) or (processes <= 1):
+            packets = _read_gse_range((filename, 0, None, dialect))
+            # (MAGIC packets are numbered per batch: number them across the dump)
+            magic.number_packets(packets)
+            return packets
 
+        jobs = [(filename, start, stop, dialect)
+                for start, stop in gse_ranges(filename, 4*processes)]
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_read_gse_range, jobs, chunksize=1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        packets = []
+        for range_packets in results:
+            packets.extend(range_packets)
+        magic.number_packets(packets)
+        return packets
 
 
-def read_raw_hexbytes(filename=None):
-    # Define CINEMA/CCSDS telemetry frame constants
-    # master frame size [including SMEX header]
-    tm_frame_size = 1289        # (bytes)
-   
+
+# Define CINEMA/CCSDS telemetry frame constants
+tm_frame_size = 1289        # master frame size [including SMEX header] (bytes)
+
+# BGS master frame layout (bytes):
+#   SMEX header (10), ASM (4), transfer frame header (13),
+#   packet 1 (518), packet 2 (518), overflow packet (62), OCF (4), RS CODE (160)
+frame_spacing = [0, 10, 4, 13, 518, 518, 62, 4, 160]
+frame_key = [sum(frame_spacing[0:i+1]) for i in range(len(frame_spacing))]
+
+# packet categories, in the order returned by read_raw_hexbytes()
+packet_categories = ('recentHSK', 'recordHSK', 'overflow', 'science', 'other')
+
+# sub-fields of a master frame, in frame order
+MasterFrame = collections.namedtuple('MasterFrame', ('smex_header', 'asm', 'tf_header',
+        'packet_1', 'packet_2', 'packet_3', 'ocf', 'rs_code'))
+
+
+def split_master_frame(frame):
+    """Split a master frame into its sub-fields, returning a MasterFrame.
+
+    Slices of a numpy (or memoryview) frame are views, so no bytes are copied.
+    """
+    key = frame_key
+    return MasterFrame(*[frame[key[el]:key[el+1]] for el in range(len(key)-1)])
+
+
+def open_pass_file(filename, fileobj=None):
+    """Open a BGS pass file for binary reading, transparently handling GZIP archives.
+
+    Arguments:
+    filename -- path to a BGS pass file (optionally GZIP compressed)
+
+    Keyword arguments:
+    fileobj -- an already opened (raw) file object for 'filename' (default None)
+    """
     # transparent GZIP handling
     suffix = 'gz'
     filetype = filename.split('.')[-1]
     if (filetype==suffix):
-        fileopen = gzip.open
+        return gzip.GzipFile(filename, 'rb', fileobj=fileobj)
+    elif (fileobj is not None):
+        return fileobj
     else:
-        fileopen = open
-
-    # read-in of binary data
-    raw_frames = []     # list of telemetry master frames
-    bytedump = array.array('B')
-    with fileopen(filename,'rb') as f:
-        chunk = f.read(tm_frame_size)
-        while chunk:
-            bytedump = bytedump*0       # clear contents
-            bytedump.fromstring(chunk)  # convert read() result (a string) to numerical bytes
-            raw_frames.append(bytedump) # store
-            chunk = f.read(tm_frame_size)
-        # Acknowledge EOF by terminating read
-        #print("Acknowledged EOF (extra bytes: {0})".format(len(chunk)))
-
-    # define bit patterns
-    #asm = 0x1acffc1d    # CCSDS "Attached Synchronization Marker" (ASM)
-    #apid140 = 0x0940    # APID 140 (STEIN Sweep Table)
-    #apid150 = 0x0950    # APID 150 (ACS Ephemeris Table)
-    #apid160 = 0x1960    # APID 160 (Immediate Command Table)
-    #apid161 = 0x1961    # APID 161 (Delayed Command Table)
-    #apid170 = 0x0970    # APID 170 (Upload MAG Calibration Matrix)
-    #apid261 = 0x1a61    # APID 261 (Memory Load)
-    #apid262 = 0x0a62    # APID 262 (Memory Dump Packet)
-    #apid264 = 0x0a64    # APID 264 (Recorded HSK)
-    #apid265 = 0x0a65    # APID 265 (Overflow Packet)
-    #apid364 = 0x0b64    # APID 364 (Recent HSK)
-    #apid240 = 0x0a40    # APID 240 (STEIN Packet)
-    #apid241 = 0x0a41    # APID 241 (MAGIC Packet)
-    apids = [apid140, apid150, apid160, apid161, apid170, \
-            apid261, apid262, apid264, apid265, \
-            apid364, apid240, apid241]
-    science = [apid240, apid241]
-    recentHSK = apid364
-    recordHSK = apid264
-    overflow = apid265
-    supported = [apid240, apid241, apid264, apid364]
-
-    # BGS only passes complete frames, so pass data is always 
-    #   frame-aligned.  Begin extraction/parsing
-
-    # As each master frame is unpacked:
+        return open(filename,'rb')
+
+
+# NumPy description of the master frame layout (see 'frame_spacing')
+master_frame_dtype = np.dtype([
+        ('smex_header', np.uint8, (10,)),   # SMEX header
+        ('asm', '>u4'),                     # CCSDS "Attached Synchronization Marker"
+        ('tf_header', np.uint8, (13,)),     # transfer frame header
+        ('packet_1', np.uint8, (518,)),     # first data packet
+        ('packet_2', np.uint8, (518,)),     # second data packet
+        ('packet_3', np.uint8, (62,)),      # overflow packet
+        ('ocf', np.uint8, (4,)),            # OCF sequence
+        ('rs_code', np.uint8, (160,))])     # RS CODE sequence
+
+# packet slots of a master frame, and the APIDs expected in each
+packet_slots = ('packet_1', 'packet_2', 'packet_3')
+slot_apids = {apid240:(0,1), apid241:(0,1), apid264:(0,1), apid364:(0,1), apid265:(2,)}
+
+# packet category of each expected APID
+apid_categories = {apid240:'science', apid241:'science', apid264:'recordHSK',
+        apid364:'recentHSK', apid265:'overflow'}
+
+# master frames per block, when streaming from GZIP archives
+block_frames = 1024
+
+# Demultiplexed view of a block of master frames:
+#   asm_valid -- (n_frames,) Boolean array, True where the ASM is correct
+#   apid -- (n_frames, 3) array of the APIDs in packet slots 1/2/3
+#   index -- dictionary of (frame-order) flat packet indices, keyed by APID;
+#            frame = index // 3, slot = index % 3
+#   unexpected -- flat packet indices of unexpected APIDs
+FrameDemux = collections.namedtuple('FrameDemux', ('asm_valid', 'apid', 'index', 'unexpected'))
+
+
+def demux_master_frames(frames):
+    """Validate and demultiplex a block of master frames, returning a FrameDemux.
+
+    Arguments:
+    frames -- (n_frames,) record array of dtype 'master_frame_dtype'
+
+    Every ASM is checked against 0x1acffc1d, and the APIDs of packet slots
+    1/2/3 are indexed, in a handful of array operations.
+    """
+    n_frames = len(frames)
+    asm_valid = (frames['asm'] == asm)
+
+    # APID of each packet slot (first two bytes of the CCSDS header)
+    apid = np.empty((n_frames, len(packet_slots)), dtype=np.uint16)
+    for k, slot in enumerate(packet_slots):
+        header = frames[slot]
+        apid[:,k] = (header[:,0].astype(np.uint16) << 8) | header[:,1]
+
+    # flat packet indices (frame-order) for each APID, in its expected slots
+    flat_apid = apid.ravel()
+    flat_slot = np.tile(np.arange(len(packet_slots)), n_frames)
+    expected = np.zeros(flat_apid.shape, dtype=bool)
+    index = {}
+    for packet_apid, slots in slot_apids.items():
+        hits = (flat_apid == packet_apid) & np.in1d(flat_slot, slots)
+        index[packet_apid] = np.flatnonzero(hits)
+        expected |= hits
+    unexpected = np.flatnonzero(~expected)
+
+    return FrameDemux(asm_valid, apid, index, unexpected)
+
+
+asm_bytes = struct.pack('>I', asm)    # ASM, as it appears in the byte stream
+asm_offset = frame_key[1]               # offset (BYTES) of the ASM in a master frame
+sync_frames_max = 4096                  # frames checked at once, when in sync
+
+
+def sync_frames(data, begin=0, final=True, stats=None):
+    """Locate the master frames in a buffer from their ASMs, realigning after slips.
+
+    Arguments:
+    data -- buffer of pass bytes (bytes, or an mmap; anything with find() and slices)
+
+    Keyword arguments:
+    begin -- offset in 'data' at which to begin (default 0)
+    final -- Boolean argument; if True (default), 'data' runs to the end of
+             the pass.  Otherwise, frames are only located where the following
+             ASM can be seen; the remainder is left for the next call.
+    stats -- dictionary in which to accumulate a 'skipped_bytes' count, and
+             a list of 'slips' as (offset in 'data', bytes skipped) tuples
+             (default None)
+
+    Return value:
+    (starts, resume) -- a numpy.int64 array of the offsets of the frames in
+    'data', and the offset from which to resume (the unused remainder)
+
+    Frames follow one another in 1289-byte steps while the ASM (0x1acffc1d)
+    is found where expected.  Otherwise, the next ASM is searched for with
+    find(): a frame cut short by the following ASM (dropped bytes) is
+    skipped as damaged, as are any bytes between a frame and the following
+    ASM (inserted bytes).  Where that gap is a whole number of frames,
+    these are kept as frames with an invalid ASM, just as for a perfectly
+    aligned pass.  Only when every ASM is where expected is the search
+    done a block at a time, with numpy.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('skipped_bytes', 0)
+    stats.setdefault('slips', [])
+    size = tm_frame_size
+    n = len(data)
+    starts = []
+
+    def is_asm(pos):
+        return data[pos+asm_offset:pos+asm_offset+4] == asm_bytes
+
+    def skip(pos, n_bytes):
+        stats['skipped_bytes'] += n_bytes
+        stats['slips'].append((pos, n_bytes))
+
+    def bridge(pos, next_pos):
+        # the bytes between frames: whole frames (with invalid ASMs), or skipped
+        if ((next_pos - pos) % size == 0):
+            starts.extend(range(pos, next_pos, size))
+        elif (next_pos > pos):
+            skip(pos, next_pos - pos)
+
+    # locate the first frame
+    pos = begin
+    if (n - pos >= size) and not is_asm(pos):
+        hit = data.find(asm_bytes, pos + asm_offset)
+        if (hit >= 0):
+            bridge(pos, hit - asm_offset)
+            pos = hit - asm_offset
+        elif not final:
+            # (no ASM yet in view; keep whole frames, but hold the rest back)
+            m = max((n - pos) // size - 1, 0)
+            starts.extend(range(pos, pos + m*size, size))
+            return (np.array(starts, dtype=np.int64), pos + m*size)
+
+    while True:
+        end = pos + size
+        if (end > n):
+            break
+        # in sync: check the ASMs of a whole block of frames at once
+        m = min((n - pos) // size, sync_frames_max)
+        if (m > 1):
+            grid = np.frombuffer(data, dtype=np.uint8, count=m*size, offset=pos).reshape(m, size)
+            asm_valid = (grid[:,asm_offset:asm_offset+4] == np.frombuffer(asm_bytes, dtype=np.uint8)).all(axis=1)
+            k = m if asm_valid.all() else int(np.argmin(asm_valid))
+            if (k > 1):
+                # every frame but the last is followed by a valid ASM
+                starts.extend(range(pos, pos + (k-1)*size, size))
+                pos += (k-1)*size
+                end = pos + size
+        # the next frame is where expected
+        if (end + asm_offset + 4 <= n) and is_asm(end):
+            starts.append(pos)
+            pos = end
+            continue
+        if (not final) and (end + asm_offset + 4 > n):
+            break
+        hit = data.find(asm_bytes, pos + asm_offset + 1)
+        if (hit < 0):
+            # no further ASM: keep to the frame grid
+            if (not final) and (n - pos < 2*size + asm_offset + 4):
+                break
+            starts.append(pos)
+            pos = end
+            continue
+        next_pos = hit - asm_offset
+        if (next_pos < end):
+            # the frame is cut short by the following ASM: damaged
+            skip(pos, next_pos - pos)
+        else:
+            starts.append(pos)
+            bridge(end, next_pos)
+        pos = next_pos
+    return (np.array(starts, dtype=np.int64), pos)
+
+
+def iter_frame_blocks(filename, source=None, stats=None, frame_range=None):
+    """Generate blocks of master frames from a BGS pass file, as record arrays.
+
+    Arguments:
+    filename -- path to a BGS pass file (optionally GZIP compressed)
+
+    Keyword arguments:
+    source -- a provenance.Provenance record for 'filename' (default None);
+              the file is hashed as it is read, and the record sealed at EOF
+    stats -- dictionary in which to accumulate an 'extra_bytes' count of
+             trailing bytes not forming a complete frame, and the
+             'skipped_bytes' and 'slips' of sync_frames() (default None)
+    frame_range -- (start, stop) tuple, limiting the frames generated to
+                   frame_ids start <= frame_id < stop; a 'stop' of None
+                   continues to EOF (default None, every frame).  The
+                   source is only hashed (and sealed) when every frame is read.
+
+    Yields (frame_ids, frames) tuples, where 'frames' is a record array of
+    dtype 'master_frame_dtype', and 'frame_ids' a numpy.int64 array giving
+    each frame's byte offset in the pass, divided by 1289 (the frame number,
+    for a perfectly aligned pass).  Frames are located by sync_frames(), so
+    framing is recovered after slipped or damaged frames.
+
+    Uncompressed files are memory-mapped; where the pass is aligned, it is
+    viewed as a (n_frames,) record array, without copying (Python 2 mmap
+    objects do not export the buffer interface needed by memoryview; numpy
+    views are the zero-copy equivalent), and yielded in slices of (at most)
+    'block_frames' frames.  GZIP archives are read from disk
+    'block_frames' frames at a time; where an archive has a checkpoint
+    index (see cinema_gzindex), a 'frame_range' is read from the nearest
+    restart point, rather than from the start.  Either way, the frames of a
+    block are bounded by 'block_frames', and so memory use does not grow
+    with the length of the pass (but for the frame offsets, 8 bytes a frame,
+    of an uncompressed pass).
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('extra_bytes', 0)
+    stats.setdefault('skipped_bytes', 0)
+    stats.setdefault('slips', [])
+    if frame_range is None:
+        start, stop = (0, None)
+    else:
+        start, stop = frame_range
+        source = None
+    to_eof = (stop is None)
+    # (synchronize from a little before 'start', to fall in step with the
+    #   framing found when reading from the start of the pass)
+    begin = max(start - 2, 0)*tm_frame_size
+
+    def select(starts, base, data, sync_stats, final):
+        # frames (and slips) within the frame range, from one sync_frames() call
+        frame_ids = (starts + base) // tm_frame_size
+        keep = (frame_ids >= start)
+        if not to_eof:
+            keep &= (frame_ids < stop)
+        for (offset, n_bytes) in sync_stats['slips']:
+            if ((offset + base) >= start*tm_frame_size) and (to_eof or (offset + base) < stop*tm_frame_size):
+                stats['skipped_bytes'] += n_bytes
+                stats['slips'].append((offset + base, n_bytes))
+        starts, frame_ids = starts[keep], frame_ids[keep]
+        if (len(starts) == 0):
+            return
+        if (starts[-1] - starts[0] == (len(starts) - 1)*tm_frame_size):
+            # contiguous (aligned) frames: a view, without copying, in
+            #   'block_frames' slices (so that consumers work block by block)
+            frames = np.frombuffer(data, dtype=master_frame_dtype, count=len(starts),
+                    offset=int(starts[0]))
+            for i in range(0, len(starts), block_frames):
+                yield (frame_ids[i:i+block_frames], frames[i:i+block_frames])
+            return
+        raw = np.frombuffer(data, dtype=np.uint8)
+        for i in range(0, len(starts), block_frames):
+            block = starts[i:i+block_frames]
+            frames = raw[block[:,np.newaxis] + np.arange(tm_frame_size)]
+            yield (frame_ids[i:i+block_frames], frames.view(master_frame_dtype).reshape(len(block)))
+
+    if (filename.split('.')[-1] != 'gz'):
+        with open(filename,'rb') as f:
+            if (os.fstat(f.fileno()).st_size == 0):
+                if (source is not None) and (not source.sealed):
+                    source.seal(hashlib.sha1().hexdigest())
+                return
+            # NOTE: the map is closed once the last view of it is released
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        sync_stats = {}
+        starts, resume = sync_frames(mm, begin=min(begin, len(mm)), stats=sync_stats)
+        if to_eof:
+            stats['extra_bytes'] += len(mm) - resume
+        for block in select(starts, 0, mm, sync_stats, True):
+            yield block
+        if (source is not None) and (not source.sealed):
+            source.seal(hashlib.sha1(mm).hexdigest())
+        return
+
+    # with a checkpoint index beside the archive, begin decompression at
+    #   the nearest restart point before frame 'start'
+    index = None
+    if (begin > 0) and (gzindex.libz is not None):
+        index = gzindex.load_index(filename)
+    if (index is not None):
+        raw = f = gzindex.GzipIndexedFile(filename, index)
+        f.seek(begin)
+    else:
+        raw = open(filename,'rb')
+        if (source is not None):
+            raw = provenance.HashingFile(raw)
+        f = open_pass_file(filename, fileobj=raw)
+    try:
+        base = f.tell()         # pass offset of data[0]
+        data = b""
+        while True:
+            chunk = f.read(block_frames*tm_frame_size)
+            final = (len(chunk) < block_frames*tm_frame_size)
+            data = data[resume:] + chunk if data else chunk
+            sync_stats = {}
+            starts, resume = sync_frames(data, begin=min(max(begin - base, 0), len(data)),
+                    final=final, stats=sync_stats)
+            # (a view of 'data', the read() result, is yielded; no copy is made)
+            for block in select(starts, base, data, sync_stats, final):
+                yield block
+            if final:
+                if to_eof:
+                    stats['extra_bytes'] += len(data) - resume
+                break
+            base += resume
+            if (not to_eof) and (base >= stop*tm_frame_size):
+                break
+        # Acknowledge EOF by terminating read, and complete the source hash
+        if (source is not None) and (not source.sealed) and final:
+            source.seal(raw.finish())
+    finally:
+        f.close()
+        raw.close()
+
+
+def iter_master_frames(filename, source=None):
+    """Generate the master telemetry frames of a BGS pass file, one at a time.
+
+    Arguments:
+    filename -- path to a BGS pass file (optionally GZIP compressed)
+
+    Keyword arguments:
+    source -- a provenance.Provenance record for 'filename' (default None);
+              the file is hashed as it is read, and the record sealed at EOF
+
+    Yields (frame_id, frame) tuples, where 'frame' is a numpy.uint8 view
+    (see iter_frame_blocks and split_master_frame).
+    """
+    for frame_ids, frames in iter_frame_blocks(filename, source=source):
+        raw_frames = frames.view(np.uint8).reshape(len(frames), tm_frame_size)
+        for i in range(len(frames)):
+            yield (int(frame_ids[i]), raw_frames[i])
+
+
+# packets parsed in batches, per block of master frames:
+#   {APID: (packet header, batch parser)}; HSK packets have no packet header
+batch_parsers = {apid240:(0xAF, stein.parse_stein_frames),
+        apid241:(0xBE, magic.parse_magic_frames),
+        apid264:(None, hsk.parse_hsk_frames),
+        apid364:(None, hsk.parse_hsk_frames)}
+
+
+def parse_packet_batch(slot_packets, index, packet_apid, **kwargs):
+    """Parse all packets of one APID in a block of master frames, as a single batch.
+
+    Arguments:
+    slot_packets -- list of the (n_frames, 518) packet_1 and packet_2 arrays
+                    of the block (any further slots are ignored)
+    index -- flat (frame*3 + slot) indices of the APID's packets, as
+             from demux_master_frames() (or None)
+    packet_apid -- APID of the packets, one of the keys of 'batch_parsers'
+    Further keyword arguments are passed to the batch parser (e.g. the
+    'first_packet' of magic.parse_magic_frames()).
+
+    Return value:
+    dictionary of parsed packets (or None, where the packet header does not
+    match, as parse_frame()), keyed by flat index
+    """
+    if (index is None) or (len(index) == 0):
+        return {}
+    packet_header, parse_frames = batch_parsers[packet_apid]
+    index = index[(index % len(packet_slots)) < 2]
+    packets = np.empty((len(index), 518), dtype=np.uint8)
+    for k in range(2):
+        in_slot = (index % len(packet_slots)) == k
+        packets[in_slot] = slot_packets[k][index[in_slot] // len(packet_slots)]
+    if packet_header is None:
+        is_match = np.ones(len(packets), dtype=bool)
+    else:
+        is_match = (packets[:,6] == packet_header)  # packet header, following the CCSDS header
+
+    batch = dict.fromkeys(index.tolist())
+    parsed = parse_frames(packets[is_match], includes_ccsds=True, **kwargs)
+    batch.update(zip(index[is_match].tolist(), parsed))
+    return batch
+
+
+def iter_packets(filename, stats=None, frame_range=None, source=None, rs_correct=False):
+    """Generate the demultiplexed packets of a BGS pass file, one at a time.
+
+    Arguments:
+    filename -- path to a BGS pass file (optionally GZIP compressed)
+
+    Keyword arguments:
+    stats -- dictionary in which to accumulate 'frames', 'asm_misses',
+             'apid_misses', 'extra_bytes' and 'skipped_bytes' counts, a list
+             of the 'miss_frames' with an invalid ASM or unexpected APID,
+             and of the framing 'slips' (see sync_frames); also counts of
+             'rs_corrected' and 'rs_failed' frames, and a list of the
+             'rs_frames' left with RS errors (default None)
+    frame_range -- (start, stop) tuple of frame_ids, as for iter_frame_blocks()
+                   (default None, every frame)
+    source -- the provenance.Provenance record to attach to parsed packets
+              (default None, a new record for 'filename'); with a
+              'frame_range', it is the caller's job to seal the record
+    rs_correct -- Boolean argument; if True, frames with correctable RS
+                  errors are corrected before demultiplexing (default
+                  False, check only)
+
+    Yields (frame_id, category, packet) tuples in frame order, where
+    'category' is one of 'packet_categories'.  Supported packets are
+    parsed into dictionaries; overflow and unexpected packets are passed
+    along as ([transfer frame header], packet) tuples.
+
+    Every parsed packet refers to a single provenance.Provenance record
+    for the file (packet['provenance']), whose SHA1 hash is filled in
+    once the last frame has been read.
+
+    MAGIC samples are numbered (their PACKET field) by the running count
+    of MAGIC packets, from the first frame of the pass (or 'frame_range').
+
+    Every frame is Reed-Solomon checked (see cinema_rscode) before it is
+    demultiplexed.  Frames left with RS errors are still demultiplexed
+    (as are frames with an invalid ASM); they are listed in 'rs_frames'.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('frames', 0)
+    stats.setdefault('asm_misses', 0)
+    stats.setdefault('apid_misses', 0)
+    stats.setdefault('miss_frames', [])
+    stats.setdefault('rs_corrected', 0)
+    stats.setdefault('rs_failed', 0)
+    stats.setdefault('rs_frames', [])
+
+    # BGS only passes complete frames, so pass data is normally
+    #   frame-aligned; where it is not (slipped or damaged frames),
+    #   framing is recovered from the ASMs.  Begin extraction/parsing
+
+    # As each block of master frames is unpacked:
+    #   - RS check (optionally correct) every frame
+    #   - validate ASMs, and index the APIDs of every packet slot
     #   - discard ASM and RSCODE
-    #   - identify contents of transfer frame's "DATA" field by APID
-    #   - append packet as appropriate, with support data:
+    #   - yield packets in frame order, with support data:
     #           ([transfer frame header], packet)
     #   - the transfer frame header consists of a 13-byte sequence:
     #    (Frame ID, MC Cnt, VC Cnt, Frame Status, Sec Hdr ID, Xmit Time)
-    
+    if source is None:
+        source = provenance.Provenance(filename)
+    other = packet_categories.index('other')
+    magic_count = 0         # MAGIC packets so far (see magic.decode_samples())
+
+    for frame_ids, frames in iter_frame_blocks(filename, source=source, stats=stats,
+            frame_range=frame_range):
+        n_frames = len(frames)
+
+        # integrity flag of every frame, ahead of demultiplexing
+        frames, rs_status = rscode.check_frames(frames, correct=rs_correct)
+        rs_failed = (rs_status == rscode.rs_errors)
+        stats['rs_corrected'] += int(np.count_nonzero(rs_status == rscode.rs_corrected))
+        stats['rs_failed'] += int(np.count_nonzero(rs_failed))
+        stats['rs_frames'].extend(frame_ids[rs_failed].tolist())
+
+        demux = demux_master_frames(frames)
+
+        # categorize every packet slot from the APID index arrays
+        category = np.empty(n_frames*len(packet_slots), dtype=np.int8)
+        category.fill(other)
+        for packet_apid, index in demux.index.items():
+            category[index] = packet_categories.index(apid_categories[packet_apid])
+        category = category.reshape(n_frames, len(packet_slots))
+
+        # tally (rather than print) invalid ASMs and unexpected APIDs
+        stats['frames'] += n_frames
+        stats['asm_misses'] += int(np.count_nonzero(~demux.asm_valid))
+        stats['apid_misses'] += len(demux.unexpected)
+        miss = ~demux.asm_valid
+        miss[demux.unexpected // len(packet_slots)] = True
+        stats['miss_frames'].extend(frame_ids[miss].tolist())
+
+        tf_headers = frames['tf_header']
+        slot_packets = [frames[slot] for slot in packet_slots]
+
+        # STEIN, MAGIC and HSK packets of the block are decoded together, in batches
+        batch = {}
+        for packet_apid in batch_parsers:
+            if (packet_apid == apid241):
+                parsed = parse_packet_batch(slot_packets, demux.index.get(packet_apid), packet_apid,
+                        first_packet=magic_count)
+                magic_count += sum(packet is not None for packet in parsed.values())
+            else:
+                parsed = parse_packet_batch(slot_packets, demux.index.get(packet_apid), packet_apid)
+            batch.update(parsed)
+
+        for i in range(n_frames):
+            frame_id = int(frame_ids[i])
+            tf_header = tf_headers[i]
+            for k in range(len(packet_slots)):
+                packet_category = packet_categories[category[i,k]]
+                if (k < 2) and (packet_category != 'other'):
+                    flat = i*len(packet_slots) + k
+                    if flat in batch:
+                        packet = batch[flat]
+                    else:
+                        packet = parse_frame(slot_packets[k][i], ccsds_size=6)
+                    if (packet != None):
+                        packet['tframe_header'] = tuple(bytearray(tf_header))
+                        packet['provenance'] = source
+                    yield (frame_id, packet_category, packet)
+                else:
+                    yield (frame_id, packet_category, (tf_header, slot_packets[k][i]))
+
+
+def count_frames(filename):
+    """Return the number of complete master frames in a BGS pass file.
+
+    For GZIP archives, this is taken from the checkpoint index, where there
+    is one; otherwise from the (modulo 2**32) uncompressed size recorded in
+    the GZIP trailer, which is only an estimate for multi-member or very
+    large archives.
+    """
+    if (filename.split('.')[-1] != 'gz'):
+        return os.path.getsize(filename) // tm_frame_size
+    index = gzindex.load_index(filename)
+    if (index is not None):
+        return index.length // tm_frame_size
+    with open(filename,'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if (f.tell() < 4):
+            return 0
+        f.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', f.read(4))[0] // tm_frame_size
+
+
+def shard_ranges(n_frames, shards):
+    """Split 'n_frames' master frames into (at most) 'shards' contiguous frame ranges.
+
+    Return value:
+    list of (start, stop) tuples, for iter_packets(); the final range
+    has a 'stop' of None (through to EOF)
+    """
+    shards = max(1, min(shards, n_frames))
+    bounds = [(n_frames*i) // shards for i in range(shards)]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def _decode_shard(args):
+    # worker: decode one frame range of a pass file, into packet lists
+    #   (module-level, so that it can be pickled for multiprocessing.Pool)
+    filename, frame_range, rs_correct = args
+    packet_lists = tuple([] for category in packet_categories)
+    stats = {}
+    for frame_id, category, packet in iter_packets(filename, stats=stats, frame_range=frame_range,
+            rs_correct=rs_correct):
+        packet_lists[packet_categories.index(category)].append(packet)
+    return (packet_lists, stats)
+
+
+# iter_packets() stats, merged over shards: counts, and lists (in frame order)
+merged_counts = ('frames', 'asm_misses', 'apid_misses', 'extra_bytes', 'skipped_bytes',
+        'rs_corrected', 'rs_failed')
+merged_lists = ('miss_frames', 'slips', 'rs_frames')
+
+
+def merge_stats(stats, other):
+    """Accumulate the iter_packets() stats 'other' into 'stats' (counts add, lists extend)."""
+    for key in merged_counts:
+        stats[key] = stats.get(key, 0) + other.get(key, 0)
+    for key in merged_lists:
+        stats.setdefault(key, []).extend(other.get(key, []))
+    return stats
+
+
+def decode_sharded(filename, shards, processes=None, stats=None, rs_correct=False):
+    """Decode a BGS pass file as frame-range shards, over a pool of worker processes.
+
+    Arguments:
+    filename -- path to a BGS pass file (optionally GZIP compressed)
+    shards -- number of frame-range shards to decode
+
+    Keyword arguments:
+    processes -- number of worker processes (default None, one per CPU)
+    stats -- dictionary in which to accumulate frame and miss counts, as
+             for iter_packets() (default None)
+    rs_correct -- Boolean argument, as for iter_packets() (default False)
+
+    Return value:
+    tuple of packet lists, in 'packet_categories' order; the packets and
+    stats are the same as those of the serial iter_packets() path (shards
+    are merged in frame order), with one shared provenance.Provenance record
+    """
+    if stats is None:
+        stats = {}
+    merge_stats(stats, {})
+
+    jobs = [(filename, frame_range, rs_correct) for frame_range in shard_ranges(count_frames(filename), shards)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_decode_shard, jobs, chunksize=1)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    # merge shards in frame order, sharing a single (sealed) provenance record
+    source = provenance.Provenance(filename)
+    source.seal(provenance.file_sha1(filename))
+    packet_lists = tuple([] for category in packet_categories)
+    for shard_lists, shard_stats in results:
+        for merged, shard_list in zip(packet_lists, shard_lists):
+            merged.extend(shard_list)
+        merge_stats(stats, shard_stats)
+    # (each shard numbers its MAGIC packets from 0: number them across the pass)
+    magic.number_packets(packet_lists[packet_categories.index('science')])
+    for category in ('recentHSK', 'recordHSK', 'science'):
+        for packet in packet_lists[packet_categories.index(category)]:
+            if (packet is not None):
+                packet['provenance'] = source
+    return packet_lists
+
+
+def print_miss_summary(stats):
+    # print a summary of invalid ASMs and unexpected APIDs (from iter_packets stats)
+    print("Misses/APID Misses: ", stats['asm_misses'], stats['apid_misses'], stats['frames'])
+    if (len(stats['miss_frames']) > 0):
+        print("Frames with misses: {0} (first: {1})".format(len(stats['miss_frames']), stats['miss_frames'][0]))
+    if (len(stats.get('slips', [])) > 0):
+        print("Framing slips: {0}, {1} bytes skipped (first at byte {2})".format(
+            len(stats['slips']), stats['skipped_bytes'], stats['slips'][0][0]))
+    if (stats.get('rs_corrected', 0) + stats.get('rs_failed', 0) > 0):
+        print("RS corrected/failed frames: ", stats['rs_corrected'], stats['rs_failed'])
+
+
+def read_raw_hexbytes(filename=None, verbose=True, stats=None, shards=None, processes=None,
+        rs_correct=False, cache=None):
+    """Read and demultiplex a BGS pass file, returning lists of packets.
+
+    Arguments:
+    filename -- path to a BGS pass file (optionally GZIP compressed)
+
+    Keyword arguments:
+    verbose -- Boolean argument; if True (default), show a progress bar
+               and print a summary of invalid ASMs/unexpected APIDs
+    stats -- dictionary in which to accumulate frame and miss counts, as
+             for iter_packets() (default None)
+    shards -- if more than 1, split the pass into this many frame-range
+              shards, decoded in parallel by decode_sharded() (default None);
+              the result is identical to that of the serial path
+    processes -- number of worker processes for 'shards' (default None,
+                 one per CPU)
+    rs_correct -- Boolean argument; if True, correct RS errors where
+                  possible, as for iter_packets() (default False)
+    cache -- a cinema_cache.DecodeCache (default None); a pass decoded
+             before (same file contents, decoders and options) is loaded
+             from the cache, and otherwise stored in it once decoded
+
+    Return value:
+    (recentHSK_packet, recordHSK_packet, overflow_packet, science_packets, other_packets)
+    """
     # Instantiate storage lists
     recentHSK_packet = []
     recordHSK_packet = []
     overflow_packet = []
     science_packets = []
     other_packets = []
+    packet_lists = {'recentHSK':recentHSK_packet, 'recordHSK':recordHSK_packet,
+            'overflow':overflow_packet, 'science':science_packets, 'other':other_packets}
 
-    # Generate access index
-    spacing = [0, 10, 4, 13, 518, 518, 62, 4, 160]
-    key = [sum(spacing[0:i+1]) for i in range(len(spacing))]
+    if stats is None:
+        stats = {}
+    if cache is not None:
+        packet_tuple = cache.load(filename, stats=stats, rs_correct=rs_correct)
+        if (packet_tuple is not None):
+            if verbose:
+                print_miss_summary(stats)
+                print("*****************************")
+            return packet_tuple
+        # (decode with stats of this pass alone, for the cache)
+        pass_stats = {}
+        packet_tuple = read_raw_hexbytes(filename, verbose=verbose, stats=pass_stats,
+                shards=shards, processes=processes, rs_correct=rs_correct)
+        cache.store(filename, packet_tuple, pass_stats, rs_correct=rs_correct)
+        merge_stats(stats, pass_stats)
+        return packet_tuple
+    if (shards is not None) and (shards > 1):
+        packet_tuple = decode_sharded(filename, shards, processes=processes, stats=stats,
+                rs_correct=rs_correct)
+        if verbose:
+            print_miss_summary(stats)
+            print("*****************************")
+        return packet_tuple
+    if not verbose:
+        for frame_id, category, packet in iter_packets(filename, stats=stats, rs_correct=rs_correct):
+            packet_lists[category].append(packet)
+        return (recentHSK_packet, recordHSK_packet, overflow_packet, science_packets, other_packets)
 
-    miss_count = 0
-    apid_miss = 0
-    miss_flag = False
-    
-    # work through our list of master telemetry frames, whittling it 
-    #   down as appropriate (this should help with memory)
-    frame_id = 0
-    n_raw_frames = len(raw_frames)
-    #widgets = ['Frames Processed: ', progressbar.Percentage(), progressbar.Bar()]
-    widgets = [progressbar.FormatLabel('Processing: %(value)d of %(max)d')]
+    # size the progress bar from the file size, where it is known
+    if (filename.split('.')[-1] == 'gz'):
+        n_raw_frames = progressbar.UnknownLength
+        widgets = [progressbar.FormatLabel('Processing: %(value)d')]
+    else:
+        n_raw_frames = -(-os.path.getsize(filename) // tm_frame_size)
+        widgets = [progressbar.FormatLabel('Processing: %(value)d of %(max)d')]
     pbar = progressbar.ProgressBar(widgets=widgets, maxval=n_raw_frames).start()
-    while len(raw_frames) > 0:
-        
-        #print "processing {0} of {1}".format( (n_raw_frames - len(raw_frames)), n_raw_frames)
-        frame = raw_frames.pop(0)
-        el = 0          # index to "element" of key
-        
-        # move through the master and transfer frames
-        # get the 10-bytes of SMEX header data
-        smex_header = (frame[key[el]:key[el+1]])
-        el += 1
-        # get the 4-byte ASM sequence
-        asm_code = frame[key[el]:key[el+1]]
-        el += 1
-        # get the 13-byte transfer frame header
-        tf_header = frame[key[el]:key[el+1]]
-        el += 1
-        # get the first 518-byte data packet
-        packet_1 = frame[key[el]:key[el+1]]
-        el += 1
-        # get the second 518-byte data packet
-        packet_2 = frame[key[el]:key[el+1]]
-        el += 1
-        # get the 62-byte overflow packet
-        packet_3 = frame[key[el]:key[el+1]]
-        el += 1
-        # get the 4-byte OCF sequence
-        ocf_code = frame[key[el]:key[el+1]]
-        el += 1
-        # get the 160-byte RS CODE sequence
-        rs_code = frame[key[el]:key[el+1]]
-        
-        # examine APIDs of data/overflow packets
-        # for packet_1
-        packet1_apid = (packet_1[0] << 8) + packet_1[1]
-        if (packet1_apid in supported):
-            packet = parse_frame(packet_1, ccsds_size=6)
-            if (packet != None):
-                packet['tframe_header'] = tuple(tf_header)
-                packet['source_file'] = filename
-                packet['source_file_hash'] = hashlib.sha1(open(filename,'rb').read()).hexdigest()
-                packet['extraction_date'] = datetime.datetime.now() 
-            if (packet1_apid in science):
-                science_packets.append(packet)
-            elif (packet1_apid == recordHSK):
-                recordHSK_packet.append(packet)
-            elif (packet1_apid == recentHSK):
-                recentHSK_packet.append(packet)
-            else:
-                print("Unexpected APID [packet 1a]")
-                apid_miss += 1
-                miss_flag = True
-                other_packets.append((tf_header,packet_1))
-            packet = None
-        else:
-            print("Unexpected APID [packet 1b]")
-            apid_miss += 1
-            miss_flag = True
-            other_packets.append((tf_header,packet_1))
-        
-        # for packet_2
-        packet2_apid = (packet_2[0] << 8) + packet_2[1]
-        if (packet2_apid in supported):
-            packet = parse_frame(packet_2, ccsds_size=6)
-            if (packet != None):
-                packet['tframe_header'] = tuple(tf_header)
-                packet['source_file'] = filename
-                packet['source_file_hash'] = hashlib.sha1(open(filename,'rb').read()).hexdigest()
-                packet['extraction_date'] = datetime.datetime.now() 
-            if (packet2_apid in science):
-                science_packets.append(packet)
-            elif (packet2_apid == recordHSK):
-                recordHSK_packet.append(packet)
-            elif (packet2_apid == recentHSK):
-                recentHSK_packet.append(packet)
-            else:
-                print("Unexpected APID [packet 2a]")
-                apid_miss += 1
-                miss_flag = True
-                other_packets.append((tf_header,packet_2))
-            packet = None
-        else:
-            print("Unexpected APID [packet 2b]")
-            apid_miss += 1
-            miss_flag = True
-            other_packets.append((tf_header,packet_2))
-        
-        #packet2_apid = (packet_2[0] << 8) + packet_2[1]
-        #if (packet2_apid in science):
-        #    packet = parse_frame(packet_2, ccsds_size=6)
-        #    if (packet != None):
-        #        packet['tframe_header'] = tuple(tf_header)
-        #    science_packets.append(packet)
-        #    packet = None
-        #elif (packet2_apid == recordHSK):
-        #    recordHSK_packet.append((tf_header,packet_2))
-        #elif (packet2_apid == recentHSK):
-        #    recentHSK_packet.append((tf_header,packet_2))
-        #else:
-        #    print("Unexpected APID [packet 2]") 
-        #    apid_miss += 1
-        #    miss_flag = True
-        #    other_packets.append((tf_header,packet_2))
-        
-        # for packet_3
-        packet3_apid = (packet_3[0] << 8) + packet_3[1]
-        if (packet3_apid == overflow):
-            overflow_packet.append((tf_header,packet_3))
-        else:
-            print("Unexpected APID [packet 3]")
-            apid_miss += 1
-            miss_flag = True
-            other_packets.append((tf_header,packet_3))
-       
-        # examine ASM for legitimacy
-        asm_code = (asm_code[0] << 24) + (asm_code[1] << 16) + (asm_code[2] << 8) + asm_code[3]
-        if (asm_code != asm):
-            print("Invalid ASM")
-            miss_count += 1
-            miss_flag = True
-        else:
-            pass
-       
-        # if errors, make report
-        if (miss_flag):
-            print(frame_id, hex(asm_code), hex(packet1_apid), hex(packet2_apid), hex(packet3_apid))
-            miss_flag = False
-   
-        frame_id += 1
-        pbar.update(n_raw_frames - len(raw_frames))
-        #print "processing {0} of {1}".format( (n_raw_frames - len(raw_frames)), n_raw_frames)
-    print("Misses/APID Misses: ", miss_count, apid_miss, n_raw_frames)
+
+    for frame_id, category, packet in iter_packets(filename, stats=stats, rs_correct=rs_correct):
+        packet_lists[category].append(packet)
+        pbar.update(frame_id + 1)
+    print_miss_summary(stats)
     pbar.finish()
     print("*****************************")
     
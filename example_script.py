@@ -3,6 +3,7 @@
 
 import os, sys
 import cinema_unpack_v0_8_1 as unpack
+import cinema_cache_v0_1_0 as cinema_cache
 import hsk_unpack_v0_8_0 as hsk
 import magic_clocktime_v0_8_0 as mclock
 
@@ -15,6 +16,10 @@ output_directory = "cinema_unpacked_data/"
 sc = "CIN1"     # CINEMA1 (UC Berkeley)
 
 
+# optionally, decoded passes are cached (in $CINEMA_CACHE, where set), so re-runs skip decoding
+cache = cinema_cache.DecodeCache() if os.environ.get("CINEMA_CACHE") else None
+
+
 contents_of_src_path = os.listdir(source_directory)
 src_candidates = [candidate for candidate in contents_of_src_path if ("BGS.CINEMA.TLM_VC0" in candidate)]
 print src_candidates
@@ -33,7 +38,7 @@ for filepath in src_candidates:
         # directory already exists (presume populated)
         print filepath + " (skipping)"
     else:
-        packet_tuple = unpack.read_raw_hexbytes(source_directory + os.sep + filepath)
+        packet_tuple = unpack.read_raw_hexbytes(source_directory + os.sep + filepath, cache=cache)
         contents = sum(map(len,packet_tuple[0:3]))
         if (contents==0):
             # renames file, or otherwise note it
@@ -60,8 +65,8 @@ for filepath in src_candidates:
                 # STEIN
                 
                 # MAGIC
-                magic_packets = [packet for packet in packet_tuple[3] if packet['type']=='MAGIC']
-                mo = 1  # get these from the STEIN/MAGIC interleave
-                dy = 1
-                data,qa = mclock.calc_fitted_sampletime(magic_packets, year=2012, month=mo, day=dy)
+                # (dated by the STEIN/MAGIC interleave, or else by the HSK packets of the pass)
+                magic_packets, dates = mclock.anchor_dates(packet_tuple[3],
+                        hsk_packets=packet_tuple[0] + packet_tuple[1])
+                data,qa = mclock.calc_fitted_sampletime(magic_packets, dates=dates)
                 unpack.save_data_as(data, filename=expanded_out_path + os.sep + out_path + '_mag_v0_1.txt')
@@ -12,7 +12,333 @@
 #
 
 import os, datetime
+import numpy as np
 import cinema_timeops_v0_1_0 as timeops
+import cinema_provenance_v0_1_0 as provenance
+import cinema_packet_v0_1_0 as packet_record
+
+# FAST HSK PARAMETERS
+fastHSK_size = 420              # size (BYTES) of HSK packet fast housekeeping subframe
+fastHSK_increment = 48          # 44 housekeeping values + 4 spare (null) values
+fastHSK_repeats = 7             # the 48 element sequence is repeated 7 times
+
+# 48 element sequence = 44 housekeeping values + 4 spare (null) values
+fastHSK_labels = (
+        "PANEL_X1_CURRENT", "PANEL_X2_CURRENT", "PANEL_Y1_CURRENT", "PANEL_Y2_CURRENT", 
+        "PANEL_Z1_CURRENT", "PANEL_Z2_CURRENT", # end 6 EPS/SP currents 
+        "PANEL_X_VOLT", "PANEL_X1_TEMP",
+        "PANEL_X2_TEMP","PANEL_Y_VOLT","PANEL_Y1_TEMP","PANEL_Y2_TEMP",
+        "PANEL_Z_VOLT","PANEL_Z1_TEMP","PANEL_Z2_TEMP","V5_BUS_CURRENT",
+        "V3.3_CURR","BATT_BUS_CURR", # end 12 EPS/ADC measurements
+        "BATT_CURR_DIR","BATT_VOLT",
+        "BATT_CURR","BATT_TEMP","BATT1_CURR_DIR","BATT1_VOLT",
+        "BATT1_CURR","BATT1_TEMP","BATT2_CURR_DIR","BATT2_VOLT",
+        "BATT2_CURR","BATT2_TEMP","CELL_VOLT","CELL1_VOLT",
+        "CELL2_VOLT", # end 15 BATT/ADC measurements
+        "VMON_RAW_N","VMON_RAW_P","SENSE",
+        "IMON_RAW","IIB_TEMP","VMON_MAG5V","SBAND_TEMP",
+        "VMON_STEIN5V","STEIN_TEMP","VMON_STEINHV8V","OLD_SBAND_TEMP", # end 11 misc onboard measurements
+        "SPARE1","SPARE2","SPARE3","SPARE4") # end 4 spare bytes
+# 6 elements; EPS currents
+# from the Clydespace EPS documentation
+#              ADC channel (1, 4, 13, 7, 10, 31)
+#              EPS nominal (+Array SA1 Current, -Array SA1 Current, 
+#                                   +Array SA2 Current, -Array SA2 Current,
+#                                           +Array SA3 Current, -Array SA3 Current)
+#              EPS gloss   (PANEL_X1_CURRENT, PANEL_X2_CURRENT, 
+#                                   PANEL_Y1_CURRENT, PANEL_Y2_CURRENT,
+#                                           PANEL_Z1_CURRENT, PANEL_Z2_CURRENT)
+eps_current_multiplier = (-1.94483, -1.955, -0.49881, -0.49928, -0.48533, -0.51985)
+eps_current_addition = (1940.8, 1953.464, 517.4618, 517.6608, 502.9626, 521.7786)
+            
+# 32 elements; EPS and ADC voltages, etc
+# first 12: from the Clydespace EPS documentation
+#              ADC channel (3, 2, 
+#                                   5, 6, 
+#                                           14, 8,
+#                                                   9, 11,
+#                                                           30, 26,
+#                                                                   27, 17)
+#              EPS nominal (Array SA1 Voltage, +Array SA1 Temperature,
+#                                   -Array SA1 Temperature (error), Array SA2 Voltage,
+#                                           +Array SA2 Temperature, -Array SA2 Temperature,
+#                                                   Array SA3 Voltage, +Array SA3 Temperature,
+#                                                           -Array SA3 Temperature, 5V Bus Current,
+#                                                                  3.3V Bus Current, Battery Bus Curent) 
+#              EPS gloss   (PANEL_X_VOLT, PANEL_X1_TEMP, 
+#                                   PANEL_X2_TEMP, PANEL_Y_VOLT,
+#                                           PANEL_Y1_TEMP, PANEL_Y2_TEMP, 
+#                                                   PANEL_Z_VOLT, PANEL_Z1_TEMP,
+#                                                           PANEL_Z2_TEMP, V5_BUS_CURRENT,
+#                                                                   V3.3_CURR, BATT_BUS_CURR)
+eps_adc_multiplier = (
+        -0.03532, -0.1619, -0.1619, -0.03474,  
+        -0.1619, -0.1619, -0.00855, -0.1619,
+        -0.1619, -4.39965, -3.20202, -4.94124)
+eps_adc_addition = (
+        36.57826, 110.119, 110.119, 36.00065, 
+        110.119, 110.119, 8.810868, 110.119,
+        110.119, 4136.184, 2998.972, 4784.404)
+# next 35: from the Clydespace BATT documentation
+#              ADC channel (0,2,1,4,5,7,6,9,10,13,
+#                           11,14,2,7,12)
+#              BATT nominal (Battery Current Direction,Battery Voltage,
+#                                   Battery Current, Battery Temperature,
+#                                           Battery1 Current Direction, Battery1 Voltage,
+#                                                   Battery1 Current, Battery1 Temperature,
+#                                                           Battery2 Current Direction, Battery2 Voltage,
+#                           Battery2 Current, Battery2 Temperature,
+#                                   Cell Voltage, Cell1 Voltage,
+#                                           Cell2 Volage)
+#              BATT gloss   ("BATT_CURR_DIR","BATT_VOLT",
+#                                   "BATT_CURR","BATT_TEMP",
+#                                           "BATT1_CURR_DIR","BATT1_VOLT",
+#                                                   "BATT1_CURR","BATT1_TEMP",
+#                                                           "BATT2_CURR_DIR","BATT2_VOLT",
+#                           "BATT2_CURR","BATT2_TEMP",
+#                                   "CELL_VOLT","CELL1_VOLT",
+#                                           "CELL2_VOLT")
+#                                          ,"VMON_RAW_N",
+#                                                   "VMON_RAW_P","SENSE",
+#                                                           "IMON_RAW","IIB_TEMP",
+#                           "VMON_MAG5V","SBAND_TEMP",
+#                                   "VMON_STEIN5V","STEIN_TEMP",
+#                                           "VMON_STEINHV8V","SBAND_TEMP",
+#                                                   "SPARE1","SPARE2",
+#                                                           "SPARE3","SPARE4")
+
+# 32 elements; EPS and ADC voltages, etc
+# first 12: from the Clydespace EPS documentation
+
+
+batt_adc_multiplier = (
+        1.0, -0.00939, -3.20, -0.163,
+        1.0, -0.00939, -3.20, -0.163, 
+        1.0, -0.00939, -3.20, -0.163,
+        -0.00483, -0.00483, -0.00483
+        )
+batt_adc_addition = (
+        0.0, 9.791, 2926.22, 110.7,
+        0.0, 9.791, 2926.22, 110.7, 
+        0.0, 9.791, 2926.22, 110.7,
+        4.852724, 4.852724, 4.852724
+        )
+        # , 0.0, 
+        #0.0, 0.0, 0.0, 0.0)
+misc_multiplier = [1.0]*15
+misc_addition = [0.0]*15
+  
+# calibration (engineering value = multiplier*raw value + addition), 
+#   in fastHSK_labels order
+fastHSK_multiplier = np.array(eps_current_multiplier + eps_adc_multiplier +
+        batt_adc_multiplier + tuple(misc_multiplier))
+fastHSK_addition = np.array(eps_current_addition + eps_adc_addition +
+        batt_adc_addition + tuple(misc_addition))
+
+
+def extract_fastHSK_array(fastHSK_blocks):
+    """Extract the raw 10-bit values from an array of 420-byte FAST HSK blocks.
+
+    Arguments:
+    fastHSK_blocks -- (n_packets, 420) array of bytes (e.g. numpy.uint8)
+
+    Return value:
+    (n_packets, 7, 48) numpy.uint16 array of raw values, indexed by
+    [packet, repeat, fastHSK_labels position]
+    """
+    # 420-byte block, comprising 336 values of 10 bits each
+    # So.. every 5 bytes gives us 4 complete HSK values
+    increment = 5               # (bytes)
+    working_bytes = np.asarray(fastHSK_blocks, dtype=np.uint8).reshape(-1, fastHSK_size//increment, increment)
+    working_bytes = working_bytes.astype(np.uint16)
+
+    hsk_log = np.empty((working_bytes.shape[0], fastHSK_size//increment, 4), dtype=np.uint16)
+    hsk_log[:,:,0] = (working_bytes[:,:,0] << 2) + (working_bytes[:,:,1] >> 6)
+    hsk_log[:,:,1] = ((working_bytes[:,:,1] & 63) << 4) + (working_bytes[:,:,2] >> 4)
+    hsk_log[:,:,2] = ((working_bytes[:,:,2] & 15) << 6) + (working_bytes[:,:,3] >> 2)
+    hsk_log[:,:,3] = ((working_bytes[:,:,3] & 3) << 8) + (working_bytes[:,:,4])
+    return hsk_log.reshape(-1, fastHSK_repeats, fastHSK_increment)
+
+
+def calibrate_fastHSK(fastHSK_raw):
+    """Convert raw FAST HSK values into engineering units.
+
+    Arguments:
+    fastHSK_raw -- (..., 48) array of raw values, as from extract_fastHSK_array()
+
+    Return value:
+    float array of the same shape, (multiplier*raw + addition), with the
+    EPS/BATT/misc coefficients broadcast along the last axis
+    """
+    return fastHSK_raw*fastHSK_multiplier + fastHSK_addition
+
+
+def decode_fastHSK(fastHSK_blocks):
+    """Decode and calibrate an array of 420-byte FAST HSK blocks.
+
+    Arguments:
+    fastHSK_blocks -- (n_packets, 420) array of bytes (e.g. numpy.uint8)
+
+    Return value:
+    tuple of (n_packets, 7, 48) arrays: (raw values, engineering values)
+    """
+    fastHSK_raw = extract_fastHSK_array(fastHSK_blocks)
+    return (fastHSK_raw, calibrate_fastHSK(fastHSK_raw))
+
+
+def fast_hsk_view(fastHSK_raw):
+    """Return one packet's (7, 48) raw FAST HSK values as 48 tuples of 7 values.
+
+    This is the per-packet 'fast_hsk' list of earlier versions.
+    """
+    return [tuple(values) for values in fastHSK_raw.T.tolist()]
+
+
+# SLOW HSK PARAMETERS
+slowHSK_size = 86               # size (BYTES) of HSK packet slow housekeeping subframe
+
+# SLOW HSK field table; one entry per value, in 'slow_hsk' column order:
+#   (name, byte offset, width (BYTES), bit mask, shift, signed)
+#   value = (big-endian integer of 'width' bytes at 'offset' >> shift) & mask
+#   (mask None for the full width)
+# byte groups, as follow:
+# FLIGHTMODE(1) @0, FSW_VERSION(1) @1, DEVENABLE(2) @2, PERIPHENABLE(2) @4, MISC(16) @6, 
+#   SSR_STATE(10) @22, DEPLOY_CONTROL(2) @32, POWER_CONTROL(4) @34, ACS(24) @38, 
+#   MAG_HOUSEKEEPING(13) @62, STEIN_HOUSEKEEPING(4) @75, [SPARE(7) @79]
+slowHSK_fields = (
+        ('FLIGHTMODE', 0, 1, None, 0, False),
+        # FSW_VERSION
+        ('FSW_HIGH', 1, 1, 15, 4, False),
+        ('FSW_LOW', 1, 1, 15, 0, False),
+        # DEVENABLE, first byte
+        ('ENA_FLASH', 2, 1, 1, 7, False),
+        ('ENA_SBAND', 2, 1, 1, 6, False),
+        ('ENA_TORQ', 2, 1, 1, 5, False),
+        ('ENA_ACT', 2, 1, 1, 4, False),
+        ('ENA_MAG', 2, 1, 1, 3, False),
+        ('ENA_STEIN', 2, 1, 1, 2, False),
+        ('ENA_ATT', 2, 1, 1, 1, False),
+        ('ENA_HV', 2, 1, 1, 0, False),
+        # DEVENABLE, second byte
+        ('ENA_SCAN', 3, 1, 1, 7, False),
+        ('ENA_RTC', 3, 1, 1, 6, False),
+        ('ENA_IIB', 3, 1, 1, 5, False),
+        ('ENA_UHF', 3, 1, 1, 4, False),
+        # PERIPHENABLE, first byte
+        ('TIMER2', 4, 1, 1, 7, False),
+        ('TIMER3', 4, 1, 1, 6, False),
+        ('TIMER4', 4, 1, 1, 5, False),
+        ('I2C1', 4, 1, 1, 4, False),
+        ('I2C2', 4, 1, 1, 3, False),
+        ('UART2', 4, 1, 1, 2, False),
+        ('ADC', 4, 1, 1, 1, False),
+        ('UART1', 4, 1, 1, 0, False),
+        # PERIPHENABLE, second byte
+        ('SPI1', 5, 1, 1, 7, False),
+        ('SPI2', 5, 1, 1, 6, False),
+        ('IC1', 5, 1, 1, 5, False),
+        ('IC5', 5, 1, 1, 4, False),
+        ('OC4', 5, 1, 1, 3, False),
+        # MISC
+        ('TRIGGER', 6, 2, None, 0, False),
+        ('ERRCTR', 8, 1, None, 0, False),
+        ('ERRDATA', 9, 2, None, 0, False),
+        ('ERRCODE', 11, 1, None, 0, False),
+        ('EVTCTR', 12, 1, None, 0, False),
+        ('EVTCODE', 13, 1, None, 0, False),
+        ('CMDTOT', 14, 2, None, 0, False),
+        ('IMMCMDSIZE', 16, 1, None, 0, False),
+        ('DLYCMDSIZE', 17, 2, None, 0, False),
+        ('CINEMASTATE', 19, 1, None, 0, False),
+        ('BEACONSTATE', 20, 1, None, 0, False),
+        ('SRAMPAGE', 21, 1, None, 0, False),
+        # SSR_STATE
+        ('HSKPKTNUM', 22, 3, None, 0, False),
+        ('DATAPKTNUM', 25, 3, None, 0, False),
+        ('HSKPKTPTR', 28, 2, None, 0, False),
+        ('DATAPKTPTR', 30, 2, None, 0, False),
+        # DEPLOY CONTROL
+        ('ANTSTAT', 32, 1, None, 0, False),
+        ('BOOMSTAT', 33, 1, None, 0, False),
+        # POWER CONTROL
+        ('ATTSELECT', 34, 1, None, 0, False),
+        ('ATTTIME', 35, 1, None, 0, False),
+        ('BOOMTIME', 36, 1, None, 0, False),
+        ('SPARE_POWER', 37, 1, None, 0, False),
+        # ACS
+        ('ACSMODE', 38, 1, None, 0, False),
+        ('TORCOILS', 39, 1, None, 0, False),
+        ('ELEVATION', 40, 4, None, 0, False),
+        ('SPIN_RATE', 44, 4, None, 0, False),
+        ('OMEGA_X', 48, 4, None, 0, False),         # error?
+        ('OMEGA_Y', 52, 4, None, 0, False),         # error?
+        ('OMEGA_Z', 56, 4, None, 0, False),         # error?
+        ('EPHEMERIS_INTEGRITY_1', 60, 1, None, 0, False),
+        ('EPHEMERIS_INTEGRITY_2', 61, 1, None, 0, False),
+        # MAG HOUSEKEEPING
+        ('MAGICFALT', 62, 1, None, 0, False),
+        ('MAGSTAT', 63, 1, None, 0, False),
+        ('Bx', 64, 3, None, 0, False),
+        ('By', 67, 3, None, 0, False),
+        ('Bz', 70, 3, None, 0, False),
+        ('SPARE_MAG', 73, 2, None, 0, False),
+        # STEIN HOUSEKEEPING
+        ('STEINFLT', 75, 1, None, 0, False),
+        ('STEINHVFAULT', 76, 1, None, 0, False),
+        ('SWEEP_INTEGRITY', 77, 1, None, 0, False),
+        ('SPARE_STEIN_HSK', 78, 1, None, 0, False))
+        # GENERAL SLOW HSK SPARE
+        # *NOT IMPLEMENTED*
+
+
+def compile_field_table(fields, frame_size):
+    """Compile a field table into a vectorized decoder.
+
+    Arguments:
+    fields -- sequence of (name, byte offset, width, bit mask, shift, signed)
+              entries, as 'slowHSK_fields'
+    frame_size -- size (BYTES) of the decoded block
+
+    Return value:
+    a function taking an (n_packets, frame_size) array of bytes, and
+    returning an (n_packets,) structured array with one column per field
+    """
+    dtype = []
+    steps = []
+    for (name, offset, width, mask, shift, signed) in fields:
+        # number of significant bits, and the smallest fitting column type
+        if mask is None:
+            mask = (1 << (8*width - shift)) - 1
+        bits = len(bin(mask)) - 2
+        size = [n for n in (1, 2, 4, 8) if 8*n >= bits][0]
+        dtype.append((name, np.dtype('{0}{1}'.format('i' if signed else 'u', size))))
+        steps.append((name, offset, width, mask, shift, bits if signed else None))
+    dtype = np.dtype(dtype)
+
+    def decode(blocks):
+        blocks = np.asarray(blocks, dtype=np.uint8).reshape(-1, frame_size)
+        wide = blocks.astype(np.int64)
+        decoded = np.empty(len(blocks), dtype=dtype)
+        for (name, offset, width, mask, shift, sign_bits) in steps:
+            value = wide[:,offset]
+            for k in range(1, width):
+                value = (value << 8) + wide[:,offset+k]
+            value = (value >> shift) & mask
+            if sign_bits is not None:
+                # two's complement
+                value = value - ((value >> (sign_bits - 1)) << sign_bits)
+            decoded[name] = value
+        return decoded
+
+    decode.dtype = dtype
+    return decode
+
+
+# SLOW HSK decoder, compiled once from the field table:
+#   (n_packets, 86) array of bytes => (n_packets,) structured array
+decode_slowHSK = compile_field_table(slowHSK_fields, slowHSK_size)
+slowHSK_dtype = decode_slowHSK.dtype
+
 
 def extract_slowHSK(slowHSK_frame):
     # byte lengths, for values as follow:
@@ -96,340 +422,68 @@ def extract_slowHSK(slowHSK_frame):
 
 def extract_fastHSK(fastHSK_frame):
     # 420-byte block, comprising 336 values of 10 bits each
-    # So.. every 5 bytes gives us 4 complete HSK values
-    increment = 5              # (bytes)
-    n_values = 336             # (total number of fastHSK/spare values)
-
-    hsk_log = []
-    for i in range(n_values/4):
-        # populate "working_bytes"
-        working_bytes = fastHSK_frame[i*increment:i*increment+increment]
-        value1 = (working_bytes[0] << 2) + (working_bytes[1] >> 6)
-        value2 = ((working_bytes[1] & 63) << 4) + (working_bytes[2] >> 4)
-        value3 = ((working_bytes[2] & 15) << 6) + (working_bytes[3] >> 2)
-        value4 = ((working_bytes[3] & 3) << 8) + (working_bytes[4])
-
-        hsk_log.append(value1)
-        hsk_log.append(value2)
-        hsk_log.append(value3)
-        hsk_log.append(value4)
-    return hsk_log
+    fastHSK_frame = np.frombuffer(bytearray(fastHSK_frame), dtype=np.uint8)
+    return extract_fastHSK_array(fastHSK_frame)[0].ravel().tolist()
 
 def parse_slowHSK_report(slow_hsk_log):
-    # XXX-byte block
-    keys = slow_hsk_log.keys()
-    
-    flightmode = {'FLIGHTMODE':slow_hsk_log['FLIGHTMODE'][0]}
-    
-    # parse FSW_VERSION
-    fsw_high = (slow_hsk_log['FSW_VERSION'][0]) >> 4
-    fsw_low = slow_hsk_log['FSW_VERSION'][0] & 15
-    # store in dictionary
-    fsw_version = {'FSW_HIGH':fsw_high, 'FSW_LOW':fsw_low}
-    
-    # parse DEVENABLE
-    # first byte
-    ena_flash = (slow_hsk_log['DEVENABLE'][0] & 255) >> 7
-    ena_sband = (slow_hsk_log['DEVENABLE'][0] & 127) >> 6
-    ena_torq = (slow_hsk_log['DEVENABLE'][0] & 63) >> 5
-    ena_act = (slow_hsk_log['DEVENABLE'][0] & 31) >> 4
-    ena_mag = (slow_hsk_log['DEVENABLE'][0] & 15) >> 3
-    ena_stein = (slow_hsk_log['DEVENABLE'][0] & 7) >> 2
-    ena_att = (slow_hsk_log['DEVENABLE'][0] & 3) >> 1
-    ena_hv = (slow_hsk_log['DEVENABLE'][0] & 1) >> 0
-    # second byte
-    ena_scan = (slow_hsk_log['DEVENABLE'][1] & 255) >> 7
-    ena_rtc = (slow_hsk_log['DEVENABLE'][1] & 127) >> 6
-    ena_iib = (slow_hsk_log['DEVENABLE'][1] & 63) >> 5
-    ena_uhf = (slow_hsk_log['DEVENABLE'][1] & 31) >> 4
-    # store in dictionary
-    devenable = {
-            'ENA_FLASH':ena_flash, 'ENA_SBAND':ena_sband, 
-            'ENA_TORQ':ena_torq, 'ENA_ACT':ena_act, 
-            'ENA_MAG':ena_mag, 'ENA_STEIN':ena_stein, 
-            'ENA_ATT':ena_att, 'ENA_HV':ena_hv, 
-            'ENA_SCAN':ena_scan, 'ENA_RTC':ena_rtc, 
-            'ENA_IIB':ena_iib, 'ENA_UHF':ena_uhf}
-
-    # parse PERIPHENABLE
-    # first byte
-    timer2 = (slow_hsk_log['PERIPHENABLE'][0] & 255) >> 7
-    timer3 = (slow_hsk_log['PERIPHENABLE'][0] & 127) >> 6
-    timer4 = (slow_hsk_log['PERIPHENABLE'][0] & 63) >> 5
-    i2c1 = (slow_hsk_log['PERIPHENABLE'][0] & 31) >> 4
-    i2c2 = (slow_hsk_log['PERIPHENABLE'][0] & 15) >> 3
-    uart2 = (slow_hsk_log['PERIPHENABLE'][0] & 7) >> 2
-    adc = (slow_hsk_log['PERIPHENABLE'][0] & 3) >> 1
-    uart1 = (slow_hsk_log['PERIPHENABLE'][0] & 1) >> 0
-    # second byte
-    spi1 = (slow_hsk_log['PERIPHENABLE'][1] & 255) >> 7
-    spi2 = (slow_hsk_log['PERIPHENABLE'][1] & 127) >> 6
-    ic1 = (slow_hsk_log['PERIPHENABLE'][1] & 63) >> 5
-    ic5 = (slow_hsk_log['PERIPHENABLE'][1] & 31) >> 4
-    oc4 = (slow_hsk_log['PERIPHENABLE'][1] & 15) >> 3
-    # store in dictionary
-    periphenable = {
-            'TIMER2':timer2, 'TIMER3':timer3, 'TIMER4':timer4, 'I2C1':i2c1,
-            'I2C2':i2c2, 'UART2':uart2, 'ADC':adc, 'UART1':uart1,
-            'SPI1':spi1, 'SPI2':spi2, 'IC1':ic1, 'IC5':ic5,
-            'OC4':oc4}
-
-    # parse MISC
-    trigger = (slow_hsk_log['MISC'][0] << 8) + (slow_hsk_log['MISC'][1])
-    errctr = slow_hsk_log['MISC'][2]
-    errdata = (slow_hsk_log['MISC'][3] << 8) + (slow_hsk_log['MISC'][4])
-    errcode = slow_hsk_log['MISC'][5]
-    evtctr = slow_hsk_log['MISC'][6]
-    evtcode = slow_hsk_log['MISC'][7]
-    
-    cmdtot = (slow_hsk_log['MISC'][8] << 8) + (slow_hsk_log['MISC'][9])
-    immcmdsize = slow_hsk_log['MISC'][10]
-    dlycmdsize = (slow_hsk_log['MISC'][11] << 8) + (slow_hsk_log['MISC'][12])
-    cinemastate = slow_hsk_log['MISC'][13]
-    beaconstate = slow_hsk_log['MISC'][14]
-    srampage = slow_hsk_log['MISC'][15]
-    # store in dictionary
-    misc = {
-            'TRIGGER':trigger, 'ERRCTR':errctr, 
-            'ERRDATA':errdata, 'ERRCODE':errcode,
-            'EVTCTR':evtctr, 'EVTCODE':evtcode, 
-            'CMDTOT':cmdtot, 'IMMCMDSIZE':immcmdsize,
-            'DLYCMDSIZE':dlycmdsize, 'CINEMASTATE':cinemastate,
-            'BEACONSTATE':beaconstate, 'SRAMPAGE':srampage}
-
-    # parse SSR_STATE
-    hskpktnum = (slow_hsk_log['SSR_STATE'][0] << 16) + (slow_hsk_log['SSR_STATE'][1] << 8) + (slow_hsk_log['SSR_STATE'][2])
-    datapktnum = (slow_hsk_log['SSR_STATE'][3] << 16) + (slow_hsk_log['SSR_STATE'][4] << 8) + (slow_hsk_log['SSR_STATE'][5])
-    hskpktptr = (slow_hsk_log['SSR_STATE'][6] << 8) + (slow_hsk_log['SSR_STATE'][7])
-    datapktptr = (slow_hsk_log['SSR_STATE'][8] << 8) + (slow_hsk_log['SSR_STATE'][9])
-    # store in dictionary
-    ssr_state = {
-            'HSKPKTNUM':hskpktnum, 'DATAPKTNUM':datapktnum,
-            'HSKPKTPTR':hskpktptr, 'DATAPKTPTR':datapktptr}
-
-    # parse DEPLOY CONTROL
-    antstat = (slow_hsk_log['DEPLOY_CONTROL'][0])
-    boomstat = (slow_hsk_log['DEPLOY_CONTROL'][1])
-    # store in dictionary
-    deploy_control = {'ANTSTAT':antstat, 'BOOMSTAT':boomstat}
-
-    # parse POWER CONTROL
-    attselect = (slow_hsk_log['POWER_CONTROL'][0])
-    atttime = (slow_hsk_log['POWER_CONTROL'][1])
-    boomtime = (slow_hsk_log['POWER_CONTROL'][2])
-    spare_power = (slow_hsk_log['POWER_CONTROL'][3])
-    # store in dictionary
-    power_control = {
-            'ATTSELECT':attselect, 'ATTTIME':atttime,
-            'BOOMTIME':boomtime, 'SPARE_POWER':spare_power}
-
-    # parse ACS
-    acsmode = (slow_hsk_log['ACS'][0])
-    torcoils = (slow_hsk_log['ACS'][1])
-    
-    wb = slow_hsk_log['ACS'][2:(4*5+2)]       # working_bytes
-    elevation = (wb[0] << 24) + (wb[1] << 16) + (wb[2] << 8) + (wb[3])
-    spin_rate = (wb[4] << 24) + (wb[5] << 16) + (wb[6] << 8) + (wb[7])
-    omega_x = (wb[8] << 24) + (wb[9] << 16) + (wb[10] << 8) + (wb[11])          # error?
-    omega_y = (wb[12] << 24) + (wb[13] << 16) + (wb[14] << 8) + (wb[15])        # error?
-    omega_z = (wb[16] << 24) + (wb[17] << 16) + (wb[18] << 8) + (wb[19])        # error?
-    
-    ephemeris_integrity_1 = (slow_hsk_log['ACS'][22])
-    ephemeris_integrity_2 = (slow_hsk_log['ACS'][23])
-    # store in dictionary
-    acs = {
-            'ACSMODE':acsmode, 'TORCOILS':torcoils,
-            'ELEVATION':elevation, 'SPIN_RATE':spin_rate,
-            'OMEGA_X':omega_x, 'OMEGA_Y':omega_y,
-            'OMEGA_Z':omega_z,
-            'EPHEMERIS_INTEGRITY_1':ephemeris_integrity_1,
-            'EPHEMERIS_INTEGRITY_2':ephemeris_integrity_2}
-
-    # parse MAG HOUSEKEEPING
-    magicfalt = (slow_hsk_log['MAG_HOUSEKEEPING'][0])
-    magstat = (slow_hsk_log['MAG_HOUSEKEEPING'][1])
-    wb = slow_hsk_log['MAG_HOUSEKEEPING'][2:(3*3+2)]    # working_bytes
-    bx = (wb[0] << 16) + (wb[1] << 8) + (wb[2])
-    by = (wb[3] << 16) + (wb[4] << 8) + (wb[5])
-    bz = (wb[6] << 16) + (wb[7] << 8) + (wb[8])
-    spare_mag = (slow_hsk_log['MAG_HOUSEKEEPING'][11] << 8) + (slow_hsk_log['MAG_HOUSEKEEPING'][12])
-    # store in dictionary
-    mag_housekeeping = {
-            'MAGICFALT':magicfalt, 'MAGSTAT':magstat,
-            'Bx':bx, 'By':by, 'Bz':bz, 'SPARE_MAG':spare_mag}
-
-    # parse STEIN HOUSEKEEPING
-    steinflt = (slow_hsk_log['STEIN_HOUSEKEEPING'][0])
-    steinhvfault = (slow_hsk_log['STEIN_HOUSEKEEPING'][1])
-    sweep_integrity = (slow_hsk_log['STEIN_HOUSEKEEPING'][2])
-    spare_stein_hsk = (slow_hsk_log['STEIN_HOUSEKEEPING'][3])
-    # store in dictionary
-    stein_housekeeping = {
-            'STEINFLT':steinflt, 'STEINHVFAULT':steinhvfault,
-            'SWEEP_INTEGRITY':sweep_integrity, 'SPARE_STEIN_HSK':spare_stein_hsk}
-     
-    # parse GENERAL SLOW  HSK SPARE
-    # *NOT IMPLEMENTED*
-
-    slowHSK_dict = {}
-    slowHSK_dict.update(flightmode)
-    slowHSK_dict.update(fsw_version)
-    slowHSK_dict.update(devenable)
-    slowHSK_dict.update(periphenable)
-    slowHSK_dict.update(misc)
-    slowHSK_dict.update(ssr_state)
-    slowHSK_dict.update(deploy_control)
-    slowHSK_dict.update(power_control)
-    slowHSK_dict.update(acs)
-    slowHSK_dict.update(mag_housekeeping)
-    slowHSK_dict.update(stein_housekeeping)
-    return slowHSK_dict
+    # return the parsed SLOW HSK log (from extract_slowHSK) as a dictionary
+    # re-assemble the 86-byte block, in extract_slowHSK() order
+    groups = ('FLIGHTMODE', 'FSW_VERSION', 'DEVENABLE', 'PERIPHENABLE', 'MISC', 'SSR_STATE', 
+            'DEPLOY_CONTROL', 'POWER_CONTROL', 'ACS', 'MAG_HOUSEKEEPING', 'STEIN_HOUSEKEEPING')
+    slowHSK_frame = bytearray(slowHSK_size)
+    cursor = 0
+    for group in groups:
+        slowHSK_frame[cursor:cursor+len(slow_hsk_log[group])] = bytearray(slow_hsk_log[group])
+        cursor += len(slow_hsk_log[group])
+
+    slowHSK = decode_slowHSK(np.frombuffer(bytes(slowHSK_frame), dtype=np.uint8))[0]
+    return dict(zip(slowHSK.dtype.names, slowHSK.tolist()))
 
 def parse_fastHSK_report(fast_hsk_log):
-    # return the parsed housekeeping log as a tuple of tuples
+    # return the parsed housekeeping log as a list of tuples
     # 336 values of 10 bits each, comprising a 48 element sequence repeated 7 times
-    # 48 element sequence = 44 housekeeping values + 4 spare (null) values
     # [arranged as 420-byte block, comprising 336 values...]
     #
-    increment = 48
-    n_repeats = 7
+    fastHSK_raw = np.array(fast_hsk_log).reshape(fastHSK_repeats, fastHSK_increment)
+    return fast_hsk_view(fastHSK_raw)
 
-    fastHSK_labels = (
-            "PANEL_X1_CURRENT", "PANEL_X2_CURRENT", "PANEL_Y1_CURRENT", "PANEL_Y2_CURRENT", 
-            "PANEL_Z1_CURRENT", "PANEL_Z2_CURRENT", # end 6 EPS/SP currents 
-            "PANEL_X_VOLT", "PANEL_X1_TEMP",
-            "PANEL_X2_TEMP","PANEL_Y_VOLT","PANEL_Y1_TEMP","PANEL_Y2_TEMP",
-            "PANEL_Z_VOLT","PANEL_Z1_TEMP","PANEL_Z2_TEMP","V5_BUS_CURRENT",
-            "V3.3_CURR","BATT_BUS_CURR", # end 12 EPS/ADC measurements
-            "BATT_CURR_DIR","BATT_VOLT",
-            "BATT_CURR","BATT_TEMP","BATT1_CURR_DIR","BATT1_VOLT",
-            "BATT1_CURR","BATT1_TEMP","BATT2_CURR_DIR","BATT2_VOLT",
-            "BATT2_CURR","BATT2_TEMP","CELL_VOLT","CELL1_VOLT",
-            "CELL2_VOLT", # end 15 BATT/ADC measurements
-            "VMON_RAW_N","VMON_RAW_P","SENSE",
-            "IMON_RAW","IIB_TEMP","VMON_MAG5V","SBAND_TEMP",
-            "VMON_STEIN5V","STEIN_TEMP","VMON_STEINHV8V","OLD_SBAND_TEMP", # end 11 misc onboard measurements
-            "SPARE1","SPARE2","SPARE3","SPARE4") # end 4 spare bytes
-    # 6 elements; EPS currents
-    # from the Clydespace EPS documentation
-    #              ADC channel (1, 4, 13, 7, 10, 31)
-    #              EPS nominal (+Array SA1 Current, -Array SA1 Current, 
-    #                                   +Array SA2 Current, -Array SA2 Current,
-    #                                           +Array SA3 Current, -Array SA3 Current)
-    #              EPS gloss   (PANEL_X1_CURRENT, PANEL_X2_CURRENT, 
-    #                                   PANEL_Y1_CURRENT, PANEL_Y2_CURRENT,
-    #                                           PANEL_Z1_CURRENT, PANEL_Z2_CURRENT)
-    eps_current_multiplier = (-1.94483, -1.955, -0.49881, -0.49928, -0.48533, -0.51985)
-    eps_current_addition = (1940.8, 1953.464, 517.4618, 517.6608, 502.9626, 521.7786)
-                
-    # 32 elements; EPS and ADC voltages, etc
-    # first 12: from the Clydespace EPS documentation
-    #              ADC channel (3, 2, 
-    #                                   5, 6, 
-    #                                           14, 8,
-    #                                                   9, 11,
-    #                                                           30, 26,
-    #                                                                   27, 17)
-    #              EPS nominal (Array SA1 Voltage, +Array SA1 Temperature,
-    #                                   -Array SA1 Temperature (error), Array SA2 Voltage,
-    #                                           +Array SA2 Temperature, -Array SA2 Temperature,
-    #                                                   Array SA3 Voltage, +Array SA3 Temperature,
-    #                                                           -Array SA3 Temperature, 5V Bus Current,
-    #                                                                  3.3V Bus Current, Battery Bus Curent) 
-    #              EPS gloss   (PANEL_X_VOLT, PANEL_X1_TEMP, 
-    #                                   PANEL_X2_TEMP, PANEL_Y_VOLT,
-    #                                           PANEL_Y1_TEMP, PANEL_Y2_TEMP, 
-    #                                                   PANEL_Z_VOLT, PANEL_Z1_TEMP,
-    #                                                           PANEL_Z2_TEMP, V5_BUS_CURRENT,
-    #                                                                   V3.3_CURR, BATT_BUS_CURR)
-    eps_adc_multiplier = (
-            -0.03532, -0.1619, -0.1619, -0.03474,  
-            -0.1619, -0.1619, -0.00855, -0.1619,
-            -0.1619, -4.39965, -3.20202, -4.94124)
-    eps_adc_addition = (
-            36.57826, 110.119, 110.119, 36.00065, 
-            110.119, 110.119, 8.810868, 110.119,
-            110.119, 4136.184, 2998.972, 4784.404)
-    # next 35: from the Clydespace BATT documentation
-    #              ADC channel (0,2,1,4,5,7,6,9,10,13,
-    #                           11,14,2,7,12)
-    #              BATT nominal (Battery Current Direction,Battery Voltage,
-    #                                   Battery Current, Battery Temperature,
-    #                                           Battery1 Current Direction, Battery1 Voltage,
-    #                                                   Battery1 Current, Battery1 Temperature,
-    #                                                           Battery2 Current Direction, Battery2 Voltage,
-    #                           Battery2 Current, Battery2 Temperature,
-    #                                   Cell Voltage, Cell1 Voltage,
-    #                                           Cell2 Volage)
-    #              BATT gloss   ("BATT_CURR_DIR","BATT_VOLT",
-    #                                   "BATT_CURR","BATT_TEMP",
-    #                                           "BATT1_CURR_DIR","BATT1_VOLT",
-    #                                                   "BATT1_CURR","BATT1_TEMP",
-    #                                                           "BATT2_CURR_DIR","BATT2_VOLT",
-    #                           "BATT2_CURR","BATT2_TEMP",
-    #                                   "CELL_VOLT","CELL1_VOLT",
-    #                                           "CELL2_VOLT")
-    #                                          ,"VMON_RAW_N",
-    #                                                   "VMON_RAW_P","SENSE",
-    #                                                           "IMON_RAW","IIB_TEMP",
-    #                           "VMON_MAG5V","SBAND_TEMP",
-    #                                   "VMON_STEIN5V","STEIN_TEMP",
-    #                                           "VMON_STEINHV8V","SBAND_TEMP",
-    #                                                   "SPARE1","SPARE2",
-    #                                                           "SPARE3","SPARE4")
-    
-    # 32 elements; EPS and ADC voltages, etc
-    # first 12: from the Clydespace EPS documentation
-    
-    
-    batt_adc_multiplier = (
-            1.0, -0.00939, -3.20, -0.163,
-            1.0, -0.00939, -3.20, -0.163, 
-            1.0, -0.00939, -3.20, -0.163,
-            -0.00483, -0.00483, -0.00483
-            )
-    batt_adc_addition = (
-            0.0, 9.791, 2926.22, 110.7,
-            0.0, 9.791, 2926.22, 110.7, 
-            0.0, 9.791, 2926.22, 110.7,
-            4.852724, 4.852724, 4.852724
-            )
-            # , 0.0, 
-            #0.0, 0.0, 0.0, 0.0)
-    misc_multiplier = [1.0]*15
-    misc_addition = [0.0]*15
-  
-    multiplier = []
-    multiplier.extend(eps_current_multiplier)
-    multiplier.extend(eps_adc_multiplier)
-    multiplier.extend(batt_adc_multiplier)
-    multiplier.extend(misc_multiplier)
-
-    addition = []
-    addition.extend(eps_current_addition)
-    addition.extend(eps_adc_addition)
-    addition.extend(batt_adc_addition)
-    addition.extend(misc_addition)
-
-    fastHSK = []
-    for i in range(increment):
-        index = range(i, increment*n_repeats+i, increment)
-        transfer = tuple([fast_hsk_log[j] for j in index])
-        fastHSK.append(transfer)
-    
-    fastHSK_dict = {}
 
-    return fastHSK
 
+# HSK packet type, by APID
+hsk_types = {0x264:"recordedHSK", 0x364:"recentHSK"}
 
 
-# parse HSK frame of hex packet_bytes
-def parse_hsk_frame(packet_bytes, includes_ccsds):
-    """Parse a packet of HSK data, returning a dictionary structure.
+class HskPacket(packet_record.PacketRecord):
+    """Record of an unpacked HSK data packet (with dictionary-style access)."""
+    __slots__ = ('apid',                    # 0x264 (recorded) or 0x364 (recent); None without CCSDS
+            'type',                         # "HSK", or if known, "recordedHSK" or "recentHSK"
+            'refined_timestamp',            # numpy.datetime64 (see timeops.assign_packettimes)
+            'slow_hsk',                     # a slowHSK_dtype record (indexed by label)
+            'fast_hsk',                     # 48 tuples of 7 raw values
+            'fast_hsk_raw',                 # (7, 48) raw values
+            'fast_hsk_eng')                 # (7, 48) engineering values
+    _constants = ('packet_timestamp_format', 'slow_hsk_format', 'fast_hsk_format')
+    _views = {'fast_hsk':('fast_hsk_raw', fast_hsk_view)}
+
+    packet_timestamp_format = ('MM','DD','HH','mm','ss','ff')
+    slow_hsk_format = slowHSK_dtype.names
+    fast_hsk_format = fastHSK_labels
+
+
+# parse HSK frames of hex packet_bytes
+def parse_hsk_frames(packet_array, includes_ccsds):
+    """Parse an array of HSK data packets, returning a list of HskPacket records.
 
     Arguments:
-    packet_bytes -- iterable of bytes comprising a HSK data packet
+    packet_array -- (n_packets, packet_size) array of bytes comprising HSK data packets
     includes_ccsds -- Boolean argument, indicating presence of CCSDS header
+
+    The SLOW HSK of every packet is decoded together by decode_slowHSK();
+    each packet's 'slow_hsk' is its row of the (n_packets,) structured array.
+    The FAST HSK of every packet is decoded and calibrated together by
+    decode_fastHSK(); each packet keeps its (7, 48) 'fast_hsk_raw' and
+    'fast_hsk_eng' slices, along with the 'fast_hsk' list of tuples.
+    Each packet's 'apid' and 'type' are those of its CCSDS header.
     """
 
     # HSK DATA PACKET PARAMETERS
@@ -444,27 +498,28 @@ def parse_hsk_frame(packet_bytes, includes_ccsds):
     packetheader_size = 0       # size (BYTES) of packet header 
                                 #   (e.g. "0xAF" for STEIN)
     timestamp_size = 6          # size (BYTES) of packet timestamp
-    slowHSK_size = 86         # size (BYTES) of HSK packet slow housekeeping subframe
-    fastHSK_size = 420       # size (BYTES) of HSK packet fast housekeeping subframe
-        # NOTE: this is 420-bytes
+        # NOTE: the slow housekeeping subframe is 86-bytes,
+        #   and the fast housekeeping subframe is 420-bytes
     fastHSKblock_size = fastHSK_size/7  
         # NOTE: this is 60-bytes
         #sparebyte_size = 2          # size (BYTES) of packet unused bytes
         # NOTE: the observed packet size is actually 514 bytes; 
         #   the final 2 bytes are spurious
 
+    packet_array = np.asarray(packet_array, dtype=np.uint8)
+
     # PARSE HEX BYTES
     cursor = 0          # byte-position cursor (for packet bytes)
 
     # CCSDS
-    packet_ccsds = packet_bytes[cursor:cursor+ccsds_size]
+    packet_ccsds = packet_array[:,cursor:cursor+ccsds_size].tolist()
     cursor += ccsds_size
     
     # PACKET HEADER
-    packet_header = packet_bytes[cursor:cursor+packetheader_size]
+    packet_header = packet_array[:,cursor:cursor+packetheader_size].tolist()
     cursor += packetheader_size
     # PACKET TIMESTAMP
-    packet_timestamp = packet_bytes[cursor:cursor+timestamp_size]
+    packet_timestamp = packet_array[:,cursor:cursor+timestamp_size].tolist()
     cursor += timestamp_size
    
 
@@ -472,74 +527,62 @@ def parse_hsk_frame(packet_bytes, includes_ccsds):
     # HOUSEKEEPING DATA
     #   NOTE: properly, this should be protected with if/else-statements
    
-    # get SLOW HSK bytes
-    slowHSK_frame = packet_bytes[cursor:cursor+slowHSK_size]
+    # get SLOW HSK bytes, and decode the SLOW HSK of every packet
+    slowHSK = decode_slowHSK(packet_array[:,cursor:cursor+slowHSK_size])
     cursor += slowHSK_size
-   
-    # extract a SLOW HSK dictionary
-    slowHSK_log = extract_slowHSK(slowHSK_frame)
 
-    # parse SLOW HSK log into SLOW HSK
-    slowHSK = parse_slowHSK_report(slowHSK_log)
-
-    
-    # get FAST HSK bytes
-    fastHSK_frame = packet_bytes[cursor:cursor+fastHSK_size]
+    # get FAST HSK bytes, and decode/calibrate the FAST HSK of every packet
+    fastHSK_raw, fastHSK_eng = decode_fastHSK(packet_array[:,cursor:cursor+fastHSK_size])
     cursor += fastHSK_size
-   
-    # extract a FAST HSK log
-    fastHSK_log = extract_fastHSK(fastHSK_frame)
-    
-    # parse FAST HSK log into FAST HSK
-    fastHSK = parse_fastHSK_report(fastHSK_log)
     # -----------------
 
     #
     # SPARE BYTES (UNIMPLEMENTED)
     
     
-    # return a dictionary structure
-    this_frame = {'apid':0x364,                  # 0x264 (recorded) or 0x364 (recent)
-        'type':"HSK",                           # "HSK", or if known, "recordedHSK" or "recentHSK"
-        'tframe_header':None,                   # to be filled in, if available
-        'packet_ccsds':tuple(packet_ccsds), 
-        'packet_header':tuple(packet_header),   # () for HSK paackets 
-        'packet_timestamp':tuple(packet_timestamp), 
-        'packet_timestamp_format':('MM','DD','HH','mm','ss','ff'),
-        'refined_timestamp':None,               # to be filled in with a datetime.datetime
-        'slow_hsk':slowHSK,                     # a dictionary 
-        'slow_hsk_format':None,
-        'fast_hsk':fastHSK,                     # a dictionary
-        'fast_hsk_format':None,
-        'clock_time':None,                      # this is filled in later
-        'clock_time_format':"YYYY MM DD HH mm ss ffffff",
-        'clock_time_quality':None,              # this is filled in later
-        'source_file':None,                     # to contain filename/path
-        'source_file_hash':None,                # to contain a hash
-        'extraction_date':None                  # to contain the date
-        }
-    return this_frame
-
-
-def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False, separator=' '):
-    # to be fleshed out, with export options for ASCII, CDF, python-pickle, etc.
-    source_hashes = [packet['source_file_hash'] for packet in data_packet_dict]
-    hash_set = set(source_hashes)
-    source_info = []
-    for hash in hash_set:
-        pos = source_hashes.index(hash)
-        source_filename = data_packet_dict[pos]['source_file']
-        if (source_filename == None):
-            source_info.append("%   Not available\r\n")
+    # return a list of (dictionary-like) packet records
+    frames = []
+    for i in range(len(packet_array)):
+        if includes_ccsds:
+            apid = ((packet_ccsds[i][0] & 0b111) << 8) + packet_ccsds[i][1]
         else:
-            source_info.append("%   " + source_filename + "\r\n%     SHA1 hash:" + hash + "\r\n")
+            apid = None
+        this_frame = HskPacket(apid=apid, type=hsk_types.get(apid, "HSK"),
+            packet_ccsds=tuple(packet_ccsds[i]), 
+            packet_header=tuple(packet_header[i]),  # () for HSK paackets 
+            packet_timestamp=tuple(packet_timestamp[i]), 
+            slow_hsk=slowHSK[i],
+            fast_hsk=fast_hsk_view(fastHSK_raw[i]),
+            fast_hsk_raw=fastHSK_raw[i],
+            fast_hsk_eng=fastHSK_eng[i])
+        frames.append(this_frame)
+    return frames
+
+
+# parse HSK frame of hex packet_bytes
+def parse_hsk_frame(packet_bytes, includes_ccsds):
+    """Parse a packet of HSK data, returning a HskPacket record.
+
+    Arguments:
+    packet_bytes -- bytes comprising a HSK data packet (any sequence or buffer
+                    of bytes, including numpy.uint8/memoryview frame views)
+    includes_ccsds -- Boolean argument, indicating presence of CCSDS header
+    """
+    packet_array = np.frombuffer(bytearray(packet_bytes), dtype=np.uint8)
+    return parse_hsk_frames(packet_array.reshape(1, -1), includes_ccsds)[0]
+
+
+def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False, separator=' ', **kwargs):
+    # to be fleshed out, with export options for ASCII, CDF, python-pickle, etc.
+    # (further keyword arguments, e.g. the pass's 'year', are those of
+    #   timeops.reconstruct_packettimes(), for packets not already timed)
     header_lines = (
             "%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\r\n",
             "% CINEMA[1] HSK Event List (example)\r\n",
             "%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\r\n",
             "% Support Info:\r\n",
             "% SOURCE:\r\n",
-            "".join(source_info),
+            provenance.source_info(data_packet_dict),
             "% SOURCE DESCRIPTION:\r\n",
             "% -- VARIABLEs --\r\n",
             "% Generated {0}\r\n".format(datetime.datetime.now().replace(microsecond=0).isoformat()),
@@ -580,7 +623,11 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False,
                 ccsds=separator.join(["apid","packet_count"]),
                 slow=separator.join(slow_order),
                 fast=separator.join(fast_order)*repeat))
-            for i,packet in enumerate(data_packet_dict):
+            # packet times, reconstructed once for the pass (or shared, where
+            # already assigned: see timeops.assign_packettimes)
+            packet_dts = timeops.packettimes(data_packet_dict, **kwargs)[0].view('datetime64[ns]').astype(
+                    'datetime64[us]').tolist()
+            for i,(packet,packet_dt) in enumerate(zip(data_packet_dict, packet_dts)):
                 
                 # ccsds data
                 apid = ((packet['packet_ccsds'][0] & 0b111) << 8) + packet['packet_ccsds'][1]
@@ -601,18 +648,8 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False,
                     fast_data.extend([value[i] for value in packet['fast_hsk']])
                 fast_data2 = separator.join(map(str,fast_data)) 
                
-                # assemble an unrefined datetime object from packet_timestamp 
-                # (instantiate a datetime tzinfo object)
-                utc = timeops.UTC()             # use UTC, without any application of DST
-                
-                pt_isvalid = timeops.validate_packettime(packet['packet_timestamp'])
-                year = 2012
-                if pt_isvalid:
-                    packet_dt = datetime.datetime(year,                     # YYYY,
-                            packet['packet_timestamp'][0], packet['packet_timestamp'][1],       # MM, DD,
-                            packet['packet_timestamp'][2], packet['packet_timestamp'][3],           # HH, mm,
-                            packet['packet_timestamp'][4], 10000*packet['packet_timestamp'][5],     # ss, us,
-                            tzinfo=utc)
+                # (packet_dt, the reconstructed packet time, is None where packet_timestamp is invalid)
+                if packet_dt != None:
                     packet_dt_ascii = packet_dt.isoformat() 
                 else:
                     packet_dt_ascii = "YYYY-MM-DDTHH:MM:SS.mmmmmm"
@@ -645,7 +682,11 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False,
                 s=separator,
                 ccsds=separator.join(["apid","packet_count"]),
                 slow=separator.join(slow_order)))
-            for i,packet in enumerate(data_packet_dict):
+            # packet times, reconstructed once for the pass (or shared, where
+            # already assigned: see timeops.assign_packettimes)
+            packet_dts = timeops.packettimes(data_packet_dict, **kwargs)[0].view('datetime64[ns]').astype(
+                    'datetime64[us]').tolist()
+            for i,(packet,packet_dt) in enumerate(zip(data_packet_dict, packet_dts)):
                 
                 # ccsds data
                 apid = ((packet['packet_ccsds'][0] & 0b111) << 8) + packet['packet_ccsds'][1]
@@ -662,18 +703,8 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False,
                 
                 # fast data
 
-                # assemble an unrefined datetime object from packet_timestamp 
-                # (instantiate a datetime tzinfo object)
-                utc = timeops.UTC()             # use UTC, without any application of DST
-               
-                pt_isvalid = timeops.validate_packettime(packet['packet_timestamp'])
-                year = 2012
-                if pt_isvalid:
-                    packet_dt = datetime.datetime(year,                     # YYYY,
-                            packet['packet_timestamp'][0], packet['packet_timestamp'][1],           # MM, DD,
-                            packet['packet_timestamp'][2], packet['packet_timestamp'][3],           # HH, mm,
-                            packet['packet_timestamp'][4], 10000*packet['packet_timestamp'][5],     # ss, us,
-                            tzinfo=utc)
+                # (packet_dt, the reconstructed packet time, is None where packet_timestamp is invalid)
+                if packet_dt != None:
                     packet_dt_ascii = packet_dt.isoformat() 
                 else:
                     packet_dt_ascii = "YYYY-MM-DDTHH:MM:SS.mmmmmm"
@@ -706,7 +737,11 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False,
                 s=separator,
                 ccsds=separator.join(["apid","packet_count"]),
                 fast=separator.join(fast_order)))
-            for i,packet in enumerate(data_packet_dict):
+            # packet times, reconstructed once for the pass (or shared, where
+            # already assigned: see timeops.assign_packettimes)
+            packet_dts = timeops.packettimes(data_packet_dict, **kwargs)[0].view('datetime64[ns]').astype(
+                    'datetime64[us]').tolist()
+            for i,(packet,packet_dt) in enumerate(zip(data_packet_dict, packet_dts)):
                 
                 # ccsds data
                 apid = ((packet['packet_ccsds'][0] & 0b111) << 8) + packet['packet_ccsds'][1]
@@ -717,20 +752,7 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False,
                 
                 # slow data
                 
-                # assemble an unrefined datetime object from packet_timestamp 
-                # (instantiate a datetime tzinfo object)
-                utc = timeops.UTC()             # use UTC, without any application of DST
-                
-                pt_isvalid = timeops.validate_packettime(packet['packet_timestamp'])
-                year = 2012
-                if pt_isvalid:
-                    packet_dt = datetime.datetime(year,                     # YYYY,
-                            packet['packet_timestamp'][0], packet['packet_timestamp'][1],           # MM, DD,
-                            packet['packet_timestamp'][2], packet['packet_timestamp'][3],           # HH, mm,
-                            packet['packet_timestamp'][4], 10000*packet['packet_timestamp'][5],     # ss, us,
-                            tzinfo=utc)
-                else:
-                    packet_dt = None
+                # (packet_dt, the reconstructed packet time, is None where packet_timestamp is invalid)
 
                 
                 # fast data
@@ -19,8 +19,11 @@
 #
 #
 
+import collections
 import datetime
+import multiprocessing
 import numpy as np
+import cinema_timeops_v0_1_0 as timeops
 
 
 
@@ -56,6 +59,25 @@ gra_cycles = 8          # cycles: acquire 4 vectors, every other cycle (16 Hz; 8
 # -----------------------------
 
 
+# samples per MAGIC packet
+samples_per_packet = 39
+
+# 128 Hz clock cycles per sample, by instrument mode
+mode_cycles = {attitude:att_cycles, scienceAPr:sci_cycles, gradiometer:gra_cycles}
+
+# packet time steps are compared in integer microseconds (as timedelta
+#   arithmetic), against the expected step of 39 samples
+day_us = 86400*10**6
+loose_tolerance = 300       # seconds (RTC rollover)
+tight_tolerance = 0.1       # seconds (RTC jitter, dropped frames)
+
+# packets of a continuous block, timed by IncrementalClockFit: 'start' is
+#   the (stream) index of the first packet, 'sample_times' the
+#   (n_packets*39,) numpy.datetime64[ns] sample times, 'quality' the QoD
+#   of each packet, and 'final' True once the block has closed
+TimedPackets = collections.namedtuple('TimedPackets', 'start packets sample_times quality final')
+
+
 # -----------------------------
 # Quality of Data (QoD)
 # -----------------------------
@@ -95,8 +117,69 @@ class UTC(datetime.tzinfo):
         return datetime.timedelta(0)
 
 
-def calc_fitted_sampletime(packet_list, year=2012, month=1, day=3):
 
+
+def calc_fitted_sampletime(packet_list, year=2012, month=1, day=3, repair=True, dates=None,
+        processes=1):
+    """Fit MAGIC packet times to the 128 Hz cycle count, and time every sample.
+
+    Arguments:
+    packet_list -- list of MAGIC packets, in order of acquisition
+
+    Keyword arguments:
+    year, month, day -- date of the first packet (MAGIC packet_timestamps
+                        are (HH,mm,ss,ff) only)
+    repair -- Boolean argument, as for fit_sampletimes() (default True)
+    dates -- array of the date of each packet, as for fit_sampletimes()
+             (default None; see anchor_dates())
+    processes -- number of worker processes, as for fit_sampletimes() (default 1)
+
+    Return value:
+    (packet_list, quality_array) -- every packet of a continuous block has
+    its 'clock_time' set to its (39,) slice of the fit_sampletimes()
+    sample times (numpy.datetime64[ns]); 'quality_array' holds the QoD of
+    packets (even elements) and packet boundaries (odd elements)
+    """
+    sample_times, quality_array = fit_sampletimes(packet_list, year=year, month=month, day=day,
+            repair=repair, dates=dates, processes=processes)
+    packet_times = sample_times.reshape(-1, samples_per_packet)
+    for i in np.flatnonzero(~np.isnat(packet_times[:,0])):
+        packet_list[i]['clock_time'] = packet_times[i]
+    return packet_list, quality_array
+
+
+def fit_sampletimes(packet_list, year=2012, month=1, day=3, repair=True, dates=None,
+        processes=1):
+    """Fit MAGIC packet times to the 128 Hz cycle count, returning every sample time.
+
+    Arguments:
+    packet_list -- list of MAGIC packets, in order of acquisition
+
+    Keyword arguments:
+    year, month, day -- date of the first packet
+    repair -- Boolean argument; if True (default), byte-shifted
+              packet_timestamps are repaired by timeops.repair_packettimes()
+              (as QoD 3: timed in their block, but not fitted), rather
+              than breaking blocks as bad timestamps (QoD 19)
+    dates -- int64 array of the date of each packet, in epoch nanoseconds
+             (timeops.nat_ns where unknown), as given by anchor_dates();
+             each block is dated by its packets (see anchored_starts()),
+             and 'year', 'month', 'day' are used only where none are
+             known (default None, for 'year', 'month', 'day' throughout)
+    processes -- number of worker processes over which to fit blocks (see
+                 fit_blocks(); default 1, every block in this process;
+                 None, one per CPU)
+
+    Return value:
+    (sample_times, quality_array) -- a (n_packets*39,) numpy.datetime64[ns]
+    array of sample times, aligned with the packets' samples (NaT outside
+    of continuous blocks), and the QoD array of packets (even elements)
+    and packet boundaries (odd elements)
+
+    Blocks of continuous data (QoD <= 7) are fitted one at a time, by
+    fit_timestamps(), and the fit evaluated at the cycle time of each
+    sample of the block at once.
+    """
     # Create a working array in which we mark QoD for 
     #   packets and packet boundaries.  Even-indexed elements 
     #   (e.g. 0,2,4,..) contain QoD for packets, while the
@@ -104,306 +187,516 @@ def calc_fitted_sampletime(packet_list, year=2012, month=1, day=3):
     #   packet boundaries.  Initialized as QoD=0 [CREDIBLE]
     n_packets = len(packet_list)
     quality_array = np.zeros((n_packets*2), dtype=np.uint8)
+    sample_times = np.empty(n_packets*samples_per_packet, dtype='datetime64[ns]')
+    sample_times[:] = np.datetime64('NaT')
+    if (n_packets == 0):
+        return sample_times, quality_array
     quality_array[-1] = 20      # a "break" in the very last element
 
-    last_mode = -1              # last packet's mode
-    previous_time = -1          # last (valid) packet's time
-    rollover_cnt = 0            # counter for daily timetuple rollover events
-    x_time = []                 # storage list for accumulated "cycle_seconds" at each packet
-    y_time = []                 # list of datetime objects (for conversion to timedelta.total_seconds)
-    cycle_seconds = 0           # accumulating count of elapsed cycles, in seconds  
-
-    # ----------------------------------------------------------------
-    # ----------------------------------------------------------------
-    # Make initial Quality-of-Data (QoD) determinations
-    for i,packet in enumerate(packet_list):
-        
-        # -- QoD = 19: examine packet_timestamps
-        #   (if it contains invalid values, the packet can't be trusted)
-        #   Work-around: if the RTC is garbage, we can manually change
-        #       the packet_timestamp field, before getting this far.
-        pt_isvalid = validate_packettime(packet['packet_timestamp'])
-
-        # mark BAD packets with QoD = 19
-        if (not pt_isvalid):
-            quality_array[2*i] = 19             # QoD (bad timestamp)
-            # pass information to user
-            print("Bad Timestamp in Packet #: " + str(i))
-           
-
-        # -- QoD = 9: examine MODE switches
-        #   (buffer cleared during MODE switch, so certain discontinuity)
-        #   CINEMA1: individual packets only contain samples of one mode
-        packet_mode = packet['magic_data'][0][0][0]     # 1st sample, status tuple, mode      
-        
-        if (last_mode != -1) and (last_mode != packet_mode):
-            # mark the (intermediate) packet boundary
-            quality_array[2*i - 1] = 9          # QoD (certain datagap)
-            previous_time = -1                  # clear stored "previous_time"
-        last_mode = packet_mode         # store the current packet_mode
-
-        # examine the mode we're in (for next loop iteration) 
-        #   CINEMA1: individual packets only contain samples of one mode
-        if (packet_mode == attitude):
-            increment = 39.*(att_cycles/128.)   # seconds
-        elif (packet_mode == scienceAPr):
-            increment = 39.*(sci_cycles/128.)   # seconds
-        elif (packet_mode == gradiometer):
-            increment = 39.*(gra_cycles/128.)   # seconds
-        else: 
-            increment = 0
-
-        # -- QoD = 3: examine PACKET_TIMESTAMP for RTC rollover, jitter, and dropped frames
-        #   Strict requirements for time: t2 > t1
-        #   Loose requirements for time: abs(abs(t2 - t1) - increment) <= tolerance
-        #   Also examine packet_timestamps for I2C byte shift.
-        #   (e.g. RTC "day of month" has slipped into HH slot, bumping 
-        #       all subsequent RTC tuple entries, and displacing fracsec)
-        #   Preference given to rollover events; byte-shift errors not handled
-        timetuple = packet['packet_timestamp']
-
-        if (pt_isvalid):
-            # store timetuple in a timedelta object
-            current_time = datetime.timedelta(
-                    days = rollover_cnt,
-                    hours=timetuple[0],
-                    minutes=timetuple[1], seconds=timetuple[2],
-                    milliseconds=10*timetuple[3])
-
-            # define tolerances
-            loose_tolerance = 300       # seconds
-            tight_tolerance = 0.1       # seconds
-
-            # check for data with which to compare
-            if (previous_time == -1):
-                y_time.append(current_time)
-                x_time.append(0)
-                previous_time = current_time
-            else:
-                delta = (current_time - previous_time).total_seconds()
-                
-                # we have a strict requirement that t2 > t1
-                if (current_time <= previous_time):
-                    # possibilities:
-                    # 1) timestamp may be *BAD*
-                    # 2) RTC may have been (re)set
-                    # 3) we may have just rolled over
-                    # 4) data may be duplicate
-
-                    # considering the rollover possibility
-                    if abs(abs(delta) - 86400) < loose_tolerance:
-                        # rollover is likely
-                        current_time = current_time + datetime.timedelta(days=1)
-                        rollover_cnt += 1
-                        delta = (current_time - previous_time).total_seconds()
-                    else:
-                        # assume that timestamp is somehow bad, but that data is good
-                        # mark timestamp as BAD
-                        quality_array[2*i] = 19
-                        
-                        # increment current_time as expected
-                        current_time = previous_time + datetime.timedelta(seconds=increment) 
-                        delta = (current_time - previous_time).total_seconds()
-
-                # test for:
-                # 1) RTC jitter
-                # 2) dropped frames
-                # 3) RTC jitter *on top* of dropped frames
-
-                # examine adjacent frames for RTC jitter (incorrect seconds field in RTC timestamp)
-                f_diff = (delta - increment)    # frame difference
-                jitter = abs(f_diff - round(f_diff)) < tight_tolerance
-
-                # examine adjacent frames for evidence of a dropped frame
-                f_mult = (delta/increment)    # frame multiple
-                dropped = abs(f_mult - round(f_mult)) < tight_tolerance
-
-                # examine adjacent frames for evidence of jitter+dropping
-                plusminus = np.array((-1,1))
-                f_mult2 = (delta+plusminus)/increment
-                jittdrop = abs(f_mult2 - map(round,f_mult2)) < tight_tolerance
-                
-                # ----------------------------------------------------------------
-                # -- DIAGNOSTIC PRINTOUT (uncomment) --
-                #print (i, timetuple, delta, jitter, dropped, jittdrop[0], jittdrop[1])
-                # ----------------------------------------------------------------
-              
-
-                # handle test results 
-                if (jitter):
-                    # expected
-                    cycle_seconds += increment 
-                    y_time.append(current_time) # mostly correct (possible jitter)
-                    x_time.append(cycle_seconds)
-                elif (dropped):
-                    quality_array[2*i] = 3      # placeholder QoD
-                    cycle_seconds += increment*round(f_mult) 
-                    y_time.append(current_time) # correct, but with regular datagap
-                    x_time.append(cycle_seconds)
-                elif (jittdrop.any()):
-                    # getting complicated
-                    quality_array[2*i] = 3      # placeholder QoD     
-                    pos = (jittdrop.tolist()).index(True)
-                    cycle_seconds += increment*round(f_mult2[pos]) 
-                    y_time.append(current_time) # mostly correct, but with regular datagap (and possible jitter)
-                    x_time.append(cycle_seconds)
-                else:
-                    # yipes.. looking bad
-                    quality_array[2*i-1] = 19   # placeholder QoD
-                    cycle_seconds += increment 
-                    y_time.append(current_time) # assume the data is good 
-                    x_time.append(cycle_seconds)
+    # (first sample of each packet; CINEMA1 packets hold samples of one mode)
+    first_samples = np.concatenate([packet['magic_samples'][:1] for packet in packet_list])
+    modes = first_samples['MODE'].astype(np.int64)
+    timestamps = np.array([packet['packet_timestamp'] for packet in packet_list],
+            dtype=np.int64).reshape(n_packets, 4)
+    if repair:
+        timestamps, repaired = timeops.repair_packettimes(timestamps)
+    x_time, y_time, valid = accumulate_cycle_times(timestamps, modes, quality_array)
+    if repair:
+        repaired = 2*np.flatnonzero(repaired)
+        quality_array[repaired] = np.maximum(quality_array[repaired], 3)   # QoD (corrected timestamp)
 
-            previous_time = current_time 
-        else:
-            y_time.append(())
-            x_time.append(())
-    
-    # ----------------------------------------------------------------
-    # -- DIAGNOSTIC PRINTOUT (uncomment) --
-    # -- prints the raw packet_timestamp tuple, followed by the (Y,X) pair to fit 
-    #for i,packet in enumerate(packet_list):
-    #    print i, packet['packet_timestamp'], y_time[i], x_time[i]
-    # ----------------------------------------------------------------
-
-    
     # Build blocks of continuous good packet data
     #   (break on BAD data)
     #   Usage: anything above 'threshold' causes a break)
     continuous_blocks = generate_ranges(quality_array, threshold=7)    
-    
-    # (instantiate a datetime tzinfo object)
-    utc = UTC()         # use UTC, without any application of DST
-    start = datetime.datetime(year,month,day, tzinfo=utc)
+
+    start = date_epoch_ns(year, month, day)
+    if dates is None:
+        block_starts = [start]*len(continuous_blocks)
+    else:
+        block_starts = anchored_starts(timestamps, y_time, valid, dates, continuous_blocks, start)
 
     # examine blocks of continuous data
-    for block in continuous_blocks:
-        s = block[0]    # start packet
-        f = block[1]    # finish packet
-
-        c_time = x_time[s:f]    # cycle time (value of 128Hz clock, in seconds)
-        r_time = y_time[s:f]    # RTC time
-            
-        # obtain a linear fit
-        #   p_coeff = (m,b)
-        packet_quality = quality_array[2*s:2*f]
-        
-        #if len(c_time) > 0:
-        (p_coeff,first_timestamp) = fit_timestamps(c_time, r_time, packet_quality)
-        if (p_coeff[0] > 1.1 or p_coeff[0] < 0.95):
+    results = fit_blocks(x_time, y_time, quality_array, first_samples, continuous_blocks,
+            block_starts, processes=processes)
+    for (s, f), (block_times, failed) in zip(continuous_blocks, results):
+        if failed:
             quality_array[2*s:2*f:2] = 17       # QoD (flag as ALGORITHM FAILED) 
-        # p_coeff = (1., p_coeff[1])            # a kludge, not to be used
-        #else:
-        #    (p_coeff,first_timestamp) = ((1.,0), r_time[0])
-        
-        # ----------------------------------------------------------------
-        # -- DIAGNOSTIC PRINTOUT (uncomment) --
-        # -- prints PACKET_QUALITY subset for working block and fit packet_timestamp
-        #print("--------------")
-        #print ("PACKET_QUALITY: [" + str(s) + ":" + str(f) + "]")
-        #print(packet_quality)
-        #for i,packet in enumerate(packet_list[s:f]):
-        #    packet_mode = packet['magic_data'][0][0][0] 
-        #    temp_dt = np.polyval(p_coeff,c_time[i])
-        #    tdate = (datetime.datetime(year,month,day) + first_timestamp + datetime.timedelta(seconds=temp_dt))
-        #    print(s+i, packet_mode, packet['packet_timestamp'], (tdate.hour, tdate.minute, tdate.second, tdate.microsecond/10000))
-        #print("--------------")
-        # ----------------------------------------------------------------
-
-
-        # build "clock time" from "cycle time" fit of RTC
-        for i,packet in enumerate(packet_list[s:f]):
-   
-            # CINEMA1: individual packets only contain samples of one mode
-            # NOTE: if this changes, then the following should be moved to be
-            #   within the per-sample loop, such that sample[0][0] takes the
-            #   place of "packet_mode" and is checked every iteration.
-            packet_mode = packet['magic_data'][0][0][0] # consider the first sample
-
-            # look to see whether the sample MAG_DATA or IB_TEMP
-            if (packet['magic_data'][0][0][2] == temp):
-                # IB diode temperature measurement
-                # - begin sample acquisition approx. every 300 seconds
-                # ** UNIMPLEMENTED IN CINEMA1 **
-                raise Exception("Error! (MAGIC: TEMP Unimplemented in CINEMA1)")
-            elif (packet_mode == attitude):
-                # Attitude Mode
-                # - vector acquisition every other (odd) interrupt
-                # - complete sample effectively occupies 8 consecutive cycles
-                # - 128Hz / 2 interrupts / 4 vectors = 16 Hz sample  
-                increment = att_cycles
-            elif (packet_mode == scienceAPr):
-                # Science Mode
-                # - extended settle time: vector acquisition every 4th interrupt
-                # - individual vector returned in 1 cycle
-                # - complete sample effectively occupies 16 cycles
-                # - 128Hz / 4 interrupts / 4 vectors = 8 Hz sample
-                increment = sci_cycles
-            elif (packet_mode == gradiometer):
-                # Gradiometer Mode
-                # - vector acquisition every other (even) interrupt
-                # - effectively occupies 8 consecutive cycles (half-sample)
-                # - 128Hz / 2 interrupts / 4 vectors = 16 Hz sample (OB)
-                # - half-sample written to data frame
-                # (the same is performed for IB vectors in the next 8 cycles)
-                increment = gra_cycles
-            else:
-                # Unrecognized sample type!
-                raise Exception("Error! (MAGIC: Unrecognized mode type)")
-            
-            # instantiate storage list for "clock time"
-            clocktime = []      # fit-derived datetime.datetime objects
-           
-            # begin looping over samples
-            cycles_elapsed = 0  # number of cycles elapsed (per packet)
-            for j, sample in enumerate(packet['magic_data']):
-                
-                # perform evaluation
-                cycletime = c_time[i] + (cycles_elapsed/128.)
-                dt = np.polyval(p_coeff,cycletime)
-                fit_time = (start + first_timestamp + datetime.timedelta(seconds=dt))
-                clocktime.append(fit_time)
-        
-                # ----------------------------------------------------------------
-                # -- DIAGNOSTIC PRINTOUT (uncomment) --
-                # -- prints the raw packet_timestamp tuple, followed by the fit-derived time tuple 
-                ##time_tuple = packet['packet_timestamp']
-                ##dd = fit_time.day
-                ##hr = fit_time.hour
-                ##mi = fit_time.minute
-                ##sec = fit_time.second
-                ##ff = fit_time.microsecond/1000
-                ###if (j == 0):
-                ##print(s+i, j, packet_mode, time_tuple, (hr,mi,sec,ff))
-                # ----------------------------------------------------------------
-
-                # increment cycles_elapsed
-                cycles_elapsed += increment
-
-            # stow fit-derived "clock time" in per event/sample time field
-            packet['clock_time'] = clocktime
+        sample_times[s*samples_per_packet:f*samples_per_packet] = block_times
 
-    return packet_list, quality_array
+    return sample_times, quality_array
+
+
+def date_epoch_ns(year, month, day):
+    """Return the start of a (UTC, without any application of DST) date, in epoch nanoseconds."""
+    return (datetime.date(year,month,day).toordinal() - datetime.date(1970,1,1).toordinal())*86400*10**9
+
+
+def anchored_starts(timestamps, y_time, valid, dates, blocks, default):
+    """Return the start date of each block of continuous data, from the dates of its packets.
+
+    Arguments:
+    timestamps -- (n_packets, 4) integer array of packet_timestamps (HH,mm,ss,ff)
+    y_time -- RTC time of each packet (int64 microseconds from the start of
+              the first day, as accumulate_cycle_times())
+    valid -- Boolean mask of packets with valid timestamps
+    dates -- int64 array of the date of each packet, in epoch nanoseconds
+             (timeops.nat_ns where unknown)
+    blocks -- list of (start, stop) packet ranges (as generate_ranges())
+    default -- epoch nanoseconds of the first day, where no packet is dated
+
+    Return value:
+    list of the epoch nanoseconds of the first day of each block (the
+    'start' of fit_block()), i.e. the (lower) median, over its dated
+    packets, of each one's date less the RTC rollovers before it; a block
+    with no dated packets takes the median over every dated packet
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    dates = np.asarray(dates, dtype=np.int64)
+    time_of_day = ((timestamps[:,0]*60 + timestamps[:,1])*60 + timestamps[:,2])*10**6 \
+            + timestamps[:,3]*10**4
+    dated = valid & (dates != timeops.nat_ns)
+    starts = dates + (time_of_day - y_time)*1000
+
+    def lower_median(values):
+        return int(np.sort(values)[(len(values) - 1)//2])
+
+    if dated.any():
+        default = lower_median(starts[dated])
+    block_starts = []
+    for (s, f) in blocks:
+        block_dated = dated[s:f]
+        if block_dated.any():
+            block_starts.append(lower_median(starts[s:f][block_dated]))
+        else:
+            block_starts.append(default)
+    return block_starts
+
+
+def anchor_dates(science_packets, hsk_packets=(), **kwargs):
+    """Date the MAGIC packets of a pass, by its full-timestamped STEIN (and HSK) packets.
+
+    Arguments:
+    science_packets -- list of science packets (MAGIC and STEIN, in frame
+                       order, as read_raw_hexbytes())
+
+    Keyword arguments:
+    hsk_packets -- list of HSK packets of the pass, by which to date MAGIC
+                   packets with no STEIN packet to anchor them (default ())
+    Further keyword arguments are those of timeops.reconstruct_packettimes().
+
+    Return value:
+    (magic_packets, dates) -- the list of MAGIC packets, and an int64 array
+    of the date of each (the epoch nanoseconds of the start of its day;
+    timeops.nat_ns where it can't be dated), for fit_sampletimes()
+
+    Each MAGIC packet is anchored by the nearest STEIN packet (in frame
+    order) with a good time (QoD <= 3), preferring one within the same
+    run of continuous CCSDS packet counts; its date is that (of the day
+    before, of, or after the anchor) which puts its (HH,mm,ss,ff) nearest
+    the anchor.  Failing a STEIN anchor, the date is that which puts it
+    nearest any good HSK packet time.
+    """
+    science_packets = [packet for packet in science_packets
+            if (packet is not None) and not isinstance(packet, tuple)]
+    is_magic = np.array([packet['type'] == 'MAGIC' for packet in science_packets], dtype=bool)
+    is_stein = np.array([packet['type'] == 'STEIN' for packet in science_packets], dtype=bool)
+    magic_packets = [packet for packet in science_packets if packet['type'] == 'MAGIC']
+    stein_packets = [packet for packet in science_packets if packet['type'] == 'STEIN']
+    dates = np.empty(len(magic_packets), dtype=np.int64)
+    dates.fill(timeops.nat_ns)
+    if len(magic_packets) == 0:
+        return (magic_packets, dates)
+    day_ns = 86400*10**9
+
+    # MAGIC time of day (ns), where valid
+    timestamps = np.array([packet['packet_timestamp'] for packet in magic_packets],
+            dtype=np.int64).reshape(-1, 4)
+    valid = validate_packettimes(timestamps)
+    time_of_day = (((timestamps[:,0]*60 + timestamps[:,1])*60 + timestamps[:,2])*100
+            + timestamps[:,3])*10**7
+
+    def nearest_date(anchors):
+        # the date (of the day before, of, or after each anchor) putting time_of_day nearest it
+        candidates = (anchors//day_ns)[:,np.newaxis] + np.arange(-1, 2)
+        distance = np.abs(candidates*day_ns + time_of_day[:,np.newaxis] - anchors[:,np.newaxis])
+        return candidates[np.arange(len(anchors)), np.argmin(distance, axis=1)]*day_ns
+
+    # runs of continuous CCSDS packet counts (per APID), in frame order
+    #   (all one run, where packets were stripped of their CCSDS headers)
+    breaks = np.zeros(len(science_packets), dtype=bool)
+    if all(len(packet['packet_ccsds']) >= 4 for packet in science_packets):
+        ccsds = np.array([packet['packet_ccsds'][:4] for packet in science_packets], dtype=np.int64)
+        apids = ((ccsds[:,0] & 0b111) << 8) + ccsds[:,1]
+        counts = ((ccsds[:,2] & 0b111111) << 8) + ccsds[:,3]
+        for apid in np.unique(apids):
+            index = np.flatnonzero(apids == apid)
+            breaks[index[1:]] = ((counts[index[1:]] - counts[index[:-1]]) % 16384 != 1)
+    runs = np.cumsum(breaks)
+
+    # STEIN anchors: the nearest (preferring the same run) before or after each MAGIC packet
+    if len(stein_packets) > 0:
+        stein_times, stein_quality = timeops.packettimes(stein_packets, **kwargs)
+        anchored = np.zeros(len(science_packets), dtype=bool)
+        anchored[np.flatnonzero(is_stein)[stein_quality <= 3]] = True
+        anchor_times = np.zeros(len(science_packets), dtype=np.int64)
+        anchor_times[is_stein] = stein_times
+        positions = np.arange(len(science_packets))
+        before = np.maximum.accumulate(np.where(anchored, positions, -1))[is_magic]
+        after = np.minimum.accumulate(np.where(anchored, positions,
+                len(science_packets))[::-1])[::-1][is_magic]
+        magic_positions = positions[is_magic]
+        far = 2*len(science_packets)
+        before_distance = np.where(before >= 0, magic_positions - before
+                + far*(runs[np.maximum(before, 0)] != runs[is_magic]), 2*far)
+        after_distance = np.where(after < len(science_packets), after - magic_positions
+                + far*(runs[np.minimum(after, len(science_packets) - 1)] != runs[is_magic]), 2*far)
+        anchor = np.where(before_distance <= after_distance, before, after)
+        has_anchor = valid & (np.minimum(before_distance, after_distance) < 2*far)
+        dates[has_anchor] = nearest_date(anchor_times[anchor[has_anchor]])
+
+    # HSK fallback: the date putting each (undated) packet nearest any HSK time
+    hsk_packets = list(hsk_packets)
+    undated = valid & (dates == timeops.nat_ns)
+    if undated.any() and (len(hsk_packets) > 0):
+        hsk_times, hsk_quality = timeops.packettimes(hsk_packets, **kwargs)
+        hsk_times = np.sort(hsk_times[hsk_quality <= 3])
+        if len(hsk_times) > 0:
+            days = np.unique(hsk_times//day_ns)
+            days = np.unique(np.concatenate((days - 1, days, days + 1)))
+            candidates = days*day_ns + time_of_day[undated][:,np.newaxis]
+            following = np.minimum(np.searchsorted(hsk_times, candidates), len(hsk_times) - 1)
+            preceding = np.maximum(following - 1, 0)
+            distance = np.minimum(np.abs(hsk_times[following] - candidates),
+                    np.abs(hsk_times[preceding] - candidates))
+            dates[undated] = days[np.argmin(distance, axis=1)]*day_ns
+    return (magic_packets, dates)
+
+
+def _fit_block_star(args):
+    # worker: fit one block (module-level, so that it can be pickled for multiprocessing.Pool),
+    #   returning its diagnostic messages with the result, for the parent to print
+    messages = []
+    return (fit_block(*args, messages=messages), messages)
+
+
+def fit_blocks(x_time, y_time, quality_array, first_samples, blocks, block_starts, processes=1):
+    """Fit blocks of continuous MAGIC data, optionally over a pool of worker processes.
+
+    Arguments:
+    x_time, y_time -- cycle time and RTC time of each packet (as
+                      accumulate_cycle_times())
+    quality_array -- QoD array of packets and boundaries
+    first_samples -- array of the first MAGIC sample of each packet
+    blocks -- list of (start, stop) packet ranges (as generate_ranges())
+    block_starts -- epoch nanoseconds of the date of each block
+
+    Keyword arguments:
+    processes -- number of worker processes (default 1, every block in
+                 this process; None, one per CPU)
+
+    Return value:
+    list of fit_block() results, (sample_times, failed), in 'blocks' order,
+    whatever order the workers finish in; the same, whatever 'processes'
+
+    The fits' diagnostic messages (see fit_timestamps()) are printed in
+    'blocks' order too: workers return them, rather than print them.
+    """
+    jobs = [(x_time[s:f], y_time[s:f], quality_array[2*s:2*f], first_samples[s:f], block_start)
+            for (s, f), block_start in zip(blocks, block_starts)]
+    if (processes == 1) or (len(jobs) <= 1):
+        return [fit_block(*job) for job in jobs]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # (map returns results in job order)
+        results = pool.map(_fit_block_star, jobs)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    for result, messages in results:
+        for message in messages:
+            print(message)
+    return [result for result, messages in results]
+
+
+def fit_block(x_time, y_time, quality, first_samples, start, messages=None):
+    """Fit one block of continuous MAGIC data, and time each of its samples.
+
+    Arguments:
+    x_time -- array of the cycle time of each packet of the block (seconds)
+    y_time -- array of the RTC time of each packet (int64 microseconds)
+    quality -- QoD array of the block's packets and boundaries
+    first_samples -- array of the first MAGIC sample of each packet
+    start -- epoch nanoseconds of the date (see date_epoch_ns())
+
+    Keyword arguments:
+    messages -- list to which to append the fit's diagnostic messages, as
+                for fit_timestamps() (default None, printed)
+
+    Return value:
+    (sample_times, failed) -- the (n_packets*39,) numpy.datetime64[ns]
+    sample times, and True where the fit is implausible (QoD 17)
+    """
+    # obtain a linear fit
+    #   p_coeff = (m,b)
+    (p_coeff,first_timestamp) = fit_timestamps(x_time, y_time, quality, messages=messages)
+    failed = (p_coeff[0] > 1.1 or p_coeff[0] < 0.95)
+    return evaluate_sampletimes(p_coeff, first_timestamp, x_time, first_samples, start), failed
+
+
+def evaluate_sampletimes(p_coeff, first_timestamp, x_time, first_samples, start):
+    """Return the (n_packets*39,) numpy.datetime64[ns] sample times given by a fit.
+
+    Arguments:
+    p_coeff -- the fit (seconds from 'first_timestamp', against cycle time)
+    first_timestamp -- time origin of the fit (int64 microseconds)
+    x_time -- array of the cycle time of each packet (seconds)
+    first_samples -- array of the first MAGIC sample of each packet
+    start -- epoch nanoseconds of the date (see date_epoch_ns())
+    """
+    # build "clock time" from "cycle time" fit of RTC
+    offsets = sample_cycle_offsets(first_samples)
+    cycletime = np.asarray(x_time)[:,np.newaxis] + offsets/128.
+    dt = np.polyval(p_coeff, cycletime)
+    return (start + 1000*first_timestamp + np.round(dt*1e9).astype(np.int64)).ravel().view('datetime64[ns]')
+
+
+def step_out_of_order(previous_time, current_time, increment):
+    """Classify a MAGIC packet time step out of order (current_time <= previous_time).
+
+    Arguments:
+    previous_time, current_time -- RTC times of the packets (microseconds)
+    increment -- the expected time step (seconds)
+
+    Return value:
+    (rollover, corrected_time) -- True where the RTC has rolled over (the
+    packet is a day on); otherwise, the timestamp is taken as bad (but the
+    data as good), and replaced by the expected time (microseconds)
+    """
+    delta = (current_time - previous_time)/1e6
+    # considering the rollover possibility
+    if abs(abs(delta) - 86400) < loose_tolerance:
+        # rollover is likely
+        return (True, None)
+    # assume that timestamp is somehow bad, but that data is good
+    #   (increment current_time as expected)
+    return (False, previous_time + int(round(increment*1e6)))
+
+
+def classify_steps(delta, increment):
+    """Classify MAGIC packet time steps (in order) as RTC jitter, dropped frames, or both.
+
+    Arguments:
+    delta -- array of time steps between packets (seconds)
+    increment -- array of the expected time step of each (seconds)
+
+    Return value:
+    (multiple, dropped, unexplained) -- the number of expected steps in
+    each step, and Boolean arrays of the steps over dropped frames (with
+    or without jitter: QoD 3), and of those unexplained (QoD 19)
+    """
+    # test for:
+    # 1) RTC jitter (incorrect seconds field in RTC timestamp)
+    # 2) dropped frames
+    # 3) RTC jitter *on top* of dropped frames
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f_diff = (delta - increment)        # frame difference
+        jitter = abs(f_diff - np.round(f_diff)) < tight_tolerance
+        f_mult = (delta/increment)          # frame multiple
+        dropped = abs(f_mult - np.round(f_mult)) < tight_tolerance
+        f_mult2 = (delta[:,np.newaxis] + np.array((-1,1)))/increment[:,np.newaxis]
+        jittdrop = abs(f_mult2 - np.round(f_mult2)) < tight_tolerance
+
+    # handle test results (the first that applies)
+    dropped &= ~jitter
+    jittdrop_any = jittdrop.any(axis=1) & ~jitter & ~dropped
+    multiple = np.ones(len(delta))
+    multiple[dropped] = np.round(f_mult[dropped])
+    first = np.argmax(jittdrop, axis=1)
+    multiple[jittdrop_any] = np.round(f_mult2[np.arange(len(delta)), first])[jittdrop_any]
+    return (multiple, dropped | jittdrop_any, ~jitter & ~dropped & ~jittdrop_any)
+
+
+def accumulate_cycle_times(timestamps, modes, quality_array):
+    """Classify MAGIC packet time steps, and accumulate the cycle time of each packet.
+
+    Arguments:
+    timestamps -- (n_packets, 4) integer array of packet_timestamps (HH,mm,ss,ff)
+    modes -- (n_packets,) integer array of packet MODEs
+    quality_array -- QoD array of packets and boundaries (marked in place)
+
+    Return value:
+    (x_time, y_time, valid) -- the 128 Hz cycle time of each packet
+    (seconds, from the first packet after a MODE switch), the RTC time of
+    each packet (int64 microseconds from the start of the first day, with
+    rollovers and corrected timestamps applied), and the Boolean mask of
+    packets with valid timestamps (x_time and y_time are 0 elsewhere)
+
+    Packets are examined in order, as pairs of valid timestamps: steps of
+    (a multiple of) the expected 39-sample cadence are accumulated in
+    cycle time (see classify_steps()), and steps out of order are RTC
+    rollovers, or else bad timestamps (see step_out_of_order()).  Only
+    the (rare) steps out of order are examined one at a time; the rest
+    is vectorized.
+    """
+    n_packets = len(modes)
+    x_time = np.zeros(n_packets)
+    y_time = np.zeros(n_packets, dtype=np.int64)
+
+    # -- QoD = 19: examine packet_timestamps
+    #   (if it contains invalid values, the packet can't be trusted)
+    #   Work-around: if the RTC is garbage, we can manually change
+    #       the packet_timestamp field, before getting this far.
+    valid = validate_packettimes(timestamps)
+    for i in np.flatnonzero(~valid):
+        quality_array[2*i] = 19             # QoD (bad timestamp)
+        # pass information to user
+        print("Bad Timestamp in Packet #: " + str(i))
+
+    # -- QoD = 9: examine MODE switches
+    #   (buffer cleared during MODE switch, so certain discontinuity)
+    switch = np.zeros(n_packets, dtype=bool)
+    switch[1:] = (modes[1:] != modes[:-1])
+    quality_array[2*np.flatnonzero(switch) - 1] = 9     # QoD (certain datagap)
+    mode_run = np.cumsum(switch)
+
+    # expected time step after each packet (39 samples), in seconds
+    increment = np.zeros(n_packets)
+    for mode, cycles in mode_cycles.items():
+        increment[modes == mode] = 39.*(cycles/128.)
+
+    # -- QoD = 3: examine PACKET_TIMESTAMP for RTC rollover, jitter, and dropped frames
+    #   Strict requirements for time: t2 > t1
+    #   Loose requirements for time: abs(abs(t2 - t1) - increment) <= tolerance
+    #   (packets with bad timestamps are passed over; a MODE switch starts
+    #   afresh, with no previous time to compare with)
+    index = np.flatnonzero(valid)
+    if (len(index) == 0):
+        return x_time, y_time, valid
+    ts = timestamps[index]
+    t = ((ts[:,0]*60 + ts[:,1])*60 + ts[:,2])*10**6 + ts[:,3]*10**4
+    inc = increment[index]
+    restart = np.ones(len(index), dtype=bool)
+    restart[1:] = (mode_run[index[1:]] != mode_run[index[:-1]])
+
+    # steps out of order (t2 <= t1), in order:
+    # 1) timestamp may be *BAD*
+    # 2) RTC may have been (re)set
+    # 3) we may have just rolled over
+    # 4) data may be duplicate
+    rollover = np.zeros(len(index), dtype=np.int64)
+    corrected = {}              # replaced (bad) timestamps
+    days = 0
+    pending = (np.flatnonzero(~restart[1:] & (t[1:] <= t[:-1])) + 1).tolist()[::-1]
+    while pending:
+        k = pending.pop()
+        previous_time = corrected.get(k-1, t[k-1] + days*day_us)
+        current_time = t[k] + days*day_us
+        if (current_time > previous_time):
+            continue
+        is_rollover, corrected_time = step_out_of_order(previous_time, current_time, inc[k])
+        if is_rollover:
+            days += 1
+            rollover[k] = 1
+        else:
+            # mark timestamp as BAD
+            quality_array[2*index[k]] = 19
+            corrected[k] = corrected_time
+            # (the next step is from the replaced time)
+            if (k + 1 < len(index)) and not restart[k+1] and not (pending and pending[-1] == k + 1):
+                pending.append(k + 1)
+    y = t + np.cumsum(rollover)*day_us
+    for k, value in corrected.items():
+        y[k] = value
+    delta = np.zeros(len(index))
+    delta[1:] = (y[1:] - y[:-1])/1e6
+
+    # RTC jitter, dropped frames, or both (but for the first step, of a restart)
+    multiple, dropped, unexplained = classify_steps(delta, inc)
+    quality_array[2*index[dropped & ~restart]] = 3          # placeholder QoD
+    quality_array[2*index[unexplained & ~restart] - 1] = 19 # placeholder QoD ("yipes")
+
+    # accumulate elapsed cycles, in seconds, from each restart
+    elapsed = np.cumsum(np.where(restart, 0., inc*multiple))
+    restart_at = np.maximum.accumulate(np.where(restart, np.arange(len(index)), 0))
+    x_time[index] = elapsed - elapsed[restart_at]
+    y_time[index] = y
+    return x_time, y_time, valid
+
+
+def sample_cycle_offsets(first_samples):
+    """Return the (n_packets, 39) cycle offsets of each sample, from the start of its packet.
+
+    Arguments:
+    first_samples -- (n_packets,) array of the first MAGIC sample of each packet
+                     (CINEMA1: individual packets only contain samples of one mode)
+    """
+    # look to see whether the sample MAG_DATA or IB_TEMP
+    if (first_samples['MT'] == temp).any():
+        # IB diode temperature measurement
+        # - begin sample acquisition approx. every 300 seconds
+        # ** UNIMPLEMENTED IN CINEMA1 **
+        raise Exception("Error! (MAGIC: TEMP Unimplemented in CINEMA1)")
+    # Attitude Mode
+    # - vector acquisition every other (odd) interrupt
+    # - complete sample effectively occupies 8 consecutive cycles
+    # - 128Hz / 2 interrupts / 4 vectors = 16 Hz sample  
+    # Science Mode
+    # - extended settle time: vector acquisition every 4th interrupt
+    # - individual vector returned in 1 cycle
+    # - complete sample effectively occupies 16 cycles
+    # - 128Hz / 4 interrupts / 4 vectors = 8 Hz sample
+    # Gradiometer Mode
+    # - vector acquisition every other (even) interrupt
+    # - effectively occupies 8 consecutive cycles (half-sample)
+    # - 128Hz / 2 interrupts / 4 vectors = 16 Hz sample (OB)
+    # - half-sample written to data frame
+    # (the same is performed for IB vectors in the next 8 cycles)
+    cycles = np.zeros(len(first_samples), dtype=np.int64)
+    known = np.zeros(len(first_samples), dtype=bool)
+    for mode, mode_increment in mode_cycles.items():
+        cycles[first_samples['MODE'] == mode] = mode_increment
+        known |= (first_samples['MODE'] == mode)
+    if not known.all():
+        # Unrecognized sample type!
+        raise Exception("Error! (MAGIC: Unrecognized mode type)")
+    return cycles[:,np.newaxis]*np.arange(samples_per_packet)
 
 
 def generate_ranges(quality, threshold):
-    ranges = []         # list of start/stop tuples
-    series = []         # elements of successive series
+    """Return the (start, stop) packet ranges of continuous data in a QoD array.
+
+    Arguments:
+    quality -- QoD array of packets (even elements) and packet boundaries
+               (odd elements)
+    threshold -- a packet or boundary of QoD above 'threshold' breaks a range
+    """
+    quality = np.asarray(quality)
+    packet_ok = (quality[0::2] <= threshold)
+    boundary_break = np.zeros(len(packet_ok), dtype=bool)
+    boundary_break[:len(quality[1::2])] = (quality[1::2] > threshold)
+    # a packet continues the range of the packet before it, unless broken
+    joined = np.zeros(len(packet_ok) + 1, dtype=bool)
+    joined[1:-1] = packet_ok[:-1] & packet_ok[1:] & ~boundary_break[:-1]
+    starts = np.flatnonzero(packet_ok & ~joined[:-1])
+    stops = np.flatnonzero(packet_ok & ~joined[1:]) + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
 
-    for i,q in enumerate(quality):
-        # examine packet and packet_boundary quality
-        if (i%2 == 0) and (q <= threshold):      # q_packet OK
-            series.append(i/2)
-        elif (q > threshold) and (len(series) > 0):
-            # QoD not acceptable (but series accumulated) 
-            # break the series, extracting start and stop indices 
-            ranges.append((series[0],series[-1]+1))
-            series = []
-    # if we haven't yet stored the last element, do so
-    if len(series) > 0:
-        ranges.append((series[0],series[-1]+1))
+def validate_packettimes(timestamps):
+    """Check fields of an array of packet_timestamps, return a Boolean array.
 
-    return ranges
+    Arguments:
+    timestamps -- (n, 4) integer array of packet_timestamps (HH,mm,ss,ff)
+
+    As validate_packettime(), for every packet_timestamp at once.
+    """
+    timestamps = np.asarray(timestamps)
+    return ((timestamps >= 0) & (timestamps <= np.array((23, 59, 59, 99)))).all(axis=1)
 
 
 def validate_packettime(packet_timestamp):
@@ -428,49 +721,253 @@ def validate_packettime(packet_timestamp):
         return True
 
 
-def fit_timestamps(cycle_time, clock_time, quality):
-    """Linear fitting of RTC to ticks.  Returns fitted timestamps.
+def fit_timestamps(cycle_time, clock_time, quality, messages=None):
+    """Linear fitting of RTC to ticks.  Returns the fit, and its time origin.
           
     Keyword arguments:
-    cycle_time -- the non-absolute 128Hz cycle timing at packet start
-    clock_time -- the RTC-derived packet_timestamp, as a timedelta object
-    quality -- quality-of-data list
+    cycle_time -- array of the non-absolute 128Hz cycle timing at packet start
+    clock_time -- array of the RTC-derived packet_timestamps, in int64 microseconds
+    quality -- quality-of-data array
+    messages -- list to which to append diagnostic messages (default None,
+                printed), e.g. where printing from worker processes would
+                interleave them
 
     We have two clocks available to us:
     1) the 128Hz frequency on which the MAG task is called (*not absolute*!)
     2) the RTC, and the timestamp it produces for each packet
     Using numpy.polyfit, we fit the RTC time to the 128Hz task cadence.
-    """
 
-    # convert timedelta objects in "clock_time" to seconds
-    first_timestamp = clock_time[0]
-    diff_secs = [(t - first_timestamp).total_seconds() for t in clock_time]
+    Return value:
+    (p_coeff, first_timestamp) -- the fit (seconds from the first
+    timestamp, against cycle time), and the first timestamp (microseconds)
+    """
+    # express "clock_time" in seconds from the first timestamp
+    first_timestamp = int(clock_time[0])
+    diff_secs = (np.asarray(clock_time) - first_timestamp)/1e6
 
     # exclude byte-shift affected packet_times from consideration
-    blocks = generate_ranges(quality, threshold=2)
-    x_arraylike = []
-    y_arraylike = []
-    for block in blocks:
-        s = block[0]    # start index 
-        f = block[1]    # finish index
-        x_arraylike.extend(cycle_time[s:f])
-        y_arraylike.extend(diff_secs[s:f])
+    selected = np.zeros(len(diff_secs), dtype=bool)
+    for (s, f) in generate_ranges(quality, threshold=2):
+        selected[s:f] = True
+
+    printed = messages is None
+    if printed:
+        messages = []
 
     # linear fitting of selected timestamps
-    if len(x_arraylike) > 1:
-        p_coeff = np.polyfit(x_arraylike, y_arraylike, deg=1)
+    if (selected.sum() > 1):
+        p_coeff = np.polyfit(np.asarray(cycle_time)[selected], diff_secs[selected], deg=1)
     else:
-        print(len(cycle_time),len(clock_time),len(quality))
+        messages.append(str((len(cycle_time),len(clock_time),len(quality))))
         p_coeff = (1., -0.001)
 
     # print diagostic results
-    print("m = " + str(p_coeff[0]) + ", b = " + str(p_coeff[1]))
+    messages.append("m = " + str(p_coeff[0]) + ", b = " + str(p_coeff[1]))
+    if printed:
+        for message in messages:
+            print(message)
+    return p_coeff, first_timestamp
 
-    # evaluate the fitted timestamps
-    #fit = np.polyval(p_coeff, tick_time)  # units are seconds
 
-    # convert the fitted diff_secs ("fit") to datetime objects, and restore epoch 
-    #eventtime = [first_timestamp + datetime.timedelta(seconds=dt) for dt in fit]
-    #return eventtime
-    return p_coeff, first_timestamp
+class IncrementalClockFit(object):
+    """Incremental (streaming) form of calc_fitted_sampletime().
+
+    MAGIC packets are added as they arrive.  Each packet is classified
+    against the packet before it, as by accumulate_cycle_times(), and
+    joins the open block of continuous data, or closes it (on a MODE
+    switch or QoD break, as generate_ranges() splits blocks).  Running
+    least-squares sums of the open block give provisional sample times,
+    within 'latency' packets of arrival; when a block closes, it is
+    fitted by fit_block(), exactly as by the batch fit (with repair=False:
+    packet_timestamps are not repaired, as that needs the packets after).
 
+    add() and close() return lists of TimedPackets; every packet of a
+    block is given provisional times (unless 'latency' is None), then
+    final times, and its 'clock_time' is set to each in turn.  Packets
+    outside of any block (e.g. with bad timestamps) are not timed.
+    """
+
+    def __init__(self, year=2012, month=1, day=3, latency=1):
+        """Start an incremental fit.
+
+        Keyword arguments:
+        year, month, day -- date of the first packet
+        latency -- provisional times are given once this many packets of
+                   the open block await them (default 1, every packet as
+                   it arrives); None gives final times only
+        """
+        self.start = date_epoch_ns(year, month, day)
+        self.latency = latency
+        self.quality = bytearray()  # QoD of packets and boundaries, as 'quality_array'
+        self.n_packets = 0
+        self.last_mode = None       # last packet's mode
+        self.previous_time = None   # last (valid) packet's time (microseconds)
+        self.days = 0               # RTC rollovers
+        self.cycle_seconds = 0.     # cycle time, since the last restart
+        self.block = None           # the open block
+        self.closed = False
+
+    def _open_block(self, index):
+        self.block = {'start':index, 'packets':[], 'x_time':[], 'y_time':[], 'first_samples':[],
+                'pending':0, 'n':0, 'mean_x':0., 'mean_y':0., 'c_xx':0., 'c_xy':0.}
+
+    def _classify(self, packet):
+        # QoD of the packet (and of the boundary before it), with its cycle
+        #   and RTC times; as accumulate_cycle_times(), one packet at a time
+        #   (by the same step_out_of_order() and classify_steps())
+        i = self.n_packets
+        self.quality.extend((0, 0))
+        if (i == 0):
+            self.quality[-1] = 20   # (a "break" after the last packet)
+        else:
+            self.quality[2*i - 1] = 0
+            self.quality[2*i + 1] = 20
+        timestamp = packet['packet_timestamp']
+        first_sample = packet['magic_samples'][:1]
+        mode = int(first_sample['MODE'][0])
+
+        # -- QoD = 19: bad packet_timestamps
+        valid = validate_packettime(timestamp)
+        if (not valid):
+            self.quality[2*i] = 19
+            print("Bad Timestamp in Packet #: " + str(i))
+
+        # -- QoD = 9: MODE switches
+        if (self.last_mode is not None) and (self.last_mode != mode):
+            self.quality[2*i - 1] = 9
+            self.previous_time = None
+        self.last_mode = mode
+        increment = 39.*(mode_cycles[mode]/128.) if (mode in mode_cycles) else 0.
+
+        if (not valid):
+            return (i, None, None, first_sample)
+        current_time = (((timestamp[0]*60 + timestamp[1])*60 + timestamp[2])*10**6 +
+                timestamp[3]*10**4 + self.days*day_us)
+        if (self.previous_time is None):
+            # (a restart)
+            self.cycle_seconds = 0.
+        else:
+            if (current_time <= self.previous_time):
+                is_rollover, corrected_time = step_out_of_order(self.previous_time, current_time,
+                        increment)
+                if is_rollover:
+                    self.days += 1
+                    current_time += day_us
+                else:
+                    # bad timestamp
+                    self.quality[2*i] = 19
+                    current_time = corrected_time
+            delta = (current_time - self.previous_time)/1e6
+
+            # RTC jitter, dropped frames, or both
+            multiple, dropped, unexplained = classify_steps(np.array([delta]), np.array([increment]))
+            if dropped[0]:
+                self.quality[2*i] = 3
+            elif unexplained[0]:
+                self.quality[2*i - 1] = 19
+            self.cycle_seconds += increment*multiple[0]
+        self.previous_time = current_time
+        return (i, self.cycle_seconds, current_time, first_sample)
+
+    def add(self, packet):
+        """Add the next MAGIC packet, returning a list of TimedPackets (possibly empty)."""
+        if self.closed:
+            raise ValueError("IncrementalClockFit is closed")
+        i, x, y, first_sample = self._classify(packet)
+        self.n_packets += 1
+        timed = []
+        # (blocks break on QoD above 7, as generate_ranges(threshold=7))
+        joins = (self.quality[2*i] <= 7)
+        if (self.block is not None) and ((not joins) or (self.quality[2*i - 1] > 7)):
+            timed.extend(self._close_block())
+        if not joins:
+            return timed
+        if (self.block is None):
+            self._open_block(i)
+        block = self.block
+        block['packets'].append(packet)
+        block['x_time'].append(x)
+        block['y_time'].append(y)
+        block['first_samples'].append(first_sample)
+        if (self.quality[2*i] <= 2):
+            # running least-squares sums (of the points fit_timestamps() selects)
+            dy = (y - block['y_time'][0])/1e6
+            block['n'] += 1
+            d_x = x - block['mean_x']
+            block['mean_x'] += d_x/block['n']
+            block['mean_y'] += (dy - block['mean_y'])/block['n']
+            block['c_xx'] += d_x*(x - block['mean_x'])
+            block['c_xy'] += d_x*(dy - block['mean_y'])
+        block['pending'] += 1
+        if (self.latency is not None) and (block['pending'] >= self.latency):
+            timed.append(self._provisional())
+        return timed
+
+    def extend(self, packets):
+        """Add MAGIC packets, returning a list of TimedPackets."""
+        timed = []
+        for packet in packets:
+            timed.extend(self.add(packet))
+        return timed
+
+    def close(self):
+        """End the stream, closing the open block; returns a list of TimedPackets."""
+        self.closed = True
+        if (self.block is None):
+            return []
+        return self._close_block()
+
+    def fit(self):
+        """Return the running fit (p_coeff, first_timestamp) of the open block, or None.
+
+        As fit_timestamps(), from the running sums; an implausible slope
+        (too few points, so far) is replaced by the nominal rate, 1.
+        """
+        block = self.block
+        if (block is None):
+            return None
+        slope = 1.
+        if (block['n'] > 1) and (block['c_xx'] > 0):
+            slope = block['c_xy']/block['c_xx']
+            if (slope > 1.1 or slope < 0.95):
+                # (too few points yet for a plausible fit: nominal clock rate)
+                slope = 1.
+        if (block['n'] > 0):
+            p_coeff = (slope, block['mean_y'] - slope*block['mean_x'])
+        else:
+            p_coeff = (1., -0.001)
+        return (p_coeff, block['y_time'][0])
+
+    def quality_array(self):
+        """Return the QoD array of the packets so far, as calc_fitted_sampletime()."""
+        return np.frombuffer(bytes(self.quality), dtype=np.uint8).copy()
+
+    def _provisional(self):
+        # provisional times of the block's packets awaiting them
+        block = self.block
+        k = len(block['packets']) - block['pending']
+        block['pending'] = 0
+        p_coeff, first_timestamp = self.fit()
+        sample_times = evaluate_sampletimes(p_coeff, first_timestamp, block['x_time'][k:],
+                np.concatenate(block['first_samples'][k:]), self.start)
+        return self._timed(block['start'] + k, block['packets'][k:], sample_times, False)
+
+    def _close_block(self):
+        # final times of every packet of the block (as the batch fit)
+        block = self.block
+        self.block = None
+        s = block['start']
+        f = s + len(block['packets'])
+        quality = np.frombuffer(bytes(self.quality[2*s:2*f]), dtype=np.uint8).copy()
+        sample_times, failed = fit_block(np.array(block['x_time']), np.array(block['y_time'], dtype=np.int64),
+                quality, np.concatenate(block['first_samples']), self.start)
+        if failed:
+            self.quality[2*s:2*f:2] = bytearray([17])*(f - s)
+        return [self._timed(s, block['packets'], sample_times, True)]
+
+    def _timed(self, start, packets, sample_times, final):
+        quality = np.frombuffer(bytes(self.quality[2*start:2*(start + len(packets)):2]), dtype=np.uint8).copy()
+        packet_times = sample_times.reshape(-1, samples_per_packet)
+        for i, packet in enumerate(packets):
+            packet['clock_time'] = packet_times[i]
+        return TimedPackets(start, packets, sample_times, quality, final)
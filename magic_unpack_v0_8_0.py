@@ -24,13 +24,100 @@
 #       v0.1.0 07/11/2012 initial code
 #
 import os, datetime
+import numpy as np
+import cinema_provenance_v0_1_0 as provenance
+import cinema_packet_v0_1_0 as packet_record
+
+
+# MAGIC DATA PACKET PARAMETERS
+magicframe_size = 507           # size (BYTES) of MAGIC packet data subframe
+sample_size = 13                # size (BYTES) of one MAGIC vector sample
+sample_cnt = 39                 # size (# MAGIC SAMPLES) in one packet
+
+# per-sample fields of MAGIC packets, as decoded by decode_samples()
+#   PACKET is the index of the sample's packet among the MAGIC packets of
+#   the pass (or of the frame range decoded), in frame order;
+#   (Bx, By, Bz, TEMP) are raw 24-bit values (or TEMP_A, TEMP_B, TEMP_A, TEMP_B)
+magic_sample_dtype = np.dtype([
+        ('PACKET', np.int32),
+        ('MODE', np.uint8),
+        ('SENSOR', np.uint8),
+        ('MT', np.uint8),
+        ('BX', np.int32),
+        ('BY', np.int32),
+        ('BZ', np.int32),
+        ('TEMP', np.int32)])
+
+
+def decode_samples(magic_blocks, first_packet=0):
+    """Decode every sample of an array of 507-byte MAGIC data blocks.
+
+    Arguments:
+    magic_blocks -- (n_packets, 507) array of bytes (e.g. numpy.uint8)
+
+    Keyword arguments:
+    first_packet -- PACKET index of the first block, e.g. the number of
+                    MAGIC packets of the pass before it (default 0)
+
+    Return value:
+    flat (n_packets*39,) structured array of dtype 'magic_sample_dtype',
+    in packet order, with the fields of parse_magic_report()
+    """
+    # 507-byte block, comprising 39 vector samples of 13 bytes each
+    working_bytes = np.asarray(magic_blocks, dtype=np.uint8).reshape(-1, sample_size)
+    samples = np.empty(len(working_bytes), dtype=magic_sample_dtype)
+    samples['PACKET'] = first_packet + np.arange(len(working_bytes)) // sample_cnt
+
+    # parse "status" byte {Unused Unused Unused MODE2 MODE1 MODE0 SENSOR MT}
+    status = working_bytes[:,0]
+    samples['MODE'] = (status >> 2) & 7     # shift off 2 LSB, mask 3 MSB
+    samples['SENSOR'] = (status >> 1) & 1   # shift off 1 LSB, mask 6 MSB
+    samples['MT'] = status & 1              # mask 7 MSB
+
+    # (Bx,By,Bz) and TEMP: 3 big-endian Bytes apiece
+    wide = working_bytes[:,1:].astype(np.int32).reshape(-1, 4, 3)
+    fields = (wide[:,:,0] << 16) + (wide[:,:,1] << 8) + wide[:,:,2]
+    for k, name in enumerate(('BX', 'BY', 'BZ', 'TEMP')):
+        samples[name] = fields[:,k]
+    return samples
+
+
+def magic_data_view(magic_samples):
+    """Return decoded samples as a list of ((MODE,SENSOR,M),(Bx,By,Bz,TEMP)) tuples.
+
+    This is the per-packet 'magic_data' list of earlier versions.
+    """
+    status = magic_samples[['MODE', 'SENSOR', 'MT']].tolist()
+    vector = magic_samples[['BX', 'BY', 'BZ', 'TEMP']].tolist()
+    return list(zip(status, vector))
+
+
+def number_packets(packet_list, first_packet=0):
+    """Number the MAGIC packets of a list, in list order, in the PACKET field of their samples.
+
+    Arguments:
+    packet_list -- list of packets (e.g. the science packets of a pass,
+                   merged from separately decoded parts); others are skipped
+
+    Keyword arguments:
+    first_packet -- PACKET index of the first MAGIC packet (default 0)
+
+    Return value:
+    the PACKET index following the last MAGIC packet
+    """
+    for packet in packet_list:
+        if isinstance(packet, MagicPacket):
+            if packet['magic_samples'] is not None:
+                packet['magic_samples']['PACKET'] = first_packet
+            first_packet += 1
+    return first_packet
 
 
 # function to extract MAG samples from the 507-byte MAGIC data block
 def extract_samples(magic_frame):
     # 507-byte block, comprising 39 vector samples of 13 bytes each
-    increment = 13              # (bytes)
-    n_samples = 39              # (samples)
+    increment = sample_size     # (bytes)
+    n_samples = sample_cnt      # (samples)
 
     # per-frame sample log
     sample_log = []
@@ -84,13 +171,39 @@ def parse_magic_report(magic_sample):
     return (status_tuple, (bx, by, bz, temp))
 
 
-# parse MAGIC frame of hex packet_bytes
-def parse_magic_frame(packet_bytes, includes_ccsds):
-    """Parse a packet of MAGIC data, returning a dictionary structure.
+class MagicPacket(packet_record.PacketRecord):
+    """Record of an unpacked MAGIC data packet (with dictionary-style access)."""
+    __slots__ = ('refined_timetamp',        # to be filled in, with a datetime.datetime
+            'magic_samples',                # a (39,) slice of the structured array
+            'magic_data')                   # a list of tuples (built on first access, if not requested)
+    _constants = ('apid', 'type', 'packet_timestamp_format', 'magic_data_format',
+            'alt_magic_data_format')
+    _views = {'magic_data':('magic_samples', magic_data_view)}
+
+    apid = 0x241
+    type = "MAGIC"
+    packet_timestamp_format = ('HH','mm','ss','ff')
+    magic_data_format = (('MODE','SENSOR','M'), ('Bx','By','Bz','TEMP'))
+    alt_magic_data_format = (('MODE','SENSOR','M'), ('TEMP_A','TEMP_B','TEMP_A','TEMP_B'))
+
+
+# parse MAGIC frames of hex packet_bytes
+def parse_magic_frames(packet_array, includes_ccsds, sample_list=True, first_packet=0):
+    """Parse an array of MAGIC data packets, returning a list of MagicPacket records.
 
     Arguments:
-    packet_bytes -- iterable of bytes comprising a MAGIC data packet
+    packet_array -- (n_packets, packet_size) array of bytes comprising MAGIC data packets
     includes_ccsds -- Boolean argument, indicating presence of CCSDS header
+
+    Keyword arguments:
+    sample_list -- Boolean argument; if True (default), also provide each
+                   packet's samples as a 'magic_data' list of tuples
+                   (otherwise, built on first access)
+    first_packet -- PACKET index of the first packet, as for
+                    decode_samples() (default 0)
+
+    The samples of every packet are decoded together by decode_samples();
+    each packet's 'magic_samples' is its (39,) slice of the flat array.
     """
 
     # MAGIC DATA PACKET PARAMETERS
@@ -103,89 +216,84 @@ def parse_magic_frame(packet_bytes, includes_ccsds):
     #
     packetheader_size = 1   # size (BYTES) of packet header (e.g. "0xBE" for MAGIC)
     timestamp_size = 4      # size (BYTES) of packet timestamp
-    magicframe_size = 507   # size (BYTES) of MAGIC packet data subframe
         #sparebyte_size = 2      # size (BYTES) of packet unused bytes
         # NOTE: the observed packet size is actually 514 bytes; 
         #   the final 2 bytes are spurious:  still true???
-    sample_cnt = 39
 
+    packet_array = np.asarray(packet_array, dtype=np.uint8)
 
     # PARSE HEX BYTES
     cursor = 0          # byte-position cursor (for packet bytes)
 
     # CCSDS
-    packet_ccsds = packet_bytes[cursor:cursor+ccsds_size]
+    packet_ccsds = packet_array[:,cursor:cursor+ccsds_size].tolist()
     cursor += ccsds_size
 
     # PACKET HEADER
-    packet_header = packet_bytes[cursor:cursor+packetheader_size]
+    packet_header = packet_array[:,cursor:cursor+packetheader_size].tolist()
     cursor += packetheader_size
     # PACKET TIMESTAMP
-    packet_timestamp = packet_bytes[cursor:cursor+timestamp_size]
+    packet_timestamp = packet_array[:,cursor:cursor+timestamp_size].tolist()
     cursor += timestamp_size
 
     # -----------------
     # MAGIC DATA
     #   NOTE: properly, this should be protected with if/else-statements
            
-    # get MAGIC bytes
-    magic_frame = packet_bytes[cursor:cursor+magicframe_size]
+    # get MAGIC bytes, and parse every sample of every packet into
+    #   (MODE,SENSOR,M),(Bx,By,Bz),TEMP
+    magic_samples = decode_samples(packet_array[:,cursor:cursor+magicframe_size],
+            first_packet=first_packet)
     cursor += magicframe_size
-                          
-    # generate a samples list from these bytes
-    sample_log = extract_samples(magic_frame)     # extract samples
-                                     
-    # parse each sample into (MODE,SENSOR,M),(Bx,By,Bz),TEMP
-    magic_data = []
-    for i in range(sample_cnt):
-        magic_data.append(parse_magic_report(sample_log[i]))
     # -----------------
                                                   
     # SPARE BYTES (UNIMPLEMENTED)
 
 
-    # return a dictionary structure
-    this_frame = {'apid':0x241,
-        'type':"MAGIC",
-        'tframe_header':None,                   # to be filled in, if available
-        'packet_ccsds':tuple(packet_ccsds),
-        'packet_header':tuple(packet_header),   # should always be 0xBE for MAGIC
-        'packet_timestamp':tuple(packet_timestamp),
-        'packet_timestamp_format':('HH','mm','ss','ff'),
-        'refined_timetamp':None,                 # to be filled in, with a datetime.datetime
-        'magic_data':magic_data,                # a tuple 
-        'magic_data_format':(('MODE','SENSOR','M'), ('Bx','By','Bz','TEMP')),
-        'alt_magic_data_format':(('MODE','SENSOR','M'), ('TEMP_A','TEMP_B','TEMP_A','TEMP_B')),
-        'clock_time':None,                     # this is filled in later
-        'clock_time_format':"YYYY MM DD HH mm ss ffffff",
-        'clock_time_quality':None,             # this is filled in later
-        'source_file':None,                     # to contain filename/path
-        'source_file_hash':None,                # to contain a hash
-        'source_file_hash_format':"SHA1",       # hashing algorithm is SHA1
-        'extraction_date':None                  # to contain the date
-        }
-    return this_frame
+    # return a list of (dictionary-like) packet records
+    frames = []
+    for i in range(len(packet_array)):
+        samples = magic_samples[i*sample_cnt:(i+1)*sample_cnt]
+        if sample_list:
+            magic_data = magic_data_view(samples)
+        else:
+            magic_data = None
+        this_frame = MagicPacket(
+            packet_ccsds=tuple(packet_ccsds[i]),
+            packet_header=tuple(packet_header[i]),  # should always be 0xBE for MAGIC
+            packet_timestamp=tuple(packet_timestamp[i]),
+            magic_samples=samples,
+            magic_data=magic_data)
+        frames.append(this_frame)
+    return frames
+
+
+# parse MAGIC frame of hex packet_bytes
+def parse_magic_frame(packet_bytes, includes_ccsds, sample_list=True):
+    """Parse a packet of MAGIC data, returning a MagicPacket record.
+
+    Arguments:
+    packet_bytes -- bytes comprising a MAGIC data packet (any sequence or buffer
+                    of bytes, including numpy.uint8/memoryview frame views)
+    includes_ccsds -- Boolean argument, indicating presence of CCSDS header
+
+    Keyword arguments:
+    sample_list -- Boolean argument; if True (default), also provide the
+                   packet's samples as a 'magic_data' list of tuples
+                   (otherwise, built on first access)
+    """
+    packet_array = np.frombuffer(bytearray(packet_bytes), dtype=np.uint8)
+    return parse_magic_frames(packet_array.reshape(1, -1), includes_ccsds, sample_list=sample_list)[0]
 
 def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False):
     # to be fleshed out, with export options for ASCII, CDF, python-pickle, etc.
-    source_hashes = [packet['source_file_hash'] for packet in data_packet_dict]
-    hash_set = set(source_hashes)
-    source_info = [] 
-    for hash in hash_set:
-        pos = source_hashes.index(hash)
-        source_filename = data_packet_dict[pos]['source_file']
-        if (source_filename == None):
-            source_info.append("%   Not available\r\n")
-        else:
-            #source_info.append("%   Not available")
-            source_info.append("%   " + source_filename + "\r\n%     SHA1 hash:" + hash + "\r\n")
     header_lines = (
             "%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\r\n",
             "% CINEMA[1] MAGIC Event List (example)\r\n",
             "%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\r\n",
             "% Support Info:\r\n",
             "% SOURCE:\r\n",
-            "".join(source_info),
+            provenance.source_info(data_packet_dict),
             "% SOURCE DESCRIPTION:\r\n",
             "% -- VARIABLEs --\r\n",
             "% CINEMA 1 FSW MODE assignments (*not the same as MAGIC ICD*)\r\n",
@@ -223,12 +331,19 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False)
             f.write("% {timestamp} MODE SENSOR M Bx By Bz TEMP HH mm ss ff PACKET_CNT\r\n".format(
                 timestamp="YYYY-MM-DDTHH:MM:SS.mmmmmm"))
             for i,packet in enumerate(data_packet_dict):
-                for j,sample in enumerate(packet['magic_data']):
-                    if (packet['clock_time'] is None):
+                magic_data = packet['magic_data']
+                if (magic_data is None):
+                    magic_data = magic_data_view(packet['magic_samples'])
+                clock_time = packet['clock_time']
+                if isinstance(clock_time, np.ndarray):
+                    # fitted numpy.datetime64[ns] sample times, to the (nearest) microsecond
+                    clock_time = ((clock_time.astype(np.int64) + 500) // 1000).astype('datetime64[us]').tolist()
+                for j,sample in enumerate(magic_data):
+                    if (clock_time is None):
                         print(i,j, "Invalid Timestamp")
                     else:
                         f.write("{timestamp}{mode:2d}{sensor:3d}{m:3d}{bx:9d}{by:9d}{bz:9d}{temp:9d}{hr:3d}{min:3d}{sec:3d}{fsec:3d}{packet_cnt:6d}\r\n".format(
-                            timestamp=packet['clock_time'][j].isoformat(),
+                            timestamp=clock_time[j].isoformat(),
                             mode=sample[0][0],
                             sensor=sample[0][1],
                             m=sample[0][2],
@@ -256,7 +371,10 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False)
             f.write("% {timestamp} MODE SENSOR M Bx By Bz TEMP HH mm ss ff PACKET_CNT\r\n".format(
                 timestamp="YYYY-MM-DDTHH:MM:SS.mmmmmm"))
             for i,packet in enumerate(data_packet_dict):
-                for j,sample in enumerate(packet['magic_data']):
+                magic_data = packet['magic_data']
+                if (magic_data is None):
+                    magic_data = magic_data_view(packet['magic_samples'])
+                for j,sample in enumerate(magic_data):
                     if (packet['clock_time'] is None):
                         print(i,j, "Invalid Timestamp")
                     else:
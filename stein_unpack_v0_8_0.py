@@ -30,39 +30,208 @@
 #
 
 import os, datetime
+import numpy as np
+import cinema_provenance_v0_1_0 as provenance
+import cinema_packet_v0_1_0 as packet_record
+import cinema_timeops_v0_1_0 as timeops
 
 
-# function to extract events from the 495-byte STEIN data block
-def extract_events(stein_frame):
+# STEIN DATA PACKET PARAMETERS
+steinframe_size = 495           # size (BYTES) of STEIN packet data subframe
+event_cnt = 198                 # size (# STEIN EVENTS) in one packet of FSW data
+
+# STEIN EVENT CLOCK (nominal)
+#   the 8-bit FPGA event clock; EVCODE0 events carry its 6 MSB (the event
+#   clock "units" below), and EVCODE1/2 events its 6 LSB
+event_clock_period = 10**9      # rollover period (NANOSECONDS) of the event clock
+event_clock_units = 64          # EVCODE0 TIMESTAMP units per rollover period
+
+# per-event fields of a STEIN packet, as decoded by decode_events()
+#   (-1 where a field does not apply to the event's EVCODE/ADD)
+stein_event_dtype = np.dtype([
+        ('EVCODE', np.int8),
+        ('ADD', np.int8),
+        ('DET_ID', np.int8),
+        ('TIMESTAMP', np.int16),
+        ('EVENT_DATA', np.int32)])
+
+
+def extract_event_array(stein_blocks):
+    """Extract the raw 20-bit events from an array of 495-byte STEIN data blocks.
+
+    Arguments:
+    stein_blocks -- (n_packets, 495) array of bytes (e.g. numpy.uint8)
+
+    Return value:
+    (n_packets, 198) numpy.uint32 array of raw events
+    """
     # 495-byte block, comprising 198 events of 20 bits each
     # So.. every 5 bytes gives us 2 complete STEIN events
     increment = 5               # (bytes)
-    n_events = 198              # (events)
-   
-    # (use NumPy arrays here)
-    # 5-byte chunk to work with 
-    #working_bytes = np.zeros(increment, dtype=uint32)  
-
-    # per-frame event log 
-    #event_log = np.zeros(n_events, dtype=uint32)
-    event_log = []
-
-    for i in range(n_events/2):
-        # populate "working_bytes"
-        working_bytes = stein_frame[i*increment:i*increment + increment]
-        #for j in range(increment):
-        #    working_bytes[j] = stein_frame[j + i*increment]
-        #
-        # split, bitshift, and re-construct event values
-        event1 = ((working_bytes[2] & 15) << 16) + (working_bytes[1] << 8) + (working_bytes[0])
-        event2 = (working_bytes[4] << 12) + (working_bytes[3] << 4) + (working_bytes[2] >> 4)
-        event_log.append(event1)
-        event_log.append(event2)
-        #event_log[2*i] = event1         # place in event_log
-        #event_log[2*i + 1] = event2     #      """
+    working_bytes = np.asarray(stein_blocks, dtype=np.uint8).reshape(-1, event_cnt//2, increment)
+    working_bytes = working_bytes.astype(np.uint32)
+
+    # split, bitshift, and re-construct event values
+    event_log = np.empty((working_bytes.shape[0], event_cnt), dtype=np.uint32)
+    event_log[:,0::2] = ((working_bytes[:,:,2] & 15) << 16) + (working_bytes[:,:,1] << 8) + working_bytes[:,:,0]
+    event_log[:,1::2] = (working_bytes[:,:,4] << 12) + (working_bytes[:,:,3] << 4) + (working_bytes[:,:,2] >> 4)
     return event_log
 
 
+def decode_events(stein_blocks):
+    """Decode every event of an array of 495-byte STEIN data blocks.
+
+    Arguments:
+    stein_blocks -- (n_packets, 495) array of bytes (e.g. numpy.uint8)
+
+    Return value:
+    (n_packets, 198) structured array of dtype 'stein_event_dtype', with
+    the fields of parse_event_report() (EVCODE, ADD, DET_ID, TIMESTAMP,
+    EVENT_DATA); the EVCODE 0/1/2/3 and ADD variants are applied by mask.
+    """
+    stein_event = extract_event_array(stein_blocks)
+    events = np.empty(stein_event.shape, dtype=stein_event_dtype)
+
+    evcode = stein_event >> 18
+    add = (stein_event >> (20 - (2+1))) & 1
+    is_data = (evcode == 0)                     # data packet
+    is_sweep = (evcode == 1) | (evcode == 2)    # sweep checksum/# of triggers (or events) per second
+    is_noise = (evcode == 3) & (add == 0)       # EVCODE3 TYPE 1 (noise event)
+    is_status = (evcode == 3) & (add == 1)      # EVCODE3 TYPE 2 (status event)
+
+    events['EVCODE'] = evcode
+    # ADD bit (1 bit; EVCODE3 only)
+    events['ADD'] = np.where(evcode == 3, add, -1)
+    # DET_ID (5 bits for EVCODE0; 1 bit, 4 MSB dropped for EVCODE3 TYPE 1)
+    events['DET_ID'] = np.where(is_data, (stein_event >> (20 - (2+5))) & 31,
+            np.where(is_noise, (stein_event >> (20 - (2+1+1))) & 1, -1))
+    # TIMESTAMP (6 bits, 2 LSB dropped for EVCODE0; 6 bits, 2 MSB dropped for
+    #   EVCODE1/2; 9 bits, really "STATUS_ID", for EVCODE3 TYPE 2)
+    time_stamp = np.empty(stein_event.shape, dtype=np.int16)
+    time_stamp.fill(-1)
+    time_stamp[is_data] = ((stein_event >> (20 - (2+5+6))) & 63)[is_data]
+    time_stamp[is_sweep] = ((stein_event >> (20 - (2+6))) & 63)[is_sweep]
+    time_stamp[is_status] = ((stein_event >> (20 - (2+1+9))) & 255)[is_status]
+    events['TIMESTAMP'] = time_stamp
+    # EVENT_DATA (7 bits for EVCODE0; 12 bits for EVCODE1/2; 16 bits for
+    #   EVCODE3 TYPE 1; 8 bits for EVCODE3 TYPE 2)
+    event_data = np.empty(stein_event.shape, dtype=np.int32)
+    event_data[is_data] = ((stein_event >> (20 - (2+5+6+7))) & 127)[is_data]
+    event_data[is_sweep] = ((stein_event >> (20 - (2+6+12))) & 4095)[is_sweep]
+    event_data[is_noise] = (stein_event & 65535)[is_noise]
+    event_data[is_status] = (stein_event & 255)[is_status]
+    events['EVENT_DATA'] = event_data
+    return events
+
+
+def stein_data_view(stein_events):
+    """Return decoded events as a list of (EVCODE, ADD, DET_ID, TIMESTAMP, EVENT_DATA) tuples.
+
+    This is the per-packet 'stein_data' list of earlier versions.
+    """
+    return stein_events.tolist()
+
+
+def event_clock_offsets(stein_events):
+    """Return the nominal time of every event of an array of packets, relative to its packet.
+
+    Arguments:
+    stein_events -- (n_packets, 198) structured array of dtype 'stein_event_dtype'
+
+    Return value:
+    (offsets, timed) -- (n_packets, 198) int64 array of nanoseconds after
+    the first timed event of each packet, and a Boolean array, True for
+    the events which carry a TIMESTAMP (EVCODE0/1/2)
+
+    The event clock is counted in units of the EVCODE0 TIMESTAMP.  EVCODE1/2
+    events carry only its 4 LSB (with 2 finer bits): these are counted on,
+    in steps of less than 8 units between consecutive timed events, from
+    the nearest preceding EVCODE0 event of the packet (or, failing that,
+    back from the following one).  Untimed events take the time of the
+    preceding timed event (or, at the start of a packet, the following
+    one).  Between consecutive events, a step back of more than half of
+    the event clock range is a rollover.
+    """
+    evcode = stein_events['EVCODE']
+    stamp = stein_events['TIMESTAMP'].astype(np.int64)
+    n_packets, n_events = stamp.shape
+    rows = np.arange(n_packets)[:,np.newaxis]
+    columns = np.arange(n_events)
+    is_data = (evcode == 0)
+    is_sweep = (evcode == 1) | (evcode == 2)
+    timed = is_data | is_sweep
+    first = np.argmax(timed, axis=1)[:,np.newaxis]
+    latest = np.maximum.accumulate(np.where(timed, columns, -1), axis=1)
+    latest = np.where(latest < 0, first, latest)
+
+    # the 4 LSB of the unit count, counted on between timed events
+    low = np.where(is_data, stamp & 15, stamp >> 2)[rows, latest]
+    steps = (np.diff(low, axis=1) + 8) % 16 - 8
+    count = np.zeros(low.shape, dtype=np.int64)
+    np.cumsum(steps, axis=1, out=count[:,1:])
+
+    # EVCODE1/2: counted from the nearest EVCODE0 event
+    units = np.where(is_data, stamp, 0)
+    previous = np.maximum.accumulate(np.where(is_data, columns, -1), axis=1)
+    following = np.minimum.accumulate(np.where(is_data, columns, n_events)[:,::-1], axis=1)[:,::-1]
+    previous = np.maximum(previous, 0)
+    following = np.minimum(following, n_events - 1)
+    sweep_units = np.where(is_data[rows, previous],
+            units[rows, previous] + count - count[rows, previous],
+            np.where(is_data[rows, following],
+                units[rows, following] - (count[rows, following] - count),
+                low[rows, first] + count - count[rows, first]))
+    units = np.where(is_sweep, sweep_units % event_clock_units, units)
+
+    # untimed events: take the neighbouring timed event
+    units = units[rows, latest]
+
+    # rollover of the event clock, within each packet
+    half = event_clock_units//2
+    rollover = np.zeros(units.shape, dtype=np.int64)
+    np.cumsum(np.diff(units, axis=1) < -half, axis=1, out=rollover[:,1:])
+    units = units + event_clock_units*rollover - units[rows, first]
+    return (units*event_clock_period//event_clock_units, timed)
+
+
+def calc_nominal_eventtime(packet_list, **kwargs):
+    """Assign the nominal time of every event of a list of STEIN packets.
+
+    Arguments:
+    packet_list -- list of STEIN packets
+
+    Keyword arguments are those of timeops.reconstruct_packettimes(), for
+    packets whose times are not already assigned.
+
+    Return value:
+    (times, quality) -- (n_packets, 198) int64 array of epoch nanoseconds
+    (NaT, where the packet time is invalid), and uint8 array of QoD codes
+    (the packet's, or at least 3 for untimed events); each packet's
+    'event_time' is set to its (198,) numpy.datetime64 row of times
+
+    The first timed event of a packet is taken at the packet time, and
+    the others by the event clock (see event_clock_offsets()).
+    """
+    if len(packet_list) == 0:
+        return (np.empty((0, event_cnt), dtype=np.int64), np.empty((0, event_cnt), dtype=np.uint8))
+    packet_times, packet_quality = timeops.packettimes(packet_list, **kwargs)
+    offsets, timed = event_clock_offsets(np.stack([packet['stein_events'] for packet in packet_list]))
+
+    times = packet_times[:,np.newaxis] + offsets
+    times[packet_times == timeops.nat_ns] = timeops.nat_ns
+    quality = np.where(timed, packet_quality[:,np.newaxis],
+            np.maximum(packet_quality[:,np.newaxis], 3)).astype(np.uint8)
+    for packet, event_time in zip(packet_list, times.view('datetime64[ns]')):
+        packet['event_time'] = event_time
+    return (times, quality)
+
+
+# function to extract events from the 495-byte STEIN data block
+def extract_events(stein_frame):
+    # 495-byte block, comprising 198 events of 20 bits each
+    return extract_event_array(np.frombuffer(bytearray(stein_frame), dtype=np.uint8))[0].tolist()
+
+
 def parse_event_report(stein_event):
     evcode = stein_event >> 18;
     if (evcode == 0):            # (i.e., is a data packet)
@@ -128,13 +297,46 @@ def parse_event_report(stein_event):
 
 
 
-# parse STEIN frame of hex packet_bytes
-def parse_stein_frame(packet_bytes, includes_ccsds):
-    """Parse a packet of STEIN data, returning a dictionary structure.
+class SteinPacket(packet_record.PacketRecord):
+    """Record of an unpacked STEIN data packet (with dictionary-style access)."""
+    __slots__ = ('refined_timestamp',       # numpy.datetime64 (see timeops.assign_packettimes)
+            'stein_events',                 # a (198,) structured array
+            'stein_data',                   # a list of tuples (built on first access, if not requested)
+            'event_time',                   # (198,) numpy.datetime64 (see calc_nominal_eventtime)
+            'packet_hkpg')
+    _constants = ('apid', 'type', 'packet_timestamp_format', 'stein_data_format',
+            'packet_hkpg_format')
+    _views = {'stein_data':('stein_events', stein_data_view)}
+
+    apid = 0x240
+    type = "STEIN"
+    packet_timestamp_format = ('MM','DD','HH','mm','ss','ff')
+    stein_data_format = ('EVCODE','ADD','DET_ID','TIMESTAMP','EVENT_DATA')
+    packet_hkpg_format = ('IIB SPI Buffer Overflow Count',
+            'IIB SPI Buffer Underflow Count', 
+            'IIB SPI Buffer Checksum Error Count', 
+            'IIB I2C Buffer Checksum Error Count', 
+            'IIB I2C Buffer Underflow Count', 
+            'IIB I2C Buffer Overflow Count', 
+            'IIB CDI Parity Error Count',
+            'IIB CDI Framing Error Count')
+
+
+# parse STEIN frames of hex packet_bytes
+def parse_stein_frames(packet_array, includes_ccsds, event_list=True):
+    """Parse an array of STEIN data packets, returning a list of SteinPacket records.
 
     Arguments:
-    packet_bytes -- iterable of bytes comprising a STEIN data packet
+    packet_array -- (n_packets, packet_size) array of bytes comprising STEIN data packets
     includes_ccsds -- Boolean argument, indicating presence of CCSDS header
+
+    Keyword arguments:
+    event_list -- Boolean argument; if True (default), also provide each
+                  packet's events as a 'stein_data' list of tuples
+                  (otherwise, built on first access)
+
+    The events of every packet are decoded together by decode_events(), and
+    stored per packet as a (198,) 'stein_events' structured array.
     """
 
     # STEIN DATA PACKET PARAMETERS
@@ -149,8 +351,7 @@ def parse_stein_frame(packet_bytes, includes_ccsds):
     packetheader_size = 1       # size (BYTES) of packet header 
                                 #   (e.g. "0xAF" for STEIN)
     timestamp_size = 6          # size (BYTES) of packet timestamp
-    steinframe_size = 495       # size (BYTES) of STEIN packet data subframe
-        # NOTE: this is 495-bytes, and not the original 510-bytes
+        # NOTE: the STEIN data subframe is 495-bytes, and not the original 510-bytes
     steinblock_size = steinframe_size/3  
         # size (BYTES) of IIB-FPGA block transfer to FSW (STEIN data)
         # NOTE: this is 165-bytes, and not the original 170-bytes
@@ -158,99 +359,89 @@ def parse_stein_frame(packet_bytes, includes_ccsds):
         #sparebyte_size = 2          # size (BYTES) of packet unused bytes
         # NOTE: the observed packet size is actually 514 bytes; 
         #   the final 2 bytes are spurious
-    event_cnt = (steinframe_size*8)/20
-        # size (# STEIN EVENTS) in one packet of FSW data [expect 198]
-        # NOTE: this is 198 events, and not the original 204
+        # NOTE: 198 events per packet, and not the original 204
     block_cnt = (steinblock_size*8)/20
         # size (# STEIN EVENTS) in FPGA-IIB transfer block
 
+    packet_array = np.asarray(packet_array, dtype=np.uint8)
 
     # PARSE HEX BYTES
     cursor = 0          # byte-position cursor (for packet bytes)
 
     # CCSDS
-    packet_ccsds = packet_bytes[cursor:cursor+ccsds_size]
+    packet_ccsds = packet_array[:,cursor:cursor+ccsds_size].tolist()
+    cursor += ccsds_size
     
     # PACKET HEADER
-    packet_header = packet_bytes[cursor:cursor+packetheader_size]
+    packet_header = packet_array[:,cursor:cursor+packetheader_size].tolist()
     cursor += packetheader_size
     # PACKET TIMESTAMP
-    packet_timestamp = packet_bytes[cursor:cursor+timestamp_size]
+    packet_timestamp = packet_array[:,cursor:cursor+timestamp_size].tolist()
     cursor += timestamp_size
     
     # -----------------
     # STEIN DATA
     #   NOTE: properly, this should be protected with if/else-statements
     
-    # get STEIN bytes
-    stein_frame = packet_bytes[cursor:cursor+steinframe_size]
+    # get STEIN bytes, and parse every event of every packet into
+    #   EVCODE, ADD, DETID, TIMESTAMP & EVENTDATA
+    stein_events = decode_events(packet_array[:,cursor:cursor+steinframe_size])
     cursor += steinframe_size
-    
-    # generate an events list from these bytes
-    event_log = extract_events(stein_frame)     # extract events
-    
-    # parse each event into EVCODE, ADD, DETID, TIMESTAMP & EVENTDATA
-    stein_data = []
-    for i in range(event_cnt):
-        stein_data.append(parse_event_report(event_log[i]))
     # -----------------
     
     # HOUSEKEEPING
-    packet_housekeeping = packet_bytes[cursor:cursor+housekeep_size]
+    packet_housekeeping = packet_array[:,cursor:cursor+housekeep_size].tolist()
     cursor += housekeep_size
     #
     # SPARE BYTES (UNIMPLEMENTED)
     
-    # return a dictionary structure
-    this_frame = {'apid':0x240,
-        'type':"STEIN",
-        'tframe_header':None,                   # to be filled in, if available
-        'packet_ccsds':tuple(packet_ccsds), 
-        'packet_header':tuple(packet_header),   # should always be 0xAF for STEIN 
-        'packet_timestamp':tuple(packet_timestamp), 
-        'packet_timestamp_format':('MM','DD','HH','mm','ss','ff'),
-        'refined_timestamp':None,                # to be filled in with a datetime.datetime
-        'stein_data':stein_data,                # a tuple 
-        'stein_data_format':('EVCODE','ADD','DET_ID','TIMESTAMP','EVENT_DATA'),
-        'packet_hkpg':tuple(packet_housekeeping),
-        'packet_hkpg_format':('IIB SPI Buffer Overflow Count',
-                'IIB SPI Buffer Underflow Count', 
-                'IIB SPI Buffer Checksum Error Count', 
-                'IIB I2C Buffer Checksum Error Count', 
-                'IIB I2C Buffer Underflow Count', 
-                'IIB I2C Buffer Overflow Count', 
-                'IIB CDI Parity Error Count',
-                'IIB CDI Framing Error Count'),
-        'clock_time':None,                      # this is filled in later
-        'clock_time_format':"YYYY MM DD HH mm ss ffffff",
-        'clock_time_quality':None,              # this is filled in later
-        'source_file':None,                     # to contain filename/path
-        'source_file_hash':None,                # to contain a hash
-        'source_file_hash_format':"SHA1",       # hashing algorithm is SHA1
-        'extraction_date':None                  # to contain the date
-        }
-    return this_frame
-
-
-def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False):
-    # to be fleshed out, with export options for ASCII, CDF, python-pickle, etc.
-    source_hashes = [packet['source_file_hash'] for packet in data_packet_dict]
-    hash_set = set(source_hashes)
-    source_info = []
-    for hash in hash_set:
-        pos = source_hashes.index(hash)
-        source_filename = data_packet_dict[pos]['source_file']
-        if (source_filename == None):
-            source_info.append("%   Not available\r\n")
+    # return a list of (dictionary-like) packet records
+    frames = []
+    for i in range(len(packet_array)):
+        if event_list:
+            stein_data = stein_data_view(stein_events[i])
         else:
-            source_info.append("%   " + source_filename + "\r\n%     SHA1 hash:" + hash + "\r\n")
+            stein_data = None
+        this_frame = SteinPacket(
+            packet_ccsds=tuple(packet_ccsds[i]), 
+            packet_header=tuple(packet_header[i]),  # should always be 0xAF for STEIN 
+            packet_timestamp=tuple(packet_timestamp[i]), 
+            stein_events=stein_events[i],
+            stein_data=stein_data,
+            packet_hkpg=tuple(packet_housekeeping[i]))
+        frames.append(this_frame)
+    return frames
+
+
+# parse STEIN frame of hex packet_bytes
+def parse_stein_frame(packet_bytes, includes_ccsds, event_list=True):
+    """Parse a packet of STEIN data, returning a SteinPacket record.
+
+    Arguments:
+    packet_bytes -- bytes comprising a STEIN data packet (any sequence or buffer
+                    of bytes, including numpy.uint8/memoryview frame views)
+    includes_ccsds -- Boolean argument, indicating presence of CCSDS header
+
+    Keyword arguments:
+    event_list -- Boolean argument; if True (default), also provide the
+                  packet's events as a 'stein_data' list of tuples
+                  (otherwise, built on first access)
+    """
+    packet_array = np.frombuffer(bytearray(packet_bytes), dtype=np.uint8)
+    return parse_stein_frames(packet_array.reshape(1, -1), includes_ccsds, event_list=event_list)[0]
+
+
+def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False, **kwargs):
+    # to be fleshed out, with export options for ASCII, CDF, python-pickle, etc.
+    # (further keyword arguments, e.g. the pass's 'year', are those of
+    #   timeops.reconstruct_packettimes(), for packets not already timed)
     header_lines = (
         "%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\r\n",
         "% CINEMA[1] STEIN Event List (example)\r\n",
         "%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%\r\n",
         "% Support Info:\r\n",
         "% SOURCE:\r\n",
-        "".join(source_info),
+        provenance.source_info(data_packet_dict),
         "% SOURCE DESCRIPTION:\r\n",
         "% -- VARIABLEs --\r\n",
         "% Generated {0}\r\n".format(datetime.datetime.now().replace(microsecond=0).isoformat()),
@@ -267,13 +458,20 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False)
             f.write("".join(header_lines))
             f.write("% {timestamp} EVCODE ADD DET_ID EVENT_DATA\n".format(
                 timestamp="YYYY-MM-DDTHH:MM:SS.mmmmmm"))
+            if any(packet['event_time'] is None for packet in data_packet_dict):
+                calc_nominal_eventtime(data_packet_dict, **kwargs)
             for i,packet in enumerate(data_packet_dict):
-                for j,event in enumerate(packet['stein_data']):
-                    if (packet['event_time'] is None):
+                stein_data = packet['stein_data']
+                if (stein_data is None):
+                    stein_data = stein_data_view(packet['stein_events'])
+                # (datetime.datetime, or None where invalid)
+                event_time = packet['event_time'].astype('datetime64[us]').tolist()
+                for j,event in enumerate(stein_data):
+                    if (event_time[j] is None):
                         print(i,j, "Invalid Timestamp")
                     else:
                         f.write("{timestamp}{evcode:2d}{add:3d}{det_id:3d}{data:4d}\n".format(
-                            timestamp=packet['event_time'][j].isoformat(),
+                            timestamp=event_time[j].isoformat(),
                             evcode=event[0],
                             add=event[1],
                             det_id=event[2],
@@ -287,14 +485,17 @@ def save_data_as(data_packet_dict, type="ASCII", filename=None, overwrite=False)
     # print ASCII 
     print("".join(header_lines))
     print("# frame / EVCODE / ADD / DET_ID / timestamp / DATA / [MM-DDTHH:mm:ss.fracsec]")
+    if any(packet['event_time'] is None for packet in data_packet_dict):
+        calc_nominal_eventtime(data_packet_dict, **kwargs)
     event_number = 0
     for i in range(len(data_packet_dict)):
+        event_time = data_packet_dict[i]['event_time'].astype('datetime64[us]').tolist()
         for j in range(len(data_packet_dict[i]['stein_data'])):
-            if (data_packet_dict[i]['event_time'] is None):
+            if (event_time[j] is None):
                 pass
             #print i,j,event_number, "Invalid Timestamp"
             else:
-                print i,j,event_number, (data_packet_dict[i]['event_time'][j]).isoformat(), \
+                print i,j,event_number, (event_time[j]).isoformat(), \
                         data_packet_dict[i]['stein_data'][j]
             event_number += 1 
     return 0
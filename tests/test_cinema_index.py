@@ -0,0 +1,39 @@
+# test_cinema_index.py - tests of derived packet UTC times (cinema_index)
+#
+#    usage (from the repository directory):
+#        python -m unittest discover -s tests
+#
+
+import calendar
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cinema_index_v0_1_0 as packet_index
+
+
+class DeriveUtcTest(unittest.TestCase):
+
+    def setUp(self):
+        # full timestamps either side of a year end, a MAGIC half timestamp
+        #   just after midnight, and packets without a (valid) timestamp
+        self.timestamps = [(12, 31, 23, 59, 50, 0), None, (23, 59, 55, 50),
+                (12, 31, 23, 59, 58, 0), (1, 1, 0, 0, 5, 25), (0, 0, 1, 0), (2, 30, 0, 0, 0, 0)]
+
+    def test_year(self):
+        utc = packet_index.derive_utc(self.timestamps, year=2013)
+        self.assertEqual(utc, [calendar.timegm((2013, 12, 31, 23, 59, 50)), None,
+                calendar.timegm((2013, 12, 31, 23, 59, 55)) + 0.5,
+                calendar.timegm((2013, 12, 31, 23, 59, 58)),
+                calendar.timegm((2014, 1, 1, 0, 0, 5)) + 0.25,
+                calendar.timegm((2014, 1, 1, 0, 0, 1)), None])
+
+    def test_default_year(self):
+        # (without a year, the first after launch)
+        utc = packet_index.derive_utc(self.timestamps)
+        self.assertEqual(utc[0], calendar.timegm((2012, 12, 31, 23, 59, 50)))
+
+
+if __name__ == '__main__':
+    unittest.main()
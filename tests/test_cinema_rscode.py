@@ -0,0 +1,70 @@
+# test_cinema_rscode.py - tests of the RS check of master frames (cinema_rscode)
+#
+#    usage (from the repository directory):
+#        python -m unittest discover -s tests
+#
+
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cinema_rscode_v0_1_0 as rscode
+import cinema_unpack_v0_8_1 as unpack
+
+
+def corrupt(frames, i, k, value=0x5a):
+    # flip symbol 'k' (of the interleaved codeblock) of frame 'i'
+    raw = frames[i:i+1].view(np.uint8)
+    raw[rscode.rs_codeblock_offset + k] ^= value
+
+
+class CheckFramesTest(unittest.TestCase):
+
+    def setUp(self):
+        # (an all-zero codeblock is a valid codeword, in either basis)
+        self.n_frames = 2*rscode.rs_chunk_frames + 3
+        self.frames = np.zeros(self.n_frames, dtype=unpack.master_frame_dtype)
+        # errors either side of each chunk boundary, and in the last frame
+        self.corrupted = [0, rscode.rs_chunk_frames - 1, rscode.rs_chunk_frames,
+                2*rscode.rs_chunk_frames, self.n_frames - 1]
+        for i in self.corrupted:
+            corrupt(self.frames, i, 3*rscode.rs_interleave + (i % rscode.rs_interleave))
+
+    def test_clean_frames_are_unchanged(self):
+        frames = np.zeros(self.n_frames, dtype=unpack.master_frame_dtype)
+        checked, status = rscode.check_frames(frames, correct=True)
+        self.assertIs(checked, frames)
+        self.assertTrue((status == rscode.rs_clean).all())
+
+    def test_errors_are_flagged_in_every_chunk(self):
+        checked, status = rscode.check_frames(self.frames)
+        self.assertIs(checked, self.frames)
+        self.assertEqual(np.flatnonzero(status == rscode.rs_errors).tolist(), self.corrupted)
+
+    def test_errors_are_corrected_in_every_chunk(self):
+        original = self.frames.copy()
+        checked, status = rscode.check_frames(self.frames, correct=True)
+        self.assertEqual(np.flatnonzero(status == rscode.rs_corrected).tolist(), self.corrupted)
+        self.assertFalse(checked.view(np.uint8).any())
+        # (the frames passed in are left as they were)
+        self.assertEqual(self.frames.tobytes(), original.tobytes())
+
+    def test_codewords_are_built_per_chunk(self):
+        lengths = []
+        frame_codewords = rscode.frame_codewords
+        def recording_frame_codewords(frames):
+            lengths.append(len(frames))
+            return frame_codewords(frames)
+        rscode.frame_codewords = recording_frame_codewords
+        try:
+            rscode.check_frames(self.frames, correct=True)
+        finally:
+            rscode.frame_codewords = frame_codewords
+        self.assertEqual(sum(lengths), self.n_frames)
+        self.assertTrue(max(lengths) <= rscode.rs_chunk_frames)
+
+
+if __name__ == '__main__':
+    unittest.main()
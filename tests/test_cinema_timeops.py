@@ -0,0 +1,107 @@
+# test_cinema_timeops.py - tests of packet time reconstruction (cinema_timeops)
+#
+#    usage (from the repository directory):
+#        python -m unittest discover -s tests
+#
+
+import datetime
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cinema_timeops_v0_1_0 as timeops
+
+
+def pass_timestamps(start, n, cadence=10):
+    # (MM,DD,HH,mm,ss,ff) timestamps of 'n' packets, 'cadence' seconds apart
+    times = [start + datetime.timedelta(seconds=cadence*i) for i in range(n)]
+    return [(t.month, t.day, t.hour, t.minute, t.second, 0) for t in times]
+
+
+def years(times):
+    return set(times.view('datetime64[ns]').astype('datetime64[Y]').astype(int) + 1970)
+
+
+class ReconstructYearTest(unittest.TestCase):
+
+    def setUp(self):
+        # a pass more than a year after launch
+        self.timestamps = pass_timestamps(datetime.datetime(2013, 10, 2, 12, 0, 0), 50)
+
+    def test_inferred_year_is_flagged(self):
+        times, quality = timeops.reconstruct_packettimes(self.timestamps)
+        # (the first year after launch: wrong, so no better than plausible)
+        self.assertEqual(years(times), set([2012]))
+        self.assertTrue((quality == 1).all())
+
+    def test_year(self):
+        times, quality = timeops.reconstruct_packettimes(self.timestamps, year=2013)
+        self.assertEqual(years(times), set([2013]))
+        self.assertTrue((quality == 0).all())
+
+    def test_reference(self):
+        times, quality = timeops.reconstruct_packettimes(self.timestamps,
+                reference=datetime.datetime(2013, 3, 1))
+        self.assertEqual(years(times), set([2013]))
+        self.assertTrue((quality == 0).all())
+
+    def test_year_rollover(self):
+        timestamps = pass_timestamps(datetime.datetime(2013, 12, 31, 23, 58, 0), 20)
+        times, quality = timeops.reconstruct_packettimes(timestamps, year=2013)
+        self.assertTrue((np.diff(times) == 10*10**9).all())
+        self.assertEqual(years(times), set([2013, 2014]))
+
+
+def magic_timestamps(start, n, cadence=4.875):
+    # (HH,mm,ss,ff) timestamps of 'n' MAGIC packets (and their centiseconds of the day)
+    times = [int(round(100*(start + cadence*i))) % 8640000 for i in range(n)]
+    return ([(t//360000, t//6000 % 60, t//100 % 60, t % 100) for t in times], times)
+
+
+def cyclic_error(timestamps, times):
+    # (the largest difference, in centiseconds, of (HH,mm,ss,ff) timestamps from 'times')
+    repaired_times = timeops.cyclic_packettimes(timestamps)[0]
+    return np.abs((repaired_times - times + 4320000) % 8640000 - 4320000).max()
+
+
+class RepairPackettimesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timestamps, self.times = magic_timestamps(43000., 400)
+
+    def shifted(self, runs, junk=0x5a):
+        # the timestamps, with runs (start, length) byte-shifted by one field
+        timestamps = list(self.timestamps)
+        shifted = np.zeros(len(timestamps), dtype=bool)
+        for start, length in runs:
+            for i in range(start, start + length):
+                timestamps[i] = (junk,) + timestamps[i][:3]
+                shifted[i] = True
+        return (np.array(timestamps), shifted)
+
+    def test_unshifted_timestamps_are_untouched(self):
+        repaired_timestamps, repaired = timeops.repair_packettimes(np.array(self.timestamps))
+        self.assertFalse(repaired.any())
+        self.assertEqual(repaired_timestamps.tolist(), [list(t) for t in self.timestamps])
+
+    def test_shifted_runs_are_repaired(self):
+        for length in (1, 2, 5, 20):
+            # (runs within the pass, and at either end of it)
+            runs = [(0, length), (100, length), (250, length), (400 - length, length)]
+            timestamps, shifted = self.shifted(runs)
+            repaired_timestamps, repaired = timeops.repair_packettimes(timestamps)
+            self.assertEqual(repaired.tolist(), shifted.tolist(), "runs of {0}".format(length))
+            # (to within the lost hundredths of a second)
+            self.assertTrue(cyclic_error(repaired_timestamps, self.times) <= 1, "runs of {0}".format(length))
+
+    def test_shifted_runs_of_varying_junk_are_repaired(self):
+        timestamps, shifted = self.shifted([(50, 5)], junk=0)
+        timestamps[[52, 53]] = timestamps[[52, 53]] + [[3, 0, 0, 0]]
+        repaired_timestamps, repaired = timeops.repair_packettimes(timestamps)
+        self.assertEqual(repaired.tolist(), shifted.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# test_cinema_unpack.py - tests of master frame streaming (cinema_unpack)
+#
+#    usage (from the repository directory):
+#        python -m unittest discover -s tests
+#
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cinema_unpack_v0_8_1 as unpack
+import magic_unpack_v0_8_0 as magic
+
+
+def write_aligned_pass(filename, n_frames):
+    # an aligned pass of (otherwise empty) master frames, each with its ASM
+    frames = np.zeros(n_frames, dtype=unpack.master_frame_dtype)
+    frames['asm'] = unpack.asm
+    with open(filename, 'wb') as f:
+        f.write(frames.tobytes())
+
+
+def write_synthetic_pass(filename, n_frames, seed=0):
+    # a (GZIP) pass of random frames, carrying MAGIC, STEIN and HSK packets in
+    #   the two packet slots, and overflow packets in the third
+    rng = np.random.RandomState(seed)
+    raw = rng.randint(0, 256, (n_frames, unpack.tm_frame_size)).astype(np.uint8)
+    raw[:,10:14] = np.frombuffer(np.array(unpack.asm, dtype='>u4').tobytes(), dtype=np.uint8)
+    counts = {}
+
+    def set_packets(rows, offset, apid, packet_header):
+        # (CCSDS header, with a continuous sequence count per APID, and packet header)
+        count = counts.get(apid, 0) + np.arange(len(rows))
+        counts[apid] = count[-1] + 1
+        raw[rows,offset:offset+4] = np.column_stack((np.repeat(apid >> 8, len(rows)),
+                np.repeat(apid & 0xff, len(rows)), 0xc0 | ((count >> 8) & 0x3f), count & 0xff))
+        if packet_header is not None:
+            raw[rows,offset+6] = packet_header
+
+    rows = np.arange(n_frames)
+    set_packets(rows[rows % 4 != 3], unpack.frame_key[3], unpack.apid241, 0xBE)
+    set_packets(rows[rows % 4 == 3], unpack.frame_key[3], unpack.apid240, 0xAF)
+    set_packets(rows[rows % 4 == 0], unpack.frame_key[4], unpack.apid240, 0xAF)
+    set_packets(rows[rows % 4 == 1], unpack.frame_key[4], unpack.apid364, None)
+    set_packets(rows[rows % 4 == 2], unpack.frame_key[4], unpack.apid264, None)
+    set_packets(rows, unpack.frame_key[5], unpack.apid265, None)
+    with gzip.open(filename, 'wb') as f:
+        f.write(raw.tobytes())
+
+
+def packet_values(packet):
+    # every field of a packet (ndarrays as (dtype, bytes); the provenance
+    #   record by its file and hash, not its extraction date)
+    if isinstance(packet, tuple):
+        return [bytes(bytearray(part)) for part in packet]
+    if packet is None:
+        return None
+    values = []
+    for field in type(packet)._fields():
+        value = packet[field]
+        if isinstance(value, (np.ndarray, np.void)):
+            value = (value.dtype.descr, np.shape(value), value.tobytes())
+        elif (field == 'provenance'):
+            value = (value.source_file, value.source_file_hash)
+        values.append((field, value))
+    return (type(packet).__name__, values)
+
+
+class IterFrameBlocksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "BGS.CINEMA.TLM_VC0.0001.bin")
+        self.n_frames = 3*unpack.block_frames + 5
+        write_aligned_pass(self.filename, self.n_frames)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_aligned_pass_is_yielded_in_bounded_blocks(self):
+        blocks = unpack.iter_frame_blocks(self.filename)
+        frame_ids, frames = next(blocks)
+        # the first block is bounded, whatever the length of the pass
+        self.assertEqual(len(frames), unpack.block_frames)
+        # ... and is a view of the mapped file, rather than a copy
+        self.assertFalse(frames.flags.owndata)
+        sizes = [len(frames)] + [len(block_frames) for block_ids, block_frames in blocks]
+        self.assertTrue(max(sizes) <= unpack.block_frames)
+        self.assertEqual(sum(sizes), self.n_frames)
+
+    def test_frame_ids_are_in_order(self):
+        frame_ids = np.concatenate([ids for ids, frames in unpack.iter_frame_blocks(self.filename)])
+        self.assertTrue((frame_ids == np.arange(self.n_frames)).all())
+
+
+
+class SyntheticPassTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "BGS.CINEMA.TLM_VC0.0002.gz")
+        # (several frame blocks: shards and blocks both split the pass)
+        write_synthetic_pass(self.filename, 3*unpack.block_frames + 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class DecodeShardedTest(SyntheticPassTest):
+
+    def test_sharded_decode_is_identical_to_serial(self):
+        serial_stats, sharded_stats = {}, {}
+        serial = unpack.read_raw_hexbytes(self.filename, verbose=False, stats=serial_stats)
+        sharded = unpack.read_raw_hexbytes(self.filename, verbose=False, stats=sharded_stats,
+                shards=4, processes=2)
+        self.assertEqual(serial_stats, sharded_stats)
+        self.assertEqual(map(len, serial), map(len, sharded))
+        self.assertTrue(len(serial[unpack.packet_categories.index('science')]) > 0)
+        for category, serial_list, sharded_list in zip(unpack.packet_categories, serial, sharded):
+            for i, (serial_packet, sharded_packet) in enumerate(zip(serial_list, sharded_list)):
+                self.assertEqual(packet_values(serial_packet), packet_values(sharded_packet),
+                        "{0} packet {1}".format(category, i))
+
+
+class MagicPacketNumberingTest(SyntheticPassTest):
+
+    def test_magic_packets_are_numbered_across_the_pass(self):
+        science = unpack.read_raw_hexbytes(self.filename, verbose=False)[
+                unpack.packet_categories.index('science')]
+        magic_packets = [packet for packet in science if isinstance(packet, magic.MagicPacket)]
+        self.assertTrue(len(magic_packets) > unpack.block_frames)
+        for i, packet in enumerate(magic_packets):
+            self.assertTrue((packet['magic_samples']['PACKET'] == i).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
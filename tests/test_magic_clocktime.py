@@ -0,0 +1,88 @@
+# test_magic_clocktime.py - tests of MAGIC sample time fitting (magic_clocktime)
+#
+#    usage (from the repository directory):
+#        python -m unittest discover -s tests
+#
+
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import magic_clocktime_v0_8_0 as clocktime
+import magic_unpack_v0_8_0 as magic
+
+
+def magic_stream(start, modes, skipped=(), jittered=(), bad=()):
+    # MAGIC packets in 'modes' (one per packet) from 'start' (seconds of the
+    #   day), over the packets 'skipped' (dropped), with the seconds field of
+    #   those 'jittered' off by one, and invalid timestamps for those 'bad'
+    packets = []
+    t = start
+    for i, mode in enumerate(modes):
+        t += clocktime.samples_per_packet*clocktime.mode_cycles[mode]/128.
+        if i in skipped:
+            continue
+        cs = int(round(100*(t + (1 if i in jittered else 0)))) % 8640000
+        timestamp = (cs//360000, cs//6000 % 60, cs//100 % 60, cs % 100)
+        if i in bad:
+            timestamp = (timestamp[0], 120) + timestamp[2:]
+        samples = np.zeros(clocktime.samples_per_packet, dtype=magic.magic_sample_dtype)
+        samples['MODE'] = mode
+        packets.append(magic.MagicPacket(magic_samples=samples, packet_timestamp=timestamp))
+    return packets
+
+
+class IncrementalClockFitTest(unittest.TestCase):
+
+    def setUp(self):
+        # (across midnight, with a MODE switch, dropped packets, RTC jitter,
+        #   and a bad timestamp)
+        modes = [3]*150 + [2]*150
+        self.packets = magic_stream(86400 - 120*2.4375, modes, skipped=(20, 21, 22, 200),
+                jittered=(40, 41, 180), bad=(60, 250))
+        self.devnull = open(os.devnull, 'w')
+        self.stdout, sys.stdout = sys.stdout, self.devnull
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.devnull.close()
+
+    def assertMatchesBatchFit(self, latency):
+        sample_times, quality_array = clocktime.fit_sampletimes(self.packets, 2012, 1, 3,
+                repair=False)
+        fit = clocktime.IncrementalClockFit(2012, 1, 3, latency=latency)
+        timed = fit.extend(self.packets) + fit.close()
+        final_times = np.empty_like(sample_times)
+        final_times[:] = np.datetime64('NaT')
+        for timed_packets in timed:
+            if timed_packets.final:
+                start = timed_packets.start*clocktime.samples_per_packet
+                final_times[start:start + len(timed_packets.sample_times)] = timed_packets.sample_times
+        self.assertEqual(fit.quality_array().tolist(), quality_array.tolist())
+        self.assertEqual(final_times.view(np.int64).tolist(), sample_times.view(np.int64).tolist())
+
+    def test_stream_events_are_classified(self):
+        sample_times, quality_array = clocktime.fit_sampletimes(self.packets, 2012, 1, 3,
+                repair=False)
+        # (dropped packets, and the bad timestamp: packets 20 and 57, of those kept)
+        self.assertEqual(quality_array[2*20], 3)
+        self.assertEqual(quality_array[2*57], 19)
+        # (a block boundary at the MODE switch)
+        self.assertEqual(quality_array[2*147 - 1], 9)
+        # (and the sample times, but of the bad timestamps, run on over midnight)
+        timed = ~np.isnat(sample_times)
+        self.assertEqual(np.flatnonzero(~timed[::clocktime.samples_per_packet]).tolist(), [57, 246])
+        self.assertTrue((np.diff(sample_times[timed].view(np.int64)) > 0).all())
+
+    def test_matches_batch_fit(self):
+        self.assertMatchesBatchFit(latency=None)
+
+    def test_matches_batch_fit_with_latency(self):
+        for latency in (1, 5):
+            self.assertMatchesBatchFit(latency)
+
+
+if __name__ == '__main__':
+    unittest.main()